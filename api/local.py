@@ -1,16 +1,69 @@
+import hashlib
+import io
 import os
 import re
 import sqlite3
+from concurrent.futures import Future
 from datetime import datetime
 
+try:
+    from PIL import Image
+except ImportError:  # Pillow 为可选依赖，缺失时缩略图请求直接返回原图
+    Image = None
+
+from core.database import SQLiteConnectionPool, SQLiteWriteQueue
 from utils.helpers import Utils
 
 
 class LocalMusicAPI:
     """用于管理本地SQLite元数据中心的API类"""
 
+    # 搜索结果需要的列 (JOIN FTS 表时使用带 s. 前缀的版本)
+    SEARCH_COLUMNS = "id, search_key, duration_ms, album, quality, artist, title, albumartist, discnumber, tracknumber, file_path, is_instrumental, file_size"
+    SEARCH_COLUMNS_PREFIXED = ", ".join(
+        f"s.{col.strip()}" for col in SEARCH_COLUMNS.split(",")
+    )
+    # 中日韩文字：unicode61 分词把连续的 CJK 字符当作一个词，无法按词中片段命中
+    CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff\uac00-\ud7af]")
+    # 建表之后新增的字段，旧数据库启动时通过 ALTER TABLE 自动补齐
+    SONG_MIGRATION_COLUMNS = {
+        "file_size": "INTEGER",
+        "mtime": "REAL",
+        "inode": "INTEGER",
+        "cover_hash": "TEXT",
+        "normalized_album": "TEXT",
+    }
+    # 专辑标题标准化时使用的中文数字映射 (多字符的在前，保证 "十一" 先于 "一" 被替换)
+    ALBUM_NUM_MAP = {
+        "十一": "11",
+        "十二": "12",
+        "十三": "13",
+        "十四": "14",
+        "十五": "15",
+        "十六": "16",
+        "十七": "17",
+        "十八": "18",
+        "十九": "19",
+        "十": "10",
+        "九": "9",
+        "八": "8",
+        "七": "7",
+        "六": "6",
+        "五": "5",
+        "四": "4",
+        "三": "3",
+        "二": "2",
+        "一": "1",
+    }
+    ALBUM_STRIP_RE = re.compile(r"[^a-z0-9\u4e00-\u9fa5]")
+    # 批量查询时单条 SQL 携带的参数上限 (低于 SQLite 旧版本的 999 限制)
+    BATCH_QUERY_CHUNK = 500
+
     def __init__(self, db_file):
         self.db_file = db_file
+        self.pool = SQLiteConnectionPool(db_file)
+        # 所有写操作经由单独的写线程批量提交
+        self.writer = SQLiteWriteQueue(self.pool)
         self.quality_order_down = {
             "master": ["master", "flac", "320", "128"],
             "flac": ["flac", "320", "128"],
@@ -22,64 +75,38 @@ class LocalMusicAPI:
         self._create_tables()
 
     def _get_connection(self):
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_file)
-        conn.execute("PRAGMA foreign_keys = ON;")  # 确保外键约束被激活
-        return conn
+        """获取当前线程复用的数据库连接 (由连接池管理，调用方不要 close)"""
+        return self.pool.get_connection()
 
     def _query_db(self, query, args=(), one=False):
         """通用的数据库查询函数"""
         try:
             con = self._get_connection()
-            con.row_factory = sqlite3.Row  # 【新】允许按列名访问
             cur = con.cursor()
             cur.execute(query, args)
             rv = cur.fetchall()
-            con.close()
             results = [dict(row) for row in rv] if rv else []
             return (results[0] if results else None) if one else results
         except Exception as e:
             print(f"本地音乐数据库查询出错: {e}")
             return None
 
-    def _normalize_album_title(self, title: str) -> str:
+    @classmethod
+    def _normalize_album_title(cls, title: str) -> str:
         """一个简单的专辑标题标准化函数，用于模糊匹配。"""
         if not title:
             return ""
 
         normalized_title = title.lower()
-        num_map = {
-            "十一": "11",
-            "十二": "12",
-            "十三": "13",
-            "十四": "14",
-            "十五": "15",
-            "十六": "16",
-            "十七": "17",
-            "十八": "18",
-            "十九": "19",
-            "十": "10",
-            "九": "9",
-            "八": "8",
-            "七": "7",
-            "六": "6",
-            "五": "5",
-            "四": "4",
-            "三": "3",
-            "二": "2",
-            "一": "1",
-        }
-        for cn_num, an_num in num_map.items():
+        for cn_num, an_num in cls.ALBUM_NUM_MAP.items():
             normalized_title = normalized_title.replace(cn_num, an_num)
 
-        normalized_title = re.sub(r"[^a-z0-9\u4e00-\u9fa5]", "", normalized_title)
-        return normalized_title
+        return cls.ALBUM_STRIP_RE.sub("", normalized_title)
 
     def _create_tables(self):
         """创建所有元数据表和字段"""
         conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute("PRAGMA foreign_keys = ON;")
 
         # songs 表 (主表)
         cursor.execute("""
@@ -107,17 +134,37 @@ class LocalMusicAPI:
                 date TEXT,
                 year TEXT,
                 title TEXT,
-                is_instrumental INTEGER DEFAULT 0
+                is_instrumental INTEGER DEFAULT 0,
+                file_size INTEGER,
+                mtime REAL,
+                inode INTEGER,
+                cover_hash TEXT,
+                normalized_album TEXT
             )
         """)
+        self._migrate_song_columns(cursor)
+        self._backfill_normalized_album(cursor)
 
-        # cover_art 表
+        # covers 表 (按内容哈希去重存储封面，songs.cover_hash 指向这里)
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cover_art (
-                song_id INTEGER PRIMARY KEY,
+            CREATE TABLE IF NOT EXISTS covers (
+                hash TEXT PRIMARY KEY,
                 mime_type TEXT NOT NULL,
                 image_data BLOB NOT NULL,
-                FOREIGN KEY (song_id) REFERENCES songs (id) ON DELETE CASCADE
+                byte_size INTEGER NOT NULL
+            )
+        """)
+        self._migrate_cover_art(cursor)
+
+        # cover_thumbnails 表 (按需生成的封面缩略图缓存，随原图一起回收)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cover_thumbnails (
+                hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mime_type TEXT NOT NULL,
+                image_data BLOB NOT NULL,
+                PRIMARY KEY (hash, size),
+                FOREIGN KEY (hash) REFERENCES covers (hash) ON DELETE CASCADE
             )
         """)
 
@@ -144,23 +191,175 @@ class LocalMusicAPI:
             )
         """)
 
+        # (search_key, normalized_album) 复合索引同时覆盖仅按 search_key 的查询
         cursor.execute(
-            "CREATE INDEX IF NOT EXISTS idx_search_key ON songs (search_key)"
+            "CREATE INDEX IF NOT EXISTS idx_search_key_album ON songs (search_key, normalized_album)"
         )
+        cursor.execute("DROP INDEX IF EXISTS idx_search_key")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cover_hash ON songs (cover_hash)"
+        )
+        # 最后一首引用某张封面的歌曲被删除 (或换封面) 时，回收这张封面
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS covers_gc_ad AFTER DELETE ON songs
+            WHEN old.cover_hash IS NOT NULL BEGIN
+                DELETE FROM covers WHERE hash = old.cover_hash
+                AND NOT EXISTS (SELECT 1 FROM songs WHERE cover_hash = old.cover_hash);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS covers_gc_au AFTER UPDATE OF cover_hash ON songs
+            WHEN old.cover_hash IS NOT NULL AND old.cover_hash IS NOT new.cover_hash BEGIN
+                DELETE FROM covers WHERE hash = old.cover_hash
+                AND NOT EXISTS (SELECT 1 FROM songs WHERE cover_hash = old.cover_hash);
+            END
+        """)
+        self.fts_enabled = self._create_fts_index(cursor)
         conn.commit()
-        conn.close()
+
+    def _migrate_song_columns(self, cursor):
+        """为旧版数据库补齐 songs 表中后续新增的字段。"""
+        cursor.execute("PRAGMA table_info(songs)")
+        existing_columns = {row[1] for row in cursor.fetchall()}
+        for column, column_type in self.SONG_MIGRATION_COLUMNS.items():
+            if column not in existing_columns:
+                print(f"正在迁移数据库: 为 songs 表新增字段 '{column}'...")
+                cursor.execute(f"ALTER TABLE songs ADD COLUMN {column} {column_type}")
+
+    def _backfill_normalized_album(self, cursor):
+        """为尚未计算 normalized_album 的旧数据补齐标准化后的专辑名。"""
+        cursor.execute("SELECT id, album FROM songs WHERE normalized_album IS NULL")
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        print(f"正在迁移数据库: 为 {len(rows)} 首歌曲计算标准化专辑名...")
+        cursor.executemany(
+            "UPDATE songs SET normalized_album = ? WHERE id = ?",
+            [(self._normalize_album_title(album), song_id) for song_id, album in rows],
+        )
+
+    def _migrate_cover_art(self, cursor):
+        """将旧版 cover_art 表 (每首歌一份封面) 迁移到按内容哈希去重的 covers 表。"""
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cover_art'"
+        )
+        if cursor.fetchone() is None:
+            return
+
+        print("正在迁移数据库: 按内容哈希对封面去重 (cover_art -> covers)...")
+        read_cursor = cursor.connection.cursor()
+        read_cursor.execute("SELECT song_id, mime_type, image_data FROM cover_art")
+        migrated, unique_before = 0, self._count_covers(cursor)
+        while True:
+            rows = read_cursor.fetchmany(200)
+            if not rows:
+                break
+            for song_id, mime_type, image_data in rows:
+                cover_hash = self.store_cover(cursor, image_data, mime_type)
+                cursor.execute(
+                    "UPDATE songs SET cover_hash = ? WHERE id = ?",
+                    (cover_hash, song_id),
+                )
+                migrated += 1
+        cursor.execute("DROP TABLE cover_art")
+        unique_after = self._count_covers(cursor) - unique_before
+        print(
+            f"封面迁移完成: {migrated} 条封面记录合并为 {unique_after} 张唯一封面。"
+            "可执行 VACUUM 回收数据库文件中的空闲空间。"
+        )
+
+    @staticmethod
+    def _count_covers(cursor) -> int:
+        cursor.execute("SELECT COUNT(*) FROM covers")
+        return cursor.fetchone()[0]
+
+    @staticmethod
+    def hash_cover(cover_data: bytes) -> str:
+        """封面内容哈希 (sha256)，同一张图片无论属于哪首歌都得到相同的键。"""
+        return hashlib.sha256(cover_data).hexdigest()
+
+    @staticmethod
+    def store_cover(cursor, cover_data: bytes, cover_mime: str) -> str | None:
+        """
+        将封面写入共享的 covers 表 (已存在则跳过)，返回其哈希。
+        需要在调用方的事务中执行，由调用方负责提交。
+        """
+        if not cover_data:
+            return None
+        cover_hash = LocalMusicAPI.hash_cover(cover_data)
+        cursor.execute(
+            "INSERT OR IGNORE INTO covers (hash, mime_type, image_data, byte_size) VALUES (?, ?, ?, ?)",
+            (cover_hash, cover_mime or "image/jpeg", cover_data, len(cover_data)),
+        )
+        return cover_hash
+
+    @staticmethod
+    def stat_file(file_path: str) -> dict:
+        """读取文件的大小、修改时间和 inode，用于写入 songs 表。"""
+        try:
+            st = os.stat(file_path)
+            return {"file_size": st.st_size, "mtime": st.st_mtime, "inode": st.st_ino}
+        except OSError as e:
+            print(f"无法读取文件信息 {file_path}: {e}")
+            return {"file_size": None, "mtime": None, "inode": None}
+
+    def _create_fts_index(self, cursor) -> bool:
+        """创建 songs 的 FTS5 全文索引及同步触发器，返回全文索引是否可用。"""
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'songs_fts'"
+        )
+        already_exists = cursor.fetchone() is not None
+
+        try:
+            # 外部内容表：索引本身不存储文本，由触发器与 songs 表保持同步
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+                    artist, albumartist, album, title, search_key,
+                    content='songs',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='1 2 3'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"警告: 当前 SQLite 不支持 FTS5 ({e})，本地搜索将回退到 LIKE 扫描。")
+            return False
+
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS songs_fts_ai AFTER INSERT ON songs BEGIN
+                INSERT INTO songs_fts (rowid, artist, albumartist, album, title, search_key)
+                VALUES (new.id, new.artist, new.albumartist, new.album, new.title, new.search_key);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS songs_fts_ad AFTER DELETE ON songs BEGIN
+                INSERT INTO songs_fts (songs_fts, rowid, artist, albumartist, album, title, search_key)
+                VALUES ('delete', old.id, old.artist, old.albumartist, old.album, old.title, old.search_key);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS songs_fts_au
+            AFTER UPDATE OF artist, albumartist, album, title, search_key ON songs BEGIN
+                INSERT INTO songs_fts (songs_fts, rowid, artist, albumartist, album, title, search_key)
+                VALUES ('delete', old.id, old.artist, old.albumartist, old.album, old.title, old.search_key);
+                INSERT INTO songs_fts (rowid, artist, albumartist, album, title, search_key)
+                VALUES (new.id, new.artist, new.albumartist, new.album, new.title, new.search_key);
+            END
+        """)
+
+        if not already_exists:
+            print("正在为现有歌曲构建全文索引 (仅首次)...")
+            cursor.execute("INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')")
+        return True
 
     # --- 歌单映射相关方法 ---
     def add_playlist_mapping(self, platform, online_id, navidrome_id, name):
         """添加一个新的歌单映射关系"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute(
+            self.writer.execute(
                 "INSERT INTO playlist_mappings (platform, online_playlist_id, navidrome_playlist_id, playlist_name) VALUES (?, ?, ?, ?)",
                 (platform, online_id, navidrome_id, name),
-            )
-            conn.commit()
+            ).result()
             print(
                 f"✓ 成功将 {platform} 歌单 '{name}' (ID: {online_id}) 映射到 Navidrome 歌单 (ID: {navidrome_id})"
             )
@@ -168,8 +367,6 @@ class LocalMusicAPI:
             print(f"警告: {platform} 歌单 {online_id} 的映射关系已存在。")
         except Exception as e:
             print(f"✗ 添加歌单映射时出错: {e}")
-        finally:
-            conn.close()
 
     def get_mapping_for_online_playlist(self, platform, online_id):
         """根据在线平台ID查找是否存在映射"""
@@ -180,23 +377,62 @@ class LocalMusicAPI:
             (platform, online_id),
         )
         result = cursor.fetchone()
-        conn.close()
         return result[0] if result else None
 
     def update_sync_time(self, navidrome_id):
         """更新指定歌单的最后同步时间"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
+        self.writer.execute(
             "UPDATE playlist_mappings SET last_sync_time = ? WHERE navidrome_playlist_id = ?",
             (datetime.now(), navidrome_id),
-        )
-        conn.commit()
-        conn.close()
+        ).result()
 
     # --- 歌曲相关方法 ---
-    def add_song_to_db(
+    def _song_row(
+        self,
+        song_info: dict,
+        file_path: str,
+        quality: str,
+        file_stat: dict,
+        cover_hash: str,
+    ) -> dict:
+        """将歌曲元数据整理为 songs 表的 {列名: 值}，供插入和原地更新共用。"""
+        return {
+            "file_path": file_path,
+            "search_key": song_info.get("search_key"),
+            "quality": quality,
+            "duration_ms": song_info.get("duration_ms"),
+            "album": song_info.get("album"),
+            "artist": song_info.get("artist"),
+            "albumartist": song_info.get("albumartist"),
+            "composer": song_info.get("composer"),
+            "lyricist": song_info.get("lyricist"),
+            "arranger": song_info.get("arranger"),
+            "producer": song_info.get("producer"),
+            "mix": song_info.get("mix"),
+            "mastering": song_info.get("mastering"),
+            "bpm": song_info.get("bpm"),
+            "genre": song_info.get("genre"),
+            "tracknumber": song_info.get("tracknumber"),
+            "totaltracks": song_info.get("totaltracks"),
+            "discnumber": song_info.get("discnumber"),
+            "totaldiscs": song_info.get("totaldiscs"),
+            "date": song_info.get("date"),
+            "year": song_info.get("year"),
+            # 从字典取 title (如果是在线下载的，可能没有传，由 scanner 后续补充)
+            "title": song_info.get("title"),
+            "is_instrumental": song_info.get(
+                "is_instrumental", 0
+            ),  # 默认为 0，代表原曲
+            "file_size": file_stat["file_size"],
+            "mtime": file_stat["mtime"],
+            "inode": file_stat["inode"],
+            "cover_hash": cover_hash,
+            "normalized_album": self._normalize_album_title(song_info.get("album")),
+        }
+
+    def _insert_song(
         self,
+        cursor,
         song_info: dict,
         file_path: str,
         quality: str,
@@ -204,124 +440,244 @@ class LocalMusicAPI:
         tlyric: str,
         cover_data: bytes,
         cover_mime: str,
-    ):
-        """向所有3个表中写入完整的歌曲元数据 (包含伴奏字段)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        try:
-            # 插入主表 (songs)
+        file_stat: dict,
+    ) -> bool:
+        """写线程中执行的入库操作，返回是否新增了记录 (文件已存在时返回 False)。"""
+        cover_hash = self.hash_cover(cover_data) if cover_data else None
+        row = self._song_row(song_info, file_path, quality, file_stat, cover_hash)
+
+        # 插入主表 (songs)
+        cursor.execute(
+            f"INSERT OR IGNORE INTO songs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+            tuple(row.values()),
+        )
+        # 复用连接时 lastrowid 会保留上一次插入的值，必须用 rowcount 判断 IGNORE
+        if cursor.rowcount == 0:  # 如果 (IGNORE) 触发，说明文件已存在
+            return False
+        song_id = cursor.lastrowid
+
+        # 封面按内容哈希存入共享表 (同专辑/多音质/伴奏只存一份)
+        self.store_cover(cursor, cover_data, cover_mime)
+
+        # 插入歌词表 (lyrics)
+        if lyric or tlyric:
+            cursor.execute(
+                "INSERT OR IGNORE INTO lyrics (song_id, lyrics, tlyrics) VALUES (?, ?, ?)",
+                (song_id, lyric, tlyric),
+            )
+        return True
+
+    def _update_song(
+        self,
+        cursor,
+        song_id: int,
+        song_info: dict,
+        file_path: str,
+        quality: str,
+        lyric: str,
+        tlyric: str,
+        cover_data: bytes,
+        cover_mime: str,
+        file_stat: dict,
+    ) -> bool:
+        """写线程中执行的原地重建索引 (文件内容变化)，保留歌曲 ID，返回记录是否仍存在。"""
+        cover_hash = self.store_cover(cursor, cover_data, cover_mime)
+        row = self._song_row(song_info, file_path, quality, file_stat, cover_hash)
+        cursor.execute(
+            f"UPDATE songs SET {', '.join(f'{col} = ?' for col in row)} WHERE id = ?",
+            (*row.values(), song_id),
+        )
+        if cursor.rowcount == 0:
+            return False
+
+        # 文件里没有的歌词/翻译保留原值 (例如在线下载时写入的翻译歌词)
+        if lyric or tlyric:
             cursor.execute(
                 """
-                INSERT OR IGNORE INTO songs (
-                    file_path, search_key, quality, duration_ms, album, artist,
-                    albumartist, composer, lyricist, arranger, producer, mix, mastering,
-                    bpm, genre, tracknumber, totaltracks, discnumber, totaldiscs, date, year,
-                    title, is_instrumental
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO lyrics (song_id, lyrics, tlyrics) VALUES (?, ?, ?)
+                ON CONFLICT(song_id) DO UPDATE SET
+                    lyrics = COALESCE(excluded.lyrics, lyrics),
+                    tlyrics = COALESCE(excluded.tlyrics, tlyrics)
                 """,
-                (
-                    file_path,
-                    song_info.get("search_key"),
-                    quality,
-                    song_info.get("duration_ms"),
-                    song_info.get("album"),
-                    song_info.get("artist"),
-                    song_info.get("albumartist"),
-                    song_info.get("composer"),
-                    song_info.get("lyricist"),
-                    song_info.get("arranger"),
-                    song_info.get("producer"),
-                    song_info.get("mix"),
-                    song_info.get("mastering"),
-                    song_info.get("bpm"),
-                    song_info.get("genre"),
-                    song_info.get("tracknumber"),
-                    song_info.get("totaltracks"),
-                    song_info.get("discnumber"),
-                    song_info.get("totaldiscs"),
-                    song_info.get("date"),
-                    song_info.get("year"),
-                    song_info.get(
-                        "title"
-                    ),  # 从字典取 title (如果是在线下载的，可能没有传，由 scanner 后续补充)
-                    song_info.get("is_instrumental", 0),  # 默认为 0，代表原曲
-                ),
+                (song_id, lyric, tlyric),
             )
-            song_id = cursor.lastrowid
-            if song_id == 0:  # 如果 (IGNORE) 触发，说明文件已存在
-                print(f"后台任务: '{song_info.get('search_key')}' 的记录已存在，跳过。")
-                return True
+        return True
 
-            # 插入封面表 (cover_art)
-            if cover_data:
-                cursor.execute(
-                    "INSERT OR IGNORE INTO cover_art (song_id, mime_type, image_data) VALUES (?, ?, ?)",
-                    (song_id, cover_mime, cover_data),
-                )
+    def submit_song(
+        self,
+        song_info: dict,
+        file_path: str,
+        quality: str,
+        lyric: str,
+        tlyric: str,
+        cover_data: bytes,
+        cover_mime: str,
+        file_stat: dict = None,
+    ) -> Future:
+        """
+        将歌曲入库操作提交到写队列，立即返回 Future (结果同 _insert_song)。
+        适合扫描器等批量写入场景：连续提交，最后统一等待结果。
+        """
+        # 在入库时记录文件大小等信息，搜索时无需再逐个 stat 文件
+        if file_stat is None:
+            file_stat = self.stat_file(file_path)
+        return self.writer.submit(
+            self._insert_song,
+            song_info,
+            file_path,
+            quality,
+            lyric,
+            tlyric,
+            cover_data,
+            cover_mime,
+            file_stat,
+        )
 
-            # 插入歌词表 (lyrics)
-            if lyric or tlyric:
-                cursor.execute(
-                    "INSERT OR IGNORE INTO lyrics (song_id, lyrics, tlyrics) VALUES (?, ?, ?)",
-                    (song_id, lyric, tlyric),
-                )
+    def submit_song_update(
+        self,
+        song_id: int,
+        song_info: dict,
+        file_path: str,
+        quality: str,
+        lyric: str,
+        tlyric: str,
+        cover_data: bytes,
+        cover_mime: str,
+        file_stat: dict = None,
+    ) -> Future:
+        """将已有歌曲的原地重建索引提交到写队列，立即返回 Future。"""
+        if file_stat is None:
+            file_stat = self.stat_file(file_path)
+        return self.writer.submit(
+            self._update_song,
+            song_id,
+            song_info,
+            file_path,
+            quality,
+            lyric,
+            tlyric,
+            cover_data,
+            cover_mime,
+            file_stat,
+        )
 
-            conn.commit()
-            print(
-                f"后台任务: 已成功将 '{song_info.get('search_key')}' ({quality}) 完整写入数据库。"
-            )
-            return True
+    def submit_song_deletion(self, song_ids: list) -> Future:
+        """批量删除歌曲记录 (歌词、无人引用的封面随之清理)，Future 的结果为删除的行数。"""
+        return self.writer.submit(
+            lambda cursor: cursor.executemany(
+                "DELETE FROM songs WHERE id = ?", [(song_id,) for song_id in song_ids]
+            ).rowcount
+        )
+
+    def add_song_to_db(
+        self,
+        song_info: dict,
+        file_path: str,
+        quality: str,
+        lyric: str,
+        tlyric: str,
+        cover_data: bytes,
+        cover_mime: str,
+    ):
+        """向所有3个表中写入完整的歌曲元数据 (包含伴奏字段)，等待写线程提交后返回。"""
+        try:
+            inserted = self.submit_song(
+                song_info, file_path, quality, lyric, tlyric, cover_data, cover_mime
+            ).result()
         except Exception as e:
             print(f"后台任务: 写入数据库时发生严重错误: {e}")
-            conn.rollback()
             return False
-        finally:
-            conn.close()
+        if inserted:
+            print(
+                f"后台任务: 已成功将 '{song_info.get('search_key')}' ({quality}) 完整写入数据库。"
+            )
+        else:
+            print(f"后台任务: '{song_info.get('search_key')}' 的记录已存在，跳过。")
+        return True
 
     def get_existing_qualities(self, search_key: str, album: str = None) -> list:
         """获取本地库中某首歌曲已存在的所有音质版本 (支持模糊专辑匹配)。"""
         if not album:
             results = self._query_db(
-                "SELECT quality FROM songs WHERE search_key = ?", (search_key,)
+                "SELECT DISTINCT quality FROM songs WHERE search_key = ?", (search_key,)
             )
-            return (
-                [row.get("quality") for row in results if row.get("quality")]
-                if results
-                else []
+        else:
+            results = self._query_db(
+                "SELECT DISTINCT quality FROM songs WHERE search_key = ? AND normalized_album = ?",
+                (search_key, self._normalize_album_title(album)),
             )
-
-        all_versions = self._query_db(
-            "SELECT quality, album FROM songs WHERE search_key = ?", (search_key,)
+        return (
+            [row.get("quality") for row in results if row.get("quality")]
+            if results
+            else []
         )
-        if not all_versions:
-            return []
-
-        normalized_input_album = self._normalize_album_title(album)
-        matching_qualities = []
-
-        for row in all_versions:
-            db_quality = row.get("quality")
-            db_album = row.get("album")
-
-            normalized_db_album = self._normalize_album_title(db_album)
-            if normalized_input_album == normalized_db_album:
-                matching_qualities.append(db_quality)
 
-        return list(set(matching_qualities))
-
-    def search_local_music(
-        self, query: str, mode: str = "any", limit: int = 20, offset: int = 0
-    ) -> dict | None:
+    def get_existing_qualities_batch(self, pairs: list) -> dict:
         """
-        在本地音乐库中执行高级搜索，并返回文件大小和伴奏标记。
-        """
-        search_term = f"%{query}%"
+        批量版 get_existing_qualities，用于歌单/专辑下载前一次性查出所有曲目的本地音质。
 
-        # --- 查询中加入 is_instrumental ---
-        select_clause = "SELECT id, search_key, duration_ms, album, quality, artist, title, albumartist, discnumber, tracknumber, file_path, is_instrumental"
-        from_clause = "FROM songs"
+        pairs 为 (search_key, album) 元组列表 (album 可为 None)，
+        返回 {(search_key, album): [quality, ...]}，本地没有的曲目对应空列表。
+        """
+        result = {pair: [] for pair in pairs}
+        search_keys = list({search_key for search_key, _ in pairs if search_key})
+        if not search_keys:
+            return result
+
+        # search_key -> {normalized_album: {quality, ...}}
+        found = {}
+        for start in range(0, len(search_keys), self.BATCH_QUERY_CHUNK):
+            chunk = search_keys[start : start + self.BATCH_QUERY_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self._query_db(
+                f"SELECT DISTINCT search_key, normalized_album, quality FROM songs WHERE search_key IN ({placeholders})",
+                chunk,
+            )
+            for row in rows or []:
+                if row.get("quality"):
+                    found.setdefault(row["search_key"], {}).setdefault(
+                        row.get("normalized_album") or "", set()
+                    ).add(row["quality"])
+
+        for search_key, album in pairs:
+            versions = found.get(search_key)
+            if not versions:
+                continue
+            if not album:
+                qualities = set().union(*versions.values())
+            else:
+                qualities = versions.get(self._normalize_album_title(album), set())
+            result[(search_key, album)] = list(qualities)
+        return result
+
+    @staticmethod
+    def _split_keywords(query: str) -> list:
+        """按空格切分关键词，双引号包裹的部分视为一个整体。"""
+        matches = re.findall(r'"([^"]*)"|(\S+)', query)
+        keywords = [m[0] if m[0] else m[1] for m in matches]
+        return [k for k in keywords if k.strip()]
+
+    @staticmethod
+    def _fts_prefix_phrase(text: str) -> str:
+        """将用户输入转义为 FTS5 的前缀短语，例如 周杰 -> "周杰"*"""
+        return '"' + text.replace('"', '""') + '"*'
+
+    def _build_fts_match(self, query: str, mode: str) -> str | None:
+        """根据搜索模式构造 FTS5 MATCH 表达式。"""
+        if mode == "artist":
+            return f"{{artist albumartist}} : {self._fts_prefix_phrase(query)}"
+        if mode == "album":
+            return f"album : {self._fts_prefix_phrase(query)}"
+        if mode == "title":
+            return f"title : {self._fts_prefix_phrase(query)}"
+        keywords = self._split_keywords(query)
+        if not keywords:
+            return None
+        return " AND ".join(self._fts_prefix_phrase(kw) for kw in keywords)
 
-        where_clause = ""
+    def _build_like_where(self, query: str, mode: str):
+        """构造 LIKE 子串匹配的 WHERE 子句 (FTS5 不可用或未命中时使用)。"""
+        search_term = f"%{query}%"
         args = []
 
         if mode == "artist":
@@ -333,11 +689,8 @@ class LocalMusicAPI:
         elif mode == "title":
             where_clause = "WHERE title LIKE ?"
             args.append(search_term)
-        elif mode == "any":
-            pattern = r'"([^"]*)"|(\S+)'
-            matches = re.findall(pattern, query)
-            keywords = [m[0] if m[0] else m[1] for m in matches]
-            keywords = [k for k in keywords if k.strip()]
+        else:
+            keywords = self._split_keywords(query)
 
             if not keywords:
                 where_clause = "WHERE 0"
@@ -359,12 +712,105 @@ class LocalMusicAPI:
                     args.extend([kw_term] * len(fields_to_search))
 
                 where_clause = f"WHERE {' AND '.join(and_blocks)}"
+
+        return where_clause, args
+
+    def _search_with_fts(self, query: str, mode: str, limit: int, offset: int):
+        """使用 FTS5 索引搜索，按 bm25 相关度排序。返回 (总数, 行列表)。"""
+        match_expr = self._build_fts_match(query, mode)
+        if not match_expr:
+            return 0, []
+
+        count_result = self._query_db(
+            "SELECT COUNT(*) AS total FROM songs_fts WHERE songs_fts MATCH ?",
+            (match_expr,),
+            one=True,
+        )
+        total_count = count_result["total"] if count_result else 0
+        if not total_count:
+            return 0, []
+
+        # 专辑模式需按曲序完整列出；其他模式按相关度排序 (标题/歌手权重最高)
+        if mode == "album":
+            order_clause = "ORDER BY s.artist, s.album, s.discnumber, s.tracknumber"
         else:
-            return {"songs": [], "total_count": 0}
+            order_clause = (
+                "ORDER BY bm25(songs_fts, 8.0, 4.0, 2.0, 8.0, 1.0), "
+                "s.artist, s.album, s.discnumber, s.tracknumber"
+            )
+
+        args = [match_expr]
+        limit_clause = ""
+        if mode != "album":
+            limit_clause = "LIMIT ? OFFSET ?"
+            args.extend([limit, offset])
+
+        data_query = f"""
+            SELECT {self.SEARCH_COLUMNS_PREFIXED}
+            FROM songs_fts JOIN songs s ON s.id = songs_fts.rowid
+            WHERE songs_fts MATCH ?
+            {order_clause} {limit_clause}
+        """
+        return total_count, self._query_db(data_query, args) or []
 
-        count_query = f"SELECT COUNT(id) {from_clause} {where_clause}"
+    def _search_fts_and_like(self, query: str, mode: str, limit: int, offset: int):
+        """
+        FTS5 与 LIKE 子串匹配的并集 (查询含中日韩文字时使用)。返回 (总数, 行列表)。
+
+        FTS 命中的歌曲按 bm25 排在前面，其余只被 LIKE 命中的歌曲排在后面；
+        需要全表扫描，但不会因为 FTS 命中了一部分而漏掉词中间的片段 (如 "我爱你" 中的 "爱")。
+        """
+        match_expr = self._build_fts_match(query, mode)
+        if not match_expr:
+            return 0, []
+        where_clause, like_args = self._build_like_where(query, mode)
+        fts_join = """
+            LEFT JOIN (
+                SELECT rowid AS fts_rowid,
+                       bm25(songs_fts, 8.0, 4.0, 2.0, 8.0, 1.0) AS fts_rank
+                FROM songs_fts WHERE songs_fts MATCH ?
+            ) ON fts_rowid = songs.id
+        """
+        where_clause = (
+            f"WHERE ({where_clause.removeprefix('WHERE ')}) OR fts_rowid IS NOT NULL"
+        )
+        args = [match_expr, *like_args]
+
+        count_result = self._query_db(
+            f"SELECT COUNT(*) AS total FROM songs {fts_join} {where_clause}",
+            args,
+            one=True,
+        )
+        total_count = count_result["total"] if count_result else 0
+        if not total_count:
+            return 0, []
+
+        if mode == "album":
+            order_clause = "ORDER BY artist, album, discnumber, tracknumber"
+            limit_clause = ""
+        else:
+            order_clause = (
+                "ORDER BY fts_rank IS NULL, fts_rank, "
+                "artist, album, discnumber, tracknumber"
+            )
+            limit_clause = "LIMIT ? OFFSET ?"
+            args.extend([limit, offset])
+
+        data_query = f"""
+            SELECT {self.SEARCH_COLUMNS} FROM songs {fts_join}
+            {where_clause} {order_clause} {limit_clause}
+        """
+        return total_count, self._query_db(data_query, args) or []
+
+    def _search_with_like(self, query: str, mode: str, limit: int, offset: int):
+        """使用 LIKE 全表扫描搜索。返回 (总数, 行列表)。"""
+        where_clause, args = self._build_like_where(query, mode)
+
+        count_query = f"SELECT COUNT(id) AS total FROM songs {where_clause}"
         count_result = self._query_db(count_query, args, one=True)
-        total_count = count_result["COUNT(id)"] if count_result else 0
+        total_count = count_result["total"] if count_result else 0
+        if not total_count:
+            return 0, []
 
         order_clause = "ORDER BY artist, album, discnumber, tracknumber"
         limit_clause = ""
@@ -373,22 +819,48 @@ class LocalMusicAPI:
             limit_clause = "LIMIT ? OFFSET ?"
             args.extend([limit, offset])
 
-        full_data_query = f"{select_clause} {from_clause} {where_clause} {order_clause} {limit_clause}"
-        results = self._query_db(full_data_query, args, one=False)
+        full_data_query = f"SELECT {self.SEARCH_COLUMNS} FROM songs {where_clause} {order_clause} {limit_clause}"
+        return total_count, self._query_db(full_data_query, args) or []
+
+    def search_local_music(
+        self, query: str, mode: str = "any", limit: int = 20, offset: int = 0
+    ) -> dict | None:
+        """
+        在本地音乐库中执行高级搜索，并返回文件大小和伴奏标记。
+        优先走 FTS5 前缀索引；索引不可用或未命中时回退到 LIKE 子串匹配。
+        查询含中日韩文字时，unicode61 分词无法命中词中间的片段 (且 1~2 字的查询
+        trigram 分词也无法匹配)，此时返回 FTS 与 LIKE 结果的并集。
+        """
+        if mode not in ("any", "artist", "album", "title"):
+            return {"songs": [], "total_count": 0}
+
+        if not self.fts_enabled:
+            total_count, results = self._search_with_like(query, mode, limit, offset)
+        elif self.CJK_PATTERN.search(query):
+            total_count, results = self._search_fts_and_like(query, mode, limit, offset)
+        else:
+            total_count, results = self._search_with_fts(query, mode, limit, offset)
+            if not total_count:
+                total_count, results = self._search_with_like(
+                    query, mode, limit, offset
+                )
 
         if not results:
             return {"songs": [], "total_count": 0}
 
         songs = []
         for result_dict in results:
-            file_size_bytes = 0
+            file_size_bytes = result_dict.get("file_size")
             file_path = result_dict.get("file_path")
 
-            if file_path and os.path.exists(file_path):
-                try:
-                    file_size_bytes = os.path.getsize(file_path)
-                except OSError as e:
-                    print(f"无法获取文件大小 {file_path}: {e}")
+            # 旧数据在重新扫描回填之前没有 file_size，仅对这些行回退到 stat
+            if file_size_bytes is None:
+                file_size_bytes = 0
+                if file_path and os.path.exists(file_path):
+                    try:
+                        file_size_bytes = os.path.getsize(file_path)
+                    except OSError as e:
+                        print(f"无法获取文件大小 {file_path}: {e}")
 
             # --- 格式化并添加到响应中，包含 is_instrumental ---
             songs.append(
@@ -406,6 +878,62 @@ class LocalMusicAPI:
 
         return {"songs": songs, "total_count": total_count}
 
+    def list_songs(
+        self,
+        after_id: int = None,
+        limit: int = None,
+        query: str = None,
+        quality: str = None,
+        is_instrumental: int = None,
+        with_instrumental_status: bool = False,
+    ) -> list:
+        """
+        按 id 倒序分页列出曲库 (keyset 分页：返回 id < after_id 的下一页)。
+        支持按关键词 (search_key / 专辑)、音质和是否伴奏在服务端过滤。
+        with_instrumental_status 为真时，为每首歌附带 has_instrumental 标记。
+        """
+        columns = (
+            "id, search_key, album, quality, file_path, file_size, is_instrumental"
+        )
+        if with_instrumental_status:
+            columns += (
+                ", EXISTS (SELECT 1 FROM songs i WHERE i.search_key = songs.search_key"
+                " AND i.is_instrumental = 1) AS has_instrumental"
+            )
+
+        conditions, args = [], []
+        if after_id is not None:
+            conditions.append("id < ?")
+            args.append(after_id)
+        if query:
+            conditions.append("(search_key LIKE ? OR album LIKE ?)")
+            args.extend([f"%{query}%", f"%{query}%"])
+        if quality:
+            conditions.append("quality = ?")
+            args.append(quality)
+        if is_instrumental is not None:
+            conditions.append("is_instrumental = ?")
+            args.append(1 if is_instrumental else 0)
+
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        limit_clause = ""
+        if limit is not None:
+            limit_clause = "LIMIT ?"
+            args.append(limit)
+
+        rows = self._query_db(
+            f"SELECT {columns} FROM songs {where_clause} ORDER BY id DESC {limit_clause}",
+            args,
+        )
+        songs = []
+        for row in rows or []:
+            row["size"] = Utils.format_size(row.pop("file_size"))
+            row["is_instrumental"] = bool(row.get("is_instrumental"))
+            if with_instrumental_status:
+                row["has_instrumental"] = bool(row.get("has_instrumental"))
+            songs.append(row)
+        return songs
+
     def get_song_path_by_id(self, song_id: int) -> str | None:
         """根据ID获取歌曲的物理文件路径"""
         result = self._query_db(
@@ -424,7 +952,71 @@ class LocalMusicAPI:
         result = self._query_db(query, (song_id,), one=True)
         return result  # 返回的是一个字典
 
+    def get_cover_hash_by_id(self, song_id: int) -> str | None:
+        """只查询封面哈希 (用于 ETag 校验，不读取图片 BLOB)"""
+        result = self._query_db(
+            "SELECT cover_hash FROM songs WHERE id = ?", (song_id,), one=True
+        )
+        return result["cover_hash"] if result else None
+
+    def get_cover_by_hash(self, cover_hash: str) -> dict | None:
+        """根据内容哈希获取封面原图"""
+        return self._query_db(
+            "SELECT hash, mime_type, image_data FROM covers WHERE hash = ?",
+            (cover_hash,),
+            one=True,
+        )
+
+    def get_cover_thumbnail(self, cover_hash: str, size: int) -> dict | None:
+        """
+        获取指定边长的封面缩略图，首次请求时生成并缓存到数据库。
+        原图不大于目标尺寸或 Pillow 不可用时直接返回原图。
+        该方法包含图片解码/缩放，应在工作线程中调用。
+        """
+        cached = self._query_db(
+            "SELECT mime_type, image_data FROM cover_thumbnails WHERE hash = ? AND size = ?",
+            (cover_hash, size),
+            one=True,
+        )
+        if cached:
+            return cached
+
+        original = self.get_cover_by_hash(cover_hash)
+        if not original or Image is None:
+            return original
+
+        try:
+            with Image.open(io.BytesIO(original["image_data"])) as img:
+                if max(img.size) <= size:
+                    return original
+                img.thumbnail((size, size), Image.LANCZOS)
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
+                buffer = io.BytesIO()
+                img.save(buffer, format="JPEG", quality=85, optimize=True)
+        except Exception as e:
+            print(f"生成封面缩略图失败 ({cover_hash}, {size}px): {e}")
+            return original
+
+        thumbnail = {"mime_type": "image/jpeg", "image_data": buffer.getvalue()}
+        # 缓存写入交给写线程异步完成，不阻塞本次响应
+        future = self.writer.execute(
+            "INSERT OR IGNORE INTO cover_thumbnails (hash, size, mime_type, image_data) VALUES (?, ?, ?, ?)",
+            (cover_hash, size, thumbnail["mime_type"], thumbnail["image_data"]),
+        )
+
+        def log_failure(f):
+            if f.exception():
+                print(f"缓存封面缩略图失败 ({cover_hash}, {size}px): {f.exception()}")
+
+        future.add_done_callback(log_failure)
+        return thumbnail
+
     def get_cover_art_by_id(self, song_id: int) -> dict | None:
-        """获取歌曲的封面数据"""
-        query = "SELECT mime_type, image_data FROM cover_art WHERE song_id = ?"
+        """获取歌曲的封面数据 (包含内容哈希)"""
+        query = """
+            SELECT c.hash, c.mime_type, c.image_data
+            FROM songs s JOIN covers c ON c.hash = s.cover_hash
+            WHERE s.id = ?
+        """
         return self._query_db(query, (song_id,), one=True)
@@ -5,6 +5,7 @@ import datetime
 import json
 import os
 import re
+import time
 import urllib.parse
 from hashlib import md5
 from random import randrange
@@ -44,7 +45,10 @@ from mutagen.id3 import (
 from mutagen.mp3 import MP3
 from opencc import OpenCC
 
+from core.cache import SingleFlight, TTLCache, get_response_cache
 from core.config import Config
+from core.downloader import download_file, download_registry
+from core.metrics import download_metrics
 
 # --- 您自己的模块导入 ---
 from utils.helpers import Utils
@@ -72,7 +76,8 @@ class APIConstants:
     SONG_WIKI_API = (
         "https://interface3.music.163.com/api/link/page/parent/relation/construct/info"
     )
-    DAILY_RECOMMEND_API = "https://interface3.music.163.com/eapi/batch"
+    BATCH_API = "https://interface3.music.163.com/eapi/batch"
+    DAILY_RECOMMEND_API = BATCH_API
     PLAYLIST_MANIPULATE_API = (
         "https://interface.music.163.com/eapi/playlist/manipulate/tracks/"
     )
@@ -90,6 +95,9 @@ class APIConstants:
 
 
 class NeteaseMusicAPI:
+    # Utils.pending_qualities 中的版本 -> 网易云链接接口的音质标识
+    PIPELINE_URL_LEVELS = {"master": "jymaster", "flac": "lossless", "lossy": "exhigh"}
+
     def __init__(
         self,
         config_users: dict,
@@ -116,7 +124,30 @@ class NeteaseMusicAPI:
             "sky": "sky",
             "jymaster": "master",
         }
-        self.album_cache = {}
+        self.album_cache = TTLCache(
+            maxsize=getattr(Config, "ALBUM_CACHE_MAX_ENTRIES", 512),
+            ttl=getattr(Config, "ALBUM_CACHE_TTL", 3600),
+            name="netease_album",
+        )
+        # 近期探测确认没有的音质 {(song_id, level): True}，避免每次播放都重新探测
+        self.unavailable_quality_cache = TTLCache(
+            maxsize=getattr(Config, "NETEASE_UNAVAILABLE_QUALITY_MAX_ENTRIES", 4096),
+            ttl=getattr(Config, "NETEASE_UNAVAILABLE_QUALITY_TTL", 900),
+            name="netease_unavailable_quality",
+        )
+        # 合并并发的相同上游请求
+        self.request_flight = SingleFlight("netease_requests")
+        # 持久化的元数据响应缓存 (与其他进程共享同一个缓存文件)
+        self.response_cache = get_response_cache()
+        # 后台下载任务队列 (由 main.py 注入)，未设置时单曲下载直接在后台协程中执行
+        self.job_queue = None
+        # 播放请求已解析好的数据 {(song_id, level): (...)}，供随后的单曲任务直接复用；
+        # 不存在 (如进程重启或重试) 时任务重新获取
+        self.song_job_hints = TTLCache(
+            maxsize=getattr(Config, "JOB_SONG_HINT_MAX_ENTRIES", 256),
+            ttl=getattr(Config, "JOB_SONG_HINT_TTL", 300),
+            name="netease_song_job_hints",
+        )
 
         # 初始化多用户 Cookie 池
         self.cookies_pool = {}
@@ -191,10 +222,45 @@ class NeteaseMusicAPI:
         eapi_path: str = None,
         os_type: str = None,
         user_id: str = None,
+        coalesce: bool = True,
     ):
         """
         支持 eapi 路径覆盖、OS伪装和多用户切换。
+
+        并发的相同请求 (地址、参数、OS 与所用 Cookie 都相同) 只会真正发送一次，
+        不同用户的 Cookie 互不合并。有副作用或每次结果不同的接口需传 coalesce=False。
         """
+        if not coalesce:
+            return await self._send_post_request(
+                url, data, is_eapi, eapi_path, os_type, user_id
+            )
+        cookie_owner = (
+            str(user_id) if user_id and str(user_id) in self.cookies_pool else ""
+        )
+        flight_key = (
+            url,
+            json.dumps(data, sort_keys=True, ensure_ascii=False, default=str),
+            is_eapi,
+            eapi_path,
+            os_type,
+            cookie_owner,
+        )
+        return await self.request_flight.do(
+            flight_key,
+            lambda: self._send_post_request(
+                url, data, is_eapi, eapi_path, os_type, user_id
+            ),
+        )
+
+    async def _send_post_request(
+        self,
+        url: str,
+        data: dict,
+        is_eapi=False,
+        eapi_path: str = None,
+        os_type: str = None,
+        user_id: str = None,
+    ):
         print(f"url: {url}")
         try:
             target_cookies = self.default_cookies.copy()  # 默认
@@ -244,7 +310,13 @@ class NeteaseMusicAPI:
             return None
 
     async def _post_song_wiki_request(self, song_id: str):
-        """专门用于请求歌曲百科接口的函数。"""
+        """专门用于请求歌曲百科接口的函数，并发请求同一首歌的百科时只发送一次。"""
+        return await self.request_flight.do(
+            ("song_wiki", str(song_id)),
+            lambda: self._send_song_wiki_request(song_id),
+        )
+
+    async def _send_song_wiki_request(self, song_id: str):
         ext_json = json.dumps(
             {"states": {"playingResource": {"current": str(song_id)}}}
         )
@@ -271,17 +343,26 @@ class NeteaseMusicAPI:
             print(f"网易云百科接口请求或处理出错: {e}")
             return None
 
-    async def _get_song_url_data(self, song_id: str, level: str, meta_info: dict):
-        """获取歌曲指定音质的播放链接。"""
+    def _build_song_url_payload(self, song_ids: list, level: str) -> dict:
+        """构造 SONG_URL_V1 的请求体，ids 可以一次包含多首歌曲。"""
         config = APIConstants.DEFAULT_CONFIG.copy()
         config["requestId"] = str(randrange(20000000, 30000000))
-        payload = {"ids": [str(song_id)], "level": level, "header": json.dumps(config)}
+        payload = {
+            "ids": [str(song_id) for song_id in song_ids],
+            "level": level,
+            "header": json.dumps(config),
+        }
         if level == "hires":
             payload["encodeType"] = "hires"
         else:
             payload["encodeType"] = "flac"
         if level == "sky":
             payload["immerseType"] = "c51"
+        return payload
+
+    async def _get_song_url_data(self, song_id: str, level: str, meta_info: dict):
+        """获取歌曲指定音质的播放链接。"""
+        payload = self._build_song_url_payload([song_id], level)
         if level == "jyeffect":
             try:
                 charge_info_list = meta_info.get("privilege", {}).get(
@@ -300,16 +381,173 @@ class NeteaseMusicAPI:
                 pass
         return await self._post_request(APIConstants.SONG_URL_V1, payload, is_eapi=True)
 
+    async def _cached_response(self, endpoint: str, key, fetch):
+        """经持久化响应缓存获取 fetch() 的结果 (未启用缓存时直接请求)。"""
+        if self.response_cache is None:
+            return await fetch()
+        return await self.response_cache.get_or_fetch("netease", endpoint, key, fetch)
+
+    @staticmethod
+    def _api_path(url: str) -> str:
+        """接口地址对应的 /api/... 路径 (batch 中每个子请求以路径为键)。"""
+        return urllib.parse.urlparse(url).path.replace("/eapi/", "/api/")
+
+    async def _post_batch(self, calls: dict, user_id: str = None) -> dict:
+        """
+        通过 /eapi/batch 在一次加密请求中发送多个接口调用。
+
+        calls 为 {接口地址: 参数字典}，返回 {接口地址: 子响应}；只包含服务端返回了
+        code == 200 的子请求，整体失败时返回空字典，由调用方回退为单独请求。
+        同一个接口在一次 batch 中只能出现一次。
+        """
+        payload = {}
+        for url, params in calls.items():
+            # 子请求参数以 JSON 字符串传递，其中的列表/字典字段也要先序列化为字符串
+            payload[self._api_path(url)] = json.dumps(
+                {
+                    key: value if isinstance(value, str) else json.dumps(value)
+                    for key, value in params.items()
+                }
+            )
+        payload["header"] = "{}"
+        payload["e_r"] = True
+        response = await self._post_request(
+            APIConstants.BATCH_API, payload, is_eapi=True, user_id=user_id
+        )
+        results = {}
+        for url in calls:
+            sub_response = (response or {}).get(self._api_path(url))
+            if isinstance(sub_response, dict) and sub_response.get("code") == 200:
+                results[url] = sub_response
+        if len(results) < len(calls):
+            print(
+                f"batch 请求中 {len(calls) - len(results)}/{len(calls)} 个子请求未成功，将单独重试。"
+            )
+        return results
+
+    async def _get_song_bundle(self, song_id: str, level: str):
+        """
+        用一次 batch 请求取回歌曲详情、歌词和指定音质的链接，已缓存的部分不再请求。
+
+        返回 (meta_data, lyric_data, url_data)，格式与各自的单独请求一致；
+        batch 中缺失的部分回退为单独请求。鲸云音效的链接依赖详情中的权益信息，单独请求。
+        """
+        cache = self.response_cache
+        song = cache.get("netease", "song_detail", song_id) if cache else None
+        lyric_data = cache.get("netease", "lyric", song_id) if cache else None
+
+        calls = {}
+        if song is None:
+            calls[APIConstants.SONG_DETAIL_V3] = {
+                "c": json.dumps([{"id": song_id, "v": 0}])
+            }
+        if lyric_data is None:
+            calls[APIConstants.LYRIC_API] = self._lyric_params(song_id)
+        if level != "jyeffect":
+            url_params = self._build_song_url_payload([song_id], level)
+            url_params.pop("header")
+            calls[APIConstants.SONG_URL_V1] = url_params
+
+        results = await self._post_batch(calls) if len(calls) > 1 else {}
+
+        detail = results.get(APIConstants.SONG_DETAIL_V3)
+        if detail and detail.get("songs"):
+            song = detail["songs"][0]
+            if cache:
+                cache.set("netease", "song_detail", song_id, song)
+        meta_data = (
+            {"code": 200, "songs": [song]}
+            if song
+            else await self._get_song_metadata(song_id)
+        )
+
+        if APIConstants.LYRIC_API in results:
+            lyric_data = results[APIConstants.LYRIC_API]
+            if cache:
+                cache.set("netease", "lyric", song_id, lyric_data)
+        elif lyric_data is None:
+            lyric_data = await self._get_lyric_data(song_id)
+
+        url_data = results.get(APIConstants.SONG_URL_V1)
+        if url_data is None:
+            meta_info = (
+                meta_data["songs"][0] if meta_data and meta_data.get("songs") else {}
+            )
+            url_data = await self._get_song_url_data(song_id, level, meta_info)
+        return meta_data, lyric_data, url_data
+
     async def _get_song_metadata(self, song_id: str):
-        """获取歌曲的基础元数据。"""
-        data = {"c": json.dumps([{"id": song_id, "v": 0}])}
-        return await self._post_request(APIConstants.SONG_DETAIL_V3, data)
+        """获取歌曲的基础元数据 (单曲详情会持久化缓存)。"""
 
-    async def _get_song_wiki_details(self, song_id: str) -> dict:
-        """调用歌曲百科接口，获取详细的创作者和属性信息。"""
-        response_data = await self._post_song_wiki_request(song_id)
-        if not response_data or response_data.get("code") != 200:
+        async def fetch():
+            data = {"c": json.dumps([{"id": song_id, "v": 0}])}
+            response = await self._post_request(APIConstants.SONG_DETAIL_V3, data)
+            if response and response.get("songs"):
+                return response["songs"][0]
+            return None
+
+        song = await self._cached_response("song_detail", song_id, fetch)
+        return {"code": 200, "songs": [song]} if song else None
+
+    async def _get_song_urls_batch(self, song_ids: list, level: str) -> dict:
+        """
+        一次请求取回多首歌曲在指定音质下的链接信息，返回 {song_id: url_info}。
+
+        请求失败时返回 None，由调用方回退到逐首请求。
+        """
+        if not song_ids:
             return {}
+        payload = self._build_song_url_payload(song_ids, level)
+        response = await self._post_request(
+            APIConstants.SONG_URL_V1, payload, is_eapi=True
+        )
+        if not response or response.get("data") is None:
+            print(f"批量获取歌曲链接失败 (音质: {level}, {len(song_ids)} 首)。")
+            return None
+        return {str(item["id"]): item for item in response["data"] if item.get("id")}
+
+    async def _get_songs_metadata_batch(self, song_ids: list) -> dict:
+        """
+        批量获取歌曲基础元数据，返回 {song_id: song}。
+
+        SONG_DETAIL_V3 的 c 参数可以一次传入多首歌曲，按 NETEASE_DETAIL_BATCH_SIZE 分块请求。
+        """
+        songs = {}
+        if self.response_cache is not None:
+            for song_id in song_ids:
+                song = self.response_cache.get("netease", "song_detail", song_id)
+                if song is not None:
+                    songs[song_id] = song
+        missing = [song_id for song_id in song_ids if song_id not in songs]
+
+        chunk_size = max(1, getattr(Config, "NETEASE_DETAIL_BATCH_SIZE", 500))
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start : start + chunk_size]
+            data = {"c": json.dumps([{"id": song_id, "v": 0} for song_id in chunk])}
+            response = await self._post_request(APIConstants.SONG_DETAIL_V3, data)
+            if not response or not response.get("songs"):
+                print(f"批量获取歌曲元数据失败 ({len(chunk)} 首)。")
+                continue
+            for song in response["songs"]:
+                song_id = str(song["id"])
+                songs[song_id] = song
+                if self.response_cache is not None:
+                    self.response_cache.set("netease", "song_detail", song_id, song)
+        return songs
+
+    async def _get_song_wiki_details(self, song_id: str) -> dict:
+        """调用歌曲百科接口，获取详细的创作者和属性信息 (解析结果会持久化缓存)。"""
+
+        async def fetch():
+            response_data = await self._post_song_wiki_request(song_id)
+            if not response_data or response_data.get("code") != 200:
+                return None
+            return self._parse_song_wiki(response_data)
+
+        return await self._cached_response("song_wiki", song_id, fetch) or {}
+
+    def _parse_song_wiki(self, response_data: dict) -> dict:
+        """从百科接口响应中提取创作者、曲风与 BPM。"""
         details = {}
         try:
             blocks = response_data.get("data", {}).get("blocks", [])
@@ -377,9 +615,9 @@ class NeteaseMusicAPI:
             print(f"解析网易云歌曲百科信息时出错: {e}")
         return details
 
-    async def _get_lyric_data(self, song_id: str):
-        """获取歌曲歌词。"""
-        data = {
+    @staticmethod
+    def _lyric_params(song_id: str) -> dict:
+        return {
             "id": song_id,
             "cp": "false",
             "tv": "0",
@@ -387,12 +625,26 @@ class NeteaseMusicAPI:
             "rv": "0",
             "kv": "0",
         }
-        return await self._post_request(APIConstants.LYRIC_API, data)
+
+    async def _get_lyric_data(self, song_id: str):
+        """获取歌曲歌词。"""
+        data = self._lyric_params(song_id)
+
+        async def fetch():
+            response = await self._post_request(APIConstants.LYRIC_API, data)
+            return response if response and response.get("code") == 200 else None
+
+        return await self._cached_response("lyric", song_id, fetch)
 
     async def _get_album_details_by_id(self, album_id: str) -> dict:
-        """获取专辑详情，用于补充元数据。"""
+        """获取专辑详情，用于补充元数据 (持久化缓存)。"""
         if not album_id:
             return None
+        return await self._cached_response(
+            "album", album_id, lambda: self._fetch_album_details(album_id)
+        )
+
+    async def _fetch_album_details(self, album_id: str) -> dict:
         try:
             params_for_cache_key = {"id": str(album_id), "e_r": "false"}
             cache_key = self._generate_cache_key(params_for_cache_key)
@@ -453,7 +705,7 @@ class NeteaseMusicAPI:
             bpm = song_info.get("bpm")
             genre_from_wiki = song_info.get("genre_from_wiki")
 
-            # --- 获取权威元数据 (注意: 这里的 self.album_cache 访问是线程安全的) ---
+            # --- 获取权威元数据 (album_cache 为线程安全的 TTLCache) ---
             album_details = self.album_cache.get(album_id)
             if album_details:
                 album_artist = (
@@ -602,10 +854,12 @@ class NeteaseMusicAPI:
         image_data, cover_mime = None, None
         album_info = song_info.get("al", {})
 
-        # 异步获取专辑详情（用于缓存）
+        # 异步获取专辑详情（用于缓存，同专辑的并发任务只会请求一次）
         album_id = str(album_info.get("id"))
-        if album_id and album_id not in self.album_cache:
-            self.album_cache[album_id] = await self._get_album_details_by_id(album_id)
+        if album_id:
+            await self.album_cache.get_or_load(
+                album_id, lambda: self._get_album_details_by_id(album_id)
+            )
 
         # 异步下载封面
         if album_info.get("picUrl"):
@@ -629,6 +883,43 @@ class NeteaseMusicAPI:
 
     async def _download_and_process_single_version(
         self, search_key, quality, download_url, extension, song_info, lyric, tlyric
+    ):
+        """
+        下载并入库单个音质版本。
+
+        同一 (search_key, 专辑, 音质) 已在下载中时 (重复播放、歌单中重复出现的歌曲)，
+        不再发起新的下载，直接等待进行中的任务并返回其结果。
+        """
+        album_name = song_info.get("al", {}).get("name", "")
+        return await download_registry.do(
+            (search_key, album_name, quality),
+            lambda: download_metrics.track(
+                "netease",
+                search_key,
+                quality,
+                lambda tracker: self._download_single_version(
+                    search_key,
+                    quality,
+                    download_url,
+                    extension,
+                    song_info,
+                    lyric,
+                    tlyric,
+                    tracker,
+                ),
+            ),
+        )
+
+    async def _download_single_version(
+        self,
+        search_key,
+        quality,
+        download_url,
+        extension,
+        song_info,
+        lyric,
+        tlyric,
+        tracker,
     ):
         """异步下载，并将同步的DB操作放入线程池。"""
         album_name = song_info.get("al", {}).get("name", "")
@@ -657,24 +948,25 @@ class NeteaseMusicAPI:
                 print(
                     f"后台任务: 开始下载 '{base_name}' ({quality}) (第 {attempt + 1} 次尝试)"
                 )
-                async with self.client.stream(
-                    "GET",
-                    download_url,
-                    timeout=300,
-                    headers=self.headers,
-                    cookies=self.cookies,
-                ) as r:
-                    r.raise_for_status()
-                    with open(file_path, "wb") as f:
-                        async for chunk in r.aiter_bytes(chunk_size=8192):
-                            f.write(chunk)
+                # 先写入 .part，断线时按 Range 续传，下完才改名为正式文件
+                with tracker.stage("transfer"):
+                    await download_file(
+                        self.client,
+                        download_url,
+                        file_path,
+                        headers=self.headers,
+                        cookies=self.cookies,
+                        timeout=300,
+                        tracker=tracker,
+                    )
 
                 print(f"后台任务: 下载成功 - {file_path}")
 
                 # 嵌入元数据到文件，并获取封面数据
-                image_data, cover_mime = await self._embed_metadata(
-                    file_path, song_info, lyric, tlyric
-                )
+                with tracker.stage("embed_metadata"):
+                    image_data, cover_mime = await self._embed_metadata(
+                        file_path, song_info, lyric, tlyric
+                    )
 
                 # 将所有信息（包括封面）存入数据库
                 # 构造一个 search_key，因为 song_info 可能不完整
@@ -713,145 +1005,210 @@ class NeteaseMusicAPI:
                     ),  # 依赖 _embed_metadata 中填充的
                 }
 
-                await run_in_threadpool(
-                    self.local_api.add_song_to_db,
-                    song_info=db_song_info,
-                    file_path=file_path,
-                    quality=quality,
-                    lyric=lyric,
-                    tlyric=tlyric,
-                    cover_data=image_data,
-                    cover_mime=cover_mime,
-                )
+                with tracker.stage("db_insert"):
+                    await run_in_threadpool(
+                        self.local_api.add_song_to_db,
+                        song_info=db_song_info,
+                        file_path=file_path,
+                        quality=quality,
+                        lyric=lyric,
+                        tlyric=tlyric,
+                        cover_data=image_data,
+                        cover_mime=cover_mime,
+                    )
                 return True
             except httpx.RequestError as e:
                 print(
                     f"后台任务: 下载 '{search_key}' 失败 (第 {attempt + 1} 次尝试)，错误: {e}"
                 )
                 if attempt < max_retries - 1:
+                    tracker.retries += 1
                     await asyncio.sleep(5)
                 else:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
+                    # 保留 .part 与进度文件，下次下载同一首歌时从断点继续
                     return False
         return False
 
-    async def _background_download_task(
-        self, song_id: str, meta_info: dict, lyric: str, tlyric: str
-    ):
-        """完全解耦的异步后台智能分层下载任务"""
+    def _build_search_key(self, meta_info: dict) -> str:
+        """根据歌曲元数据生成本地库使用的 search_key (歌手 - 歌名，繁转简)。"""
         artist_string = "、".join([artist["name"] for artist in meta_info["ar"]])
-        song_name = meta_info["name"]
-        search_key = self.converter.convert(f"{artist_string} - {song_name}")
-
-        album_name = meta_info.get("al", {}).get("name", "") if meta_info else ""
-        existing_qualities = await run_in_threadpool(
-            self.local_api.get_existing_qualities,
-            search_key=search_key,
-            album=album_name,
+        return self.converter.convert(f"{artist_string} - {meta_info['name']}")
+
+    def _has_pending_quality(self, existing_qualities: list) -> bool:
+        """按当前下载开关判断该曲目是否还有需要下载的音质。"""
+        return bool(self._pipeline_url_levels(existing_qualities))
+
+    async def _prefetch_existing_qualities(self, tracks: list) -> dict:
+        """
+        歌单/专辑下载前一次性查询所有曲目在本地库中的已有音质。
+
+        返回 {song_id: [quality, ...]}，缺少元数据无法计算 search_key 的曲目不在结果中。
+        """
+        if not self.local_api:
+            return {}
+        keys_by_id = {}
+        for track in tracks:
+            if not track.get("id") or not track.get("name") or "ar" not in track:
+                continue
+            album_name = (track.get("al") or {}).get("name", "")
+            keys_by_id[str(track["id"])] = (self._build_search_key(track), album_name)
+        if not keys_by_id:
+            return {}
+        qualities_by_key = await run_in_threadpool(
+            self.local_api.get_existing_qualities_batch, list(keys_by_id.values())
         )
-        print(f"后台任务: 本地库中 '{search_key}' 已有音质: {existing_qualities}")
+        return {
+            song_id: qualities_by_key.get(key, [])
+            for song_id, key in keys_by_id.items()
+        }
 
-        tasks = []
-        enable_master = getattr(Config, "ENABLE_MASTER_DOWNLOAD", True)
-        enable_flac = getattr(Config, "ENABLE_FLAC_DOWNLOAD", False)
-        enable_lossy = getattr(Config, "ENABLE_LOSSY_DOWNLOAD", False)
+    async def _resolve_song_url(
+        self, song_id: str, level: str, meta_info: dict, url_infos: dict = None
+    ) -> dict:
+        """
+        取歌曲某个音质的链接信息 (后台下载用)：优先使用批量预取的结果，
+        没有预取的音质再单独请求，单独请求的耗时计入下载指标的 url_fetch。
+        """
+        if url_infos is not None and level in url_infos:
+            return url_infos[level]
+        with download_metrics.timed("url_fetch"):
+            url_data = await self._get_song_url_data(song_id, level, meta_info)
+        if url_data and url_data.get("data"):
+            return url_data["data"][0]
+        return None
+
+    async def _probe_quality(
+        self, song_id: str, level: str, meta_info: dict, url_infos: dict = None
+    ) -> dict:
+        """
+        探测歌曲某档音质能否下载，可以则返回链接信息，否则返回 None。
 
-        # 标记是否已经拥有或即将拥有无损音质
-        has_lossless = ("master" in existing_qualities) or (
-            "flac" in existing_qualities
+        上游返回了有效链接但音质被降级时，记入 unavailable_quality_cache，
+        NETEASE_UNAVAILABLE_QUALITY_TTL (默认 15 分钟) 内重复播放不再探测；空链接不记录。
+        降级既可能是歌曲本身没有该音质，也可能是 Cookie 过期或 VIP 失效 (此时网易云
+        通常返回低音质链接而不是空链接)，两者无法区分，所以只短时间记录，
+        Cookie 恢复后很快就会重新探测。
+        """
+        song_url_info = await self._resolve_song_url(
+            song_id, level, meta_info, url_infos
         )
-        will_download_lossless = False
+        if song_url_info is None:
+            return None
+        if not song_url_info.get("url"):
+            print(
+                f"后台任务: 歌曲 (ID: {song_id}) 的 {level} 音质没有返回链接 (code: {song_url_info.get('code')})，本次跳过。"
+            )
+            return None
+        accepted_levels = ("exhigh", "standard") if level == "exhigh" else (level,)
+        if song_url_info.get("level") in accepted_levels:
+            return song_url_info
+        print(
+            f"后台任务: 歌曲 (ID: {song_id}) 没有 {level} 音质 (返回: {song_url_info.get('level')})，暂不再探测。"
+        )
+        self.unavailable_quality_cache.set((str(song_id), level), True)
+        return None
+
+    async def _background_download_task(
+        self,
+        song_id: str,
+        meta_info: dict,
+        lyric: str,
+        tlyric: str,
+        existing_qualities: list = None,
+        url_infos: dict = None,
+    ):
+        """
+        完全解耦的异步后台智能分层下载任务
 
-        master_task = None
-        flac_task = None
+        url_infos 为批量下载流水线预取的 {level: url_info}，其中的音质不再逐首请求链接。
+        返回本次尝试的音质版本是否全部下载成功。没有尝试任何下载时，只有所需音质都已
+        确认不可用 (在 unavailable_quality_cache 中) 才返回 True；链接请求失败或返回空链接
+        时返回 False，由下载任务队列重试。
+        """
+        search_key = self._build_search_key(meta_info)
+
+        if existing_qualities is None:
+            album_name = meta_info.get("al", {}).get("name", "") if meta_info else ""
+            existing_qualities = await run_in_threadpool(
+                self.local_api.get_existing_qualities,
+                search_key=search_key,
+                album=album_name,
+            )
+        print(f"后台任务: 本地库中 '{search_key}' 已有音质: {existing_qualities}")
 
-        # 1. 独立判断 Master (网易云标识: jymaster)
-        if enable_master and "master" not in existing_qualities:
-            url_data_m = await self._get_song_url_data(song_id, "jymaster", meta_info)
-            if (
-                url_data_m
-                and url_data_m.get("data")
-                and url_data_m["data"][0].get("level") == "jymaster"
-            ):
-                song_url_info = url_data_m["data"][0]
-                if song_url_info.get("url"):
-                    ext = f".{song_url_info.get('type', 'flac')}"
-                    master_task = self._download_and_process_single_version(
-                        search_key,
-                        "master",
-                        song_url_info["url"],
-                        ext,
-                        meta_info,
-                        lyric,
-                        tlyric,
-                    )
-                    will_download_lossless = True
-
-        # 2. 独立判断 FLAC (网易云标识: lossless)
-        if enable_flac and "flac" not in existing_qualities:
-            url_data_f = await self._get_song_url_data(song_id, "lossless", meta_info)
-            if (
-                url_data_f
-                and url_data_f.get("data")
-                and url_data_f["data"][0].get("level") == "lossless"
-            ):
-                song_url_info = url_data_f["data"][0]
-                if song_url_info.get("url"):
-                    ext = f".{song_url_info.get('type', 'flac')}"
-                    flac_task = self._download_and_process_single_version(
+        # 各档音质的链接并发探测，近期已确认不可用的音质直接跳过
+        levels = [
+            url_level
+            for url_level in self._pipeline_url_levels(existing_qualities)
+            if (str(song_id), url_level) not in self.unavailable_quality_cache
+        ]
+        probed = await asyncio.gather(
+            *(
+                self._probe_quality(song_id, url_level, meta_info, url_infos)
+                for url_level in levels
+            )
+        )
+        available = dict(zip(levels, probed))
+
+        tasks = []
+        will_download_lossless = False
+
+        # 1. Master (网易云标识: jymaster) 与 2. FLAC (网易云标识: lossless) 各自独立判断
+        for url_level, db_quality in (("jymaster", "master"), ("lossless", "flac")):
+            song_url_info = available.get(url_level)
+            if song_url_info:
+                ext = f".{song_url_info.get('type', 'flac')}"
+                tasks.append(
+                    self._download_and_process_single_version(
                         search_key,
-                        "flac",
+                        db_quality,
                         song_url_info["url"],
                         ext,
                         meta_info,
                         lyric,
                         tlyric,
                     )
-                    will_download_lossless = True
-
-        if master_task:
-            tasks.append(master_task)
-        if flac_task:
-            tasks.append(flac_task)
-
-        # 3. 真正的有损兜底
-        if enable_lossy and not has_lossless and not will_download_lossless:
-            if "320" not in existing_qualities and "128" not in existing_qualities:
-                url_data_lossy = await self._get_song_url_data(
-                    song_id, "exhigh", meta_info
                 )
-                if url_data_lossy and url_data_lossy.get("data"):
-                    song_url_info = url_data_lossy["data"][0]
-                    actual_level = song_url_info.get("level")
-                    download_url = song_url_info.get("url")
-
-                    if download_url and actual_level in ["exhigh", "standard"]:
-                        db_quality = self.quality_map.get(actual_level, "128")
-                        ext = f".{song_url_info.get('type', 'mp3')}"
-                        tasks.append(
-                            self._download_and_process_single_version(
-                                search_key,
-                                db_quality,
-                                download_url,
-                                ext,
-                                meta_info,
-                                lyric,
-                                tlyric,
-                            )
-                        )
+                will_download_lossless = True
+
+        # 3. 真正的有损兜底 (本地没有任何无损/有损版本，且本次也不会下载无损)
+        song_url_info = available.get("exhigh")
+        if song_url_info and not will_download_lossless:
+            db_quality = self.quality_map.get(song_url_info.get("level"), "128")
+            ext = f".{song_url_info.get('type', 'mp3')}"
+            tasks.append(
+                self._download_and_process_single_version(
+                    search_key,
+                    db_quality,
+                    song_url_info["url"],
+                    ext,
+                    meta_info,
+                    lyric,
+                    tlyric,
+                )
+            )
 
         if tasks:
-            await asyncio.gather(*tasks)
-        else:
-            print(f"后台任务: '{search_key}' 命中严格模式，没有需要下载的音质版本。")
-
-    def search_song(self, keyword: str, album: str = None, limit: int = 10):
+            return all(await asyncio.gather(*tasks))
+        unresolved = [
+            url_level
+            for url_level in levels
+            if (str(song_id), url_level) not in self.unavailable_quality_cache
+        ]
+        if unresolved:
+            print(f"后台任务: '{search_key}' 的 {unresolved} 音质没有拿到可用的链接。")
+            return False
+        print(f"后台任务: '{search_key}' 命中严格模式，没有需要下载的音质版本。")
+        return True
+
+    async def search_song(self, keyword: str, album: str = None, limit: int = 10):
         """
         根据关键词搜索歌曲，并可选地根据专辑名进行过滤。
         """
         payload = {"s": keyword, "type": 1, "limit": limit, "offset": 0}
-        search_data = self._post_request(APIConstants.SEARCH_API, payload, is_eapi=True)
+        search_data = await self._post_request(
+            APIConstants.SEARCH_API, payload, is_eapi=True
+        )
         # print(f"search_data: {search_data}")
 
         if (
@@ -886,31 +1243,127 @@ class NeteaseMusicAPI:
             )
         return formatted_results
 
-    async def get_song_details(self, song_id, level):
+    async def _timed(self, timings: dict, stage: str, awaitable):
+        """等待 awaitable，并把耗时 (毫秒) 记录到 timings[stage]。"""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+    @staticmethod
+    def _probe_url_infos(level: str, url_data: dict) -> dict:
+        """单曲解析已取回的链接若正是后台下载要探测的音质，直接交给后台任务复用。"""
+        if level in ("jymaster", "lossless", "exhigh") and url_data:
+            if url_data.get("data"):
+                return {level: url_data["data"][0]}
+        return None
+
+    async def _download_after_wiki(
+        self,
+        wiki_task,
+        song_id,
+        meta_info,
+        lyric,
+        tlyric,
+        existing_qualities,
+        url_infos=None,
+    ):
+        """百科请求超时时，后台下载先等它完成 (尽量补全元数据) 再开始。"""
+        try:
+            wiki_details = await wiki_task
+        except Exception as e:
+            print(f">>> 歌曲 (ID: {song_id}) 的百科请求失败: {e}")
+            wiki_details = None
+        if wiki_details:
+            meta_info.update(wiki_details)
+        return await self._background_download_task(
+            song_id, meta_info, lyric, tlyric, existing_qualities, url_infos
+        )
+
+    async def get_song_details(self, song_id, level, existing_qualities: list = None):
         """
         获取歌曲完整信息，并触发后台下载。
+
+        元数据、歌词与播放链接经 /eapi/batch 合并为一次请求，与百科请求并发；百科最多等待
+        NETEASE_WIKI_TIMEOUT 秒，超时则先不带百科信息返回 (请求仍在后台完成并写入缓存)。
+        各阶段耗时记录在 timings 中。
+        existing_qualities 可由歌单/专辑下载预先批量查出后传入，省去逐首查询本地库。
         """
-        meta_data = await self._get_song_metadata(song_id)
+        timings = {}
+        started = time.perf_counter()
+        wiki_task = asyncio.ensure_future(
+            self._timed(timings, "wiki", self._get_song_wiki_details(song_id))
+        )
+        meta_data, lyric_data, url_data = await self._timed(
+            timings, "batch", self._get_song_bundle(song_id, level)
+        )
         if not meta_data or not meta_data.get("songs"):
             return {"error": "获取歌曲元数据失败。"}
         meta_info = meta_data["songs"][0]
 
-        wiki_details = await self._get_song_wiki_details(song_id)
+        wiki_timeout = getattr(Config, "NETEASE_WIKI_TIMEOUT", 3.0)
+        wiki_remaining = max(0.0, wiki_timeout - (time.perf_counter() - started))
+        wiki_timed_out = False
+        try:
+            wiki_details = await asyncio.wait_for(
+                asyncio.shield(wiki_task), wiki_remaining
+            )
+        except asyncio.TimeoutError:
+            print(f">>> 百科接口超过 {wiki_timeout}s 未返回，先不带百科信息继续。")
+            wiki_details, wiki_timed_out = None, True
         # 将获取到的详细信息合并到主信息字典中
         if wiki_details:
             print(f">>> 成功从百科接口获取到 {list(wiki_details.keys())} 等详细信息。")
             meta_info.update(wiki_details)
 
-        lyric_data = await self._get_lyric_data(song_id)
         lyric = lyric_data.get("lrc", {}).get("lyric", "") if lyric_data else ""
         tlyric = lyric_data.get("tlyric", {}).get("lyric", "") if lyric_data else ""
 
-        if self.local_api and Config.DOWNLOADS_ENABLED:
-            asyncio.create_task(
-                self._background_download_task(song_id, meta_info, lyric, tlyric)
+        if self.local_api and Config.DOWNLOADS_ENABLED and self.job_queue is not None:
+            self.song_job_hints.set(
+                (str(song_id), level),
+                (
+                    meta_info,
+                    lyric,
+                    tlyric,
+                    existing_qualities,
+                    self._probe_url_infos(level, url_data),
+                    wiki_task if wiki_timed_out else None,
+                ),
             )
+            await self.job_queue.enqueue("netease", "song", song_id, level)
+        elif self.local_api and Config.DOWNLOADS_ENABLED:
+            if wiki_timed_out:
+                asyncio.create_task(
+                    self._download_after_wiki(
+                        wiki_task,
+                        song_id,
+                        meta_info,
+                        lyric,
+                        tlyric,
+                        existing_qualities,
+                        self._probe_url_infos(level, url_data),
+                    )
+                )
+            else:
+                asyncio.create_task(
+                    self._background_download_task(
+                        song_id,
+                        meta_info,
+                        lyric,
+                        tlyric,
+                        existing_qualities,
+                        self._probe_url_infos(level, url_data),
+                    )
+                )
+
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        timings = dict(timings)
+        if wiki_timed_out:
+            timings["wiki"] = None
+        print(f">>> 歌曲 (ID: {song_id}) 各阶段耗时 (ms): {timings}")
 
-        url_data = await self._get_song_url_data(song_id, level, meta_info)
         if (
             not url_data
             or not url_data.get("data")
@@ -931,6 +1384,7 @@ class NeteaseMusicAPI:
             "url": song_info_url["url"].replace("http://", "https://"),
             "lyric": lyric,
             "tlyric": tlyric,
+            "timings": timings,
         }
         return formatted_data
 
@@ -1018,9 +1472,177 @@ class NeteaseMusicAPI:
         """
         return asyncio.run(self.get_playlist_info(playlist_id))
 
-    async def download_playlist_by_id(self, playlist_id: str, level: str) -> dict:
+    def _filter_pending_tracks(self, song_ids: list, existing_map: dict) -> list:
+        """去掉本地已具备全部所需音质的曲目，返回仍需处理的歌曲 ID。"""
+        pending = []
+        total = len(song_ids)
+        for i, song_id in enumerate(song_ids):
+            existing_qualities = existing_map.get(song_id)
+            if existing_qualities is not None and not self._has_pending_quality(
+                existing_qualities
+            ):
+                print(
+                    f"  -> 第 {i + 1}/{total} 首歌曲 (ID: {song_id}) 本地已有 {existing_qualities}，跳过。"
+                )
+                continue
+            pending.append(song_id)
+        print(f"  -> 共 {len(pending)}/{total} 首歌曲需要下载。")
+        return pending
+
+    def _pipeline_url_levels(self, existing_qualities: list) -> list:
+        """按下载开关和本地已有音质，列出一首歌在后台下载中可能需要的链接音质。"""
+        return [
+            self.PIPELINE_URL_LEVELS[quality]
+            for quality in Utils.pending_qualities(
+                existing_qualities,
+                getattr(Config, "ENABLE_MASTER_DOWNLOAD", True),
+                getattr(Config, "ENABLE_FLAC_DOWNLOAD", False),
+                getattr(Config, "ENABLE_LOSSY_DOWNLOAD", False),
+            )
+        ]
+
+    async def _hydrate_and_download(
+        self, song_id: str, meta_info: dict, existing_qualities: list, url_infos: dict
+    ):
+        """补全单首歌曲的百科信息与歌词 (两者并发请求)，然后执行后台下载，返回是否全部成功。"""
+        wiki_details, lyric_data = await asyncio.gather(
+            self._get_song_wiki_details(song_id), self._get_lyric_data(song_id)
+        )
+        if wiki_details:
+            meta_info.update(wiki_details)
+        lyric = lyric_data.get("lrc", {}).get("lyric", "") if lyric_data else ""
+        tlyric = lyric_data.get("tlyric", {}).get("lyric", "") if lyric_data else ""
+        return await self._background_download_task(
+            song_id, meta_info, lyric, tlyric, existing_qualities, url_infos
+        )
+
+    async def _get_chunk_details(self, chunk: list, existing_map: dict):
+        """
+        取回一块歌曲的元数据 {song_id: song} 和各音质链接 {level: {song_id: url_info}}。
+
+        同一音质的链接一次请求取回，只包含仍缺该音质的歌曲。未缓存的元数据与第一个音质的
+        链接合并为一次 batch 请求；batch 中同一接口只能出现一次，其余音质各单独请求一次。
+        """
+        ids_by_level = {}
+        for song_id in chunk:
+            for url_level in self._pipeline_url_levels(existing_map.get(song_id)):
+                if (str(song_id), url_level) not in self.unavailable_quality_cache:
+                    ids_by_level.setdefault(url_level, []).append(song_id)
+
+        metas = {}
+        if self.response_cache is not None:
+            for song_id in chunk:
+                song = self.response_cache.get("netease", "song_detail", song_id)
+                if song is not None:
+                    metas[song_id] = song
+        missing = [song_id for song_id in chunk if song_id not in metas]
+
+        urls_by_level = {}
+        detail_limit = max(1, getattr(Config, "NETEASE_DETAIL_BATCH_SIZE", 500))
+        if missing and ids_by_level and len(missing) <= detail_limit:
+            first_level, first_ids = next(iter(ids_by_level.items()))
+            url_params = self._build_song_url_payload(first_ids, first_level)
+            url_params.pop("header")
+            # 链接与元数据合并在同一次请求中，整体计入 url_fetch
+            with download_metrics.timed("url_fetch"):
+                results = await self._post_batch(
+                    {
+                        APIConstants.SONG_DETAIL_V3: {
+                            "c": json.dumps(
+                                [{"id": song_id, "v": 0} for song_id in missing]
+                            )
+                        },
+                        APIConstants.SONG_URL_V1: url_params,
+                    }
+                )
+            detail = results.get(APIConstants.SONG_DETAIL_V3) or {}
+            for song in detail.get("songs") or []:
+                song_id = str(song["id"])
+                metas[song_id] = song
+                if self.response_cache is not None:
+                    self.response_cache.set("netease", "song_detail", song_id, song)
+            url_response = results.get(APIConstants.SONG_URL_V1)
+            if url_response and url_response.get("data") is not None:
+                urls_by_level[first_level] = {
+                    str(item["id"]): item
+                    for item in url_response["data"]
+                    if item.get("id")
+                }
+
+        remaining = [song_id for song_id in chunk if song_id not in metas]
+        if remaining:
+            metas.update(await self._get_songs_metadata_batch(remaining))
+
+        for url_level, ids in ids_by_level.items():
+            if url_level in urls_by_level:
+                continue
+            with download_metrics.timed("url_fetch"):
+                url_map = await self._get_song_urls_batch(ids, url_level)
+            if url_map is not None:
+                urls_by_level[url_level] = url_map
+        return metas, urls_by_level
+
+    async def _download_tracks_batched(
+        self, song_ids: list, existing_map: dict, label: str, progress=None
+    ):
+        """
+        歌单/专辑的批量下载流水线。
+
+        按 NETEASE_BATCH_CHUNK_SIZE 分块：每块的全部元数据和第一个音质的链接用一次 batch
+        请求取回，其余音质各用一次 SONG_URL_V1 取回全部链接，再在 NETEASE_DOWNLOAD_CONCURRENCY
+        的并发上限内逐首补全百科/歌词并下载。链接按块获取，避免排队太久而过期。
+        每处理完一块调用一次 progress(已处理数, 总数)。返回下载失败的歌曲数。
+        """
+        chunk_size = max(1, getattr(Config, "NETEASE_BATCH_CHUNK_SIZE", 50))
+        semaphore = asyncio.Semaphore(
+            max(1, getattr(Config, "NETEASE_DOWNLOAD_CONCURRENCY", 4))
+        )
+        total = len(song_ids)
+
+        async def process(song_id, meta_info, url_infos):
+            async with semaphore:
+                try:
+                    return await self._hydrate_and_download(
+                        song_id, meta_info, existing_map.get(song_id), url_infos
+                    )
+                except Exception as e:
+                    print(f"  -> 歌曲 (ID: {song_id}) 下载流程出错: {e}")
+                    return False
+
+        failed = 0
+        for start in range(0, total, chunk_size):
+            chunk = song_ids[start : start + chunk_size]
+            metas, urls_by_level = await self._get_chunk_details(chunk, existing_map)
+            for song_id in chunk:
+                if song_id not in metas:
+                    print(f"  -> 歌曲 (ID: {song_id}) 获取元数据失败，跳过。")
+                    failed += 1
+
+            results = await asyncio.gather(
+                *(
+                    process(
+                        song_id,
+                        meta_info,
+                        {
+                            url_level: url_map.get(song_id)
+                            for url_level, url_map in urls_by_level.items()
+                        },
+                    )
+                    for song_id, meta_info in metas.items()
+                )
+            )
+            failed += results.count(False)
+            print(f"{label}: 已处理 {min(start + chunk_size, total)}/{total} 首。")
+            if progress is not None:
+                progress(min(start + chunk_size, total), total)
+        return failed
+
+    async def download_playlist_by_id(
+        self, playlist_id: str, level: str, progress=None
+    ) -> dict:
         """
-        根据歌单ID，将整个歌单的歌曲加入后台下载队列。
+        根据歌单ID，下载整个歌单中本地缺少的歌曲 (下载任务队列的歌单任务)。
+        progress(已完成数, 总数) 用于上报进度，本地已有的歌曲计为已完成。
         """
         data = {"id": playlist_id, "n": 100000, "s": 0}
         response = await self._post_request(APIConstants.PLAYLIST_DETAIL_API, data)
@@ -1038,22 +1660,33 @@ class NeteaseMusicAPI:
 
         print(f"开始处理歌单 '{playlist_info.get('name')}'，共 {total_songs} 首歌曲。")
 
-        # 遍历歌单中的所有歌曲ID
-        for i, song_id in enumerate(track_ids):
-            print(
-                f"  -> 正在将第 {i + 1}/{total_songs} 首歌曲 (ID: {song_id}) 加入队列..."
+        # tracks 中已带有歌手/专辑信息，用它一次性查出整张歌单在本地的已有音质
+        existing_map = await self._prefetch_existing_qualities(
+            playlist_info.get("tracks", [])
+        )
+
+        pending_ids = self._filter_pending_tracks(track_ids, existing_map)
+        skipped = total_songs - len(pending_ids)
+        if progress is not None:
+            progress(skipped, total_songs)
+        label = f"歌单 '{playlist_info.get('name')}'"
+        failed = 0
+        if pending_ids and self.local_api and Config.DOWNLOADS_ENABLED:
+            failed = await self._download_tracks_batched(
+                pending_ids,
+                existing_map,
+                label,
+                self._offset_progress(progress, skipped),
             )
-            # 调用已有的 get_song_details 方法，它会自动触发后台下载线程
-            await self.get_song_details(song_id, level)
-            await asyncio.sleep(1)  # 添加1秒延迟，避免因请求过快被服务器限制
 
-        return {
-            "message": f"歌单 '{playlist_info.get('name')}' 已成功加入下载队列，共 {total_songs} 首歌曲。"
-        }
+        return Utils.download_summary(label, total_songs, skipped, failed)
 
-    async def download_album_by_id(self, album_id: str, level: str) -> dict:
+    async def download_album_by_id(
+        self, album_id: str, level: str, progress=None
+    ) -> dict:
         """
-        根据专辑ID，将整个专辑的歌曲加入后台下载队列。
+        根据专辑ID，下载整张专辑中本地缺少的歌曲 (下载任务队列的专辑任务)。
+        progress(已完成数, 总数) 用于上报进度，本地已有的歌曲计为已完成。
         """
         # 直接调用最可靠的 eapi 专辑接口来获取包含所有歌曲信息的完整响应
         album_response = {}
@@ -1085,29 +1718,67 @@ class NeteaseMusicAPI:
 
         print(f"开始处理专辑 '{album_name}'，共 {total_songs} 首歌曲。")
 
-        # 遍历专辑中的所有歌曲
-        for i, song in enumerate(songs):
-            song_id = str(song["id"])
-            print(
-                f"  -> 正在将第 {i + 1}/{total_songs} 首歌曲 (ID: {song_id}) 加入队列..."
+        existing_map = await self._prefetch_existing_qualities(songs)
+
+        pending_ids = self._filter_pending_tracks(
+            [str(song["id"]) for song in songs], existing_map
+        )
+        skipped = total_songs - len(pending_ids)
+        if progress is not None:
+            progress(skipped, total_songs)
+        label = f"专辑 '{album_name}'"
+        failed = 0
+        if pending_ids and self.local_api and Config.DOWNLOADS_ENABLED:
+            failed = await self._download_tracks_batched(
+                pending_ids,
+                existing_map,
+                label,
+                self._offset_progress(progress, skipped),
             )
-            # 同样调用 get_song_details 来触发下载
-            await self.get_song_details(song_id, level)
-            await asyncio.sleep(1)  # 添加1秒延迟
 
-        return {
-            "message": f"专辑 '{album_name}' 已成功加入下载队列，共 {total_songs} 首歌曲。"
-        }
+        return Utils.download_summary(label, total_songs, skipped, failed)
 
-    async def start_background_playlist_download(self, playlist_id: str, level: str):
-        """启动后台原生协程来执行异步歌单下载任务。"""
-        asyncio.create_task(self.download_playlist_by_id(playlist_id, level))
-        print(f"已为歌单 {playlist_id} 启动后台下载任务。")
+    @staticmethod
+    def _offset_progress(progress, skipped: int):
+        """把流水线的 progress(已处理, 待下载数) 换算成整张歌单/专辑的进度。"""
+        if progress is None:
+            return None
+        return lambda done, total: progress(skipped + done, skipped + total)
 
-    async def start_background_album_download(self, album_id: str, level: str):
-        """启动后台原生协程来执行异步专辑下载任务。"""
-        asyncio.create_task(self.download_album_by_id(album_id, level))
-        print(f"已为专辑 {album_id} 启动后台下载任务。")
+    async def download_song(self, song_id: str, level: str, progress=None) -> dict:
+        """
+        下载单曲 (下载任务队列的单曲任务)。
+
+        优先复用播放请求刚解析好的元数据、歌词与链接；没有时补全元数据、百科与歌词后
+        执行后台下载。
+        """
+        hint = self.song_job_hints.pop((str(song_id), level))
+        if hint is not None:
+            meta_info, lyric, tlyric, existing_qualities, url_infos, wiki_task = hint
+            if wiki_task is not None:
+                ok = await self._download_after_wiki(
+                    wiki_task,
+                    song_id,
+                    meta_info,
+                    lyric,
+                    tlyric,
+                    existing_qualities,
+                    url_infos,
+                )
+            else:
+                ok = await self._background_download_task(
+                    song_id, meta_info, lyric, tlyric, existing_qualities, url_infos
+                )
+        else:
+            meta_data = await self._get_song_metadata(song_id)
+            if not meta_data or not meta_data.get("songs"):
+                return {"error": "获取歌曲元数据失败。"}
+            ok = await self._hydrate_and_download(
+                song_id, meta_data["songs"][0], None, None
+            )
+        if not ok:
+            return {"error": f"歌曲 (ID: {song_id}) 有音质版本下载失败。"}
+        return {"message": f"歌曲 (ID: {song_id}) 下载流程已完成。"}
 
     async def add_songs_to_playlist(
         self, playlist_id: str, song_ids: List[str], user_id: str = None
@@ -1117,7 +1788,9 @@ class NeteaseMusicAPI:
         # 遵循抓包示例：trackIds 是一个 "['id1', 'id2']" 格式的字符串
         track_ids_json_str = json.dumps([str(sid) for sid in song_ids])
         payload = {"pid": str(playlist_id), "trackIds": track_ids_json_str, "op": "add"}
-        response = await self._post_request(url, payload, is_eapi=True, user_id=user_id)
+        response = await self._post_request(
+            url, payload, is_eapi=True, user_id=user_id, coalesce=False
+        )
         return response and response.get("code") == 200
 
     async def remove_songs_from_playlist(
@@ -1128,7 +1801,9 @@ class NeteaseMusicAPI:
         # 遵循抓包示例：trackIds 是一个 "['id1', 'id2']" 格式的字符串
         track_ids_json_str = json.dumps([str(sid) for sid in song_ids])
         payload = {"pid": str(playlist_id), "trackIds": track_ids_json_str, "op": "del"}
-        response = await self._post_request(url, payload, is_eapi=True, user_id=user_id)
+        response = await self._post_request(
+            url, payload, is_eapi=True, user_id=user_id, coalesce=False
+        )
         return response and response.get("code") == 200
 
     async def reorder_playlist(
@@ -1139,7 +1814,9 @@ class NeteaseMusicAPI:
         # 遵循抓包示例：trackIds 是一个 "[id1,id2]" 格式的字符串
         track_ids_str = f"[{','.join([str(sid) for sid in all_song_ids])}]"
         payload = {"pid": str(playlist_id), "trackIds": track_ids_str, "op": "update"}
-        response = await self._post_request(url, payload, is_eapi=True, user_id=user_id)
+        response = await self._post_request(
+            url, payload, is_eapi=True, user_id=user_id, coalesce=False
+        )
         return response and response.get("code") == 200
 
     async def get_daily_recommendations(self, user_id: str = None) -> list | dict:
@@ -1235,8 +1912,10 @@ class NeteaseMusicAPI:
         if mode == "SCENE_RCMD" and sub_mode:
             payload["subMode"] = sub_mode
 
-        # 传递 user_id
-        response = await self._post_request(url, payload, is_eapi=True, user_id=user_id)
+        # 传递 user_id (私人FM每次请求都会推进队列，不合并)
+        response = await self._post_request(
+            url, payload, is_eapi=True, user_id=user_id, coalesce=False
+        )
 
         if not response or response.get("code") != 200:
             return {"error": "获取私人FM数据失败。"}
@@ -1258,6 +1937,7 @@ class NeteaseMusicAPI:
             payload_step1,
             is_eapi=True,
             user_id=user_id,
+            coalesce=False,
         )
         if not save_response or save_response.get("code") != 200:
             return {"error": "设置风格偏好失败。"}
@@ -1271,6 +1951,7 @@ class NeteaseMusicAPI:
             payload_step2,
             is_eapi=True,
             user_id=user_id,
+            coalesce=False,
         )
 
         if not playlist_response or playlist_response.get("code") != 200:
@@ -38,7 +38,11 @@ from mutagen.mp3 import MP3
 from opencc import OpenCC
 
 # --- 您自己的模块导入 ---
+from core.cache import SingleFlight, TTLCache, get_response_cache
 from core.config import Config
+from core.downloader import download_file, download_registry
+from core.metrics import download_metrics
+from utils.helpers import Utils
 
 
 class QQMusicAPI:
@@ -66,7 +70,27 @@ class QQMusicAPI:
             "flac": {"s": "F000", "e": ".flac", "bitrate": "FLAC"},
             "master": {"s": "AI00", "e": ".flac", "bitrate": "Master"},
         }
-        self.album_cache = {}
+        self.album_cache = TTLCache(
+            maxsize=getattr(Config, "ALBUM_CACHE_MAX_ENTRIES", 512),
+            ttl=getattr(Config, "ALBUM_CACHE_TTL", 3600),
+            name="qq_album",
+        )
+        # 等待合并发送的 musicu.fcg 请求，按事件循环区分: loop -> [(payload, future), ...]
+        self._merge_pending = {}
+        self.merge_stats = {"requests": 0, "http_posts": 0}
+        # 合并并发的相同上游请求
+        self.request_flight = SingleFlight("qq_requests")
+        # 持久化的元数据响应缓存 (与其他进程共享同一个缓存文件)
+        self.response_cache = get_response_cache()
+        # 后台下载任务队列 (由 main.py 注入)，未设置时单曲下载直接在后台协程中执行
+        self.job_queue = None
+        # 播放请求已解析好的数据 {(song_mid, level): (info, urls, lyric, tlyric)}，
+        # 供随后的单曲任务直接复用；不存在 (如进程重启或重试) 时任务重新获取
+        self.song_job_hints = TTLCache(
+            maxsize=getattr(Config, "JOB_SONG_HINT_MAX_ENTRIES", 256),
+            ttl=getattr(Config, "JOB_SONG_HINT_TTL", 300),
+            name="qq_song_job_hints",
+        )
         self._setup_logger()
 
     @property
@@ -89,6 +113,18 @@ class QQMusicAPI:
         self.logger = logger
 
     async def _get_request(self, url, params=None):
+        """GET 请求 (歌单/专辑详情等)，并发的相同请求只发送一次。"""
+        flight_key = (
+            "GET",
+            Config.QQ_USER_CONFIG.get("uin", "0"),
+            url,
+            json.dumps(params, sort_keys=True, ensure_ascii=False, default=str),
+        )
+        return await self.request_flight.do(
+            flight_key, lambda: self._send_get_request(url, params)
+        )
+
+    async def _send_get_request(self, url, params=None):
         try:
             response = await self.client.get(
                 url, params=params, headers=self.headers, cookies=Config.QQ_USER_CONFIG
@@ -102,7 +138,124 @@ class QQMusicAPI:
             print(f"QQ音乐GET请求出错: {e}")
             return None
 
-    async def _post_request(self, json_data):
+    def _comm(self) -> dict:
+        """musicu.fcg 的公共参数。各模块统一使用同一份，才能合并到同一个请求中。"""
+        return {
+            "cv": 4747474,
+            "ct": 24,
+            "format": "json",
+            "platform": "yqq.json",
+            "uin": Config.QQ_USER_CONFIG.get("uin", "0"),
+        }
+
+    async def _post_request(self, json_data, merge: bool = True):
+        """
+        向 musicu.fcg 发送请求。
+
+        完全相同的并发请求只发送一次 (SingleFlight)；开启 QQ_MERGE_REQUESTS 时，
+        同一轮事件循环 (或 QQ_MERGE_WINDOW 秒内) 发起、comm 相同的请求会被合并成
+        一次多模块调用，再把各自的 req_N 结果拆分返回。
+        """
+        flight_key = (
+            "POST",
+            Config.QQ_USER_CONFIG.get("uin", "0"),
+            json.dumps(json_data, sort_keys=True, ensure_ascii=False, default=str),
+        )
+        return await self.request_flight.do(
+            flight_key, lambda: self._merge_post_request(json_data, merge)
+        )
+
+    async def _merge_post_request(self, json_data, merge: bool):
+        self.merge_stats["requests"] += 1
+        if not merge or not getattr(Config, "QQ_MERGE_REQUESTS", True):
+            return await self._send_post_request(json_data)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._merge_pending.setdefault(loop, [])
+        pending.append((json_data, future))
+        if len(pending) == 1:
+            window = getattr(Config, "QQ_MERGE_WINDOW", 0.0)
+            if window and window > 0:
+                loop.call_later(window, self._schedule_merge_flush, loop)
+            else:
+                loop.call_soon(self._schedule_merge_flush, loop)
+        return await future
+
+    def _schedule_merge_flush(self, loop):
+        loop.create_task(self._flush_merged_requests(loop))
+
+    async def _flush_merged_requests(self, loop):
+        # 让同一批 gather 中稍晚启动的子任务也能赶上这次合并
+        await asyncio.sleep(0)
+        pending = self._merge_pending.pop(loop, [])
+        groups = {}
+        for payload, future in pending:
+            comm_key = json.dumps(payload.get("comm", {}), sort_keys=True)
+            groups.setdefault(comm_key, []).append((payload, future))
+
+        max_modules = max(1, getattr(Config, "QQ_MERGE_MAX_MODULES", 20))
+        batches = []
+        for entries in groups.values():
+            batch, module_count = [], 0
+            for payload, future in entries:
+                modules = len(payload) - ("comm" in payload)
+                if batch and module_count + modules > max_modules:
+                    batches.append(batch)
+                    batch, module_count = [], 0
+                batch.append((payload, future))
+                module_count += modules
+            batches.append(batch)
+        results = await asyncio.gather(
+            *(self._send_merged_batch(batch) for batch in batches),
+            return_exceptions=True,
+        )
+        # 意外异常要交给等待中的调用者，不能让它们一直挂起
+        for batch, result in zip(batches, results):
+            if isinstance(result, BaseException):
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(result)
+
+    async def _send_merged_batch(self, batch):
+        """发送一组 comm 相同的请求，并把合并后的响应按原始模块名拆回给各调用者。"""
+        if len(batch) == 1:
+            payload, future = batch[0]
+            results = [await self._send_post_request(payload)]
+        else:
+            merged = {"comm": batch[0][0].get("comm", {})}
+            renames = []
+            for payload, _ in batch:
+                rename = {}
+                for key, module in payload.items():
+                    if key == "comm":
+                        continue
+                    merged_key = f"req_{len(merged)}"
+                    merged[merged_key] = module
+                    rename[key] = merged_key
+                renames.append(rename)
+
+            response = await self._send_post_request(merged)
+            results = []
+            for rename in renames:
+                if response is None:
+                    results.append(None)
+                    continue
+                result = {
+                    key: value
+                    for key, value in response.items()
+                    if key not in merged or key == "comm"
+                }
+                for key, merged_key in rename.items():
+                    result[key] = response.get(merged_key, {})
+                results.append(result)
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _send_post_request(self, json_data):
+        self.merge_stats["http_posts"] += 1
         try:
             # safe_json_data = json.loads(json.dumps(json_data, default=list))
             response = await self.client.post(
@@ -141,49 +294,107 @@ class QQMusicAPI:
         print(f"ID解析失败: mid={song_mid}, id={song_id}。响应: {response}")
         return None
 
-    async def _fetch_single_url(self, song_mid, quality, guid, uin):
-        if quality not in self.file_config:
-            return quality, None
-        config = self.file_config[quality]
-        filename = f"{config['s']}{song_mid}{song_mid}{config['e']}"
+    async def _fetch_vkey_urls(self, song_mids: list, qualities: list) -> dict:
+        """
+        一次 CgiGetVkey 请求解析多首歌曲、多个音质的播放链接。
+
+        filename / songmid 两个列表一一对应，每个 (歌曲, 音质) 占一项；
+        返回的 midurlinfo 按 filename 映射回去，结果为 {song_mid: {quality: url}}。
+        请求失败或响应中没有 data 时返回 None (与 "没有版权" 的空字典区分开)。
+        """
+        uin = Config.QQ_USER_CONFIG.get("uin", "0")
+        guid = str(random.randint(1000000000, 9999999999))
+        requested = {}  # filename -> (song_mid, quality)
+        for song_mid in song_mids:
+            for quality in qualities:
+                config = self.file_config[quality]
+                filename = f"{config['s']}{song_mid}{song_mid}{config['e']}"
+                requested[filename] = (song_mid, quality)
         payload = {
             "req_1": {
                 "module": "vkey.GetVkeyServer",
                 "method": "CgiGetVkey",
                 "param": {
-                    "filename": [filename],
+                    "filename": list(requested),
                     "guid": guid,
-                    "songmid": [song_mid],
-                    "songtype": [0],
+                    "songmid": [song_mid for song_mid, _ in requested.values()],
+                    "songtype": [0] * len(requested),
                     "uin": uin,
                     "loginflag": 1,
                     "platform": "20",
                 },
             },
-            "comm": {"uin": uin, "format": "json", "ct": 24, "cv": 0},
+            "comm": self._comm(),
         }
 
         vkey_data = await self._post_request(payload)
-        if vkey_data and vkey_data.get("req_1", {}).get("data", {}).get(
-            "midurlinfo", [{}]
-        )[0].get("purl"):
-            purl = vkey_data["req_1"]["data"]["midurlinfo"][0]["purl"]
-            domain = next(
-                (
-                    d
-                    for d in vkey_data["req_1"]["data"].get("sip", [])
-                    if "pv.music" in d
-                ),
-                "https://isure.stream.qqmusic.qq.com/",
+        data = (vkey_data or {}).get("req_1", {}).get("data", {})
+        if not data:
+            print(f"批量获取播放链接失败 ({len(song_mids)} 首)。响应: {vkey_data}")
+            return None
+        urls = {song_mid: {} for song_mid in song_mids}
+        domain = next(
+            (d for d in data.get("sip", []) if "pv.music" in d),
+            "https://isure.stream.qqmusic.qq.com/",
+        )
+        entries = data.get("midurlinfo", [])
+        for index, entry in enumerate(entries):
+            if not entry.get("purl"):
+                continue
+            # 正常情况下 filename 会原样返回；缺失时按请求顺序对应
+            key = entry.get("filename")
+            if key not in requested and len(entries) == len(requested):
+                key = list(requested)[index]
+            if key in requested:
+                song_mid, quality = requested[key]
+                urls[song_mid][quality] = domain + entry["purl"]
+        return urls
+
+    async def get_song_urls_batch(self, song_mids: list, qualities: list = None):
+        """
+        批量解析多首歌曲的全部音质链接，返回 {song_mid: {quality: url}}。
+
+        每个请求最多包含 QQ_VKEY_BATCH_SIZE 首歌曲，一张歌单只需寥寥数次请求。
+        请求失败的块中的歌曲不出现在结果里，由调用方逐首重新解析。
+        """
+        qualities = [
+            q for q in (qualities or self.file_config) if q in self.file_config
+        ]
+        song_mids = list(dict.fromkeys(mid for mid in song_mids if mid))
+        chunk_size = max(1, getattr(Config, "QQ_VKEY_BATCH_SIZE", 25))
+        chunks = [
+            song_mids[start : start + chunk_size]
+            for start in range(0, len(song_mids), chunk_size)
+        ]
+        if len(chunks) == 1:
+            # 单块时直接等待，使其与同一首歌的详情/歌词请求合并到同一次 HTTP 调用中
+            results = [await self._fetch_vkey_urls(chunks[0], qualities)]
+        else:
+            results = await asyncio.gather(
+                *(self._fetch_vkey_urls(chunk, qualities) for chunk in chunks)
             )
-            return quality, domain + purl
-        return quality, None
+        urls = {}
+        for result in results:
+            urls.update(result or {})
+        return urls
+
+    async def _cached_response(self, endpoint: str, key, fetch):
+        """经持久化响应缓存获取 fetch() 的结果 (未启用缓存时直接请求)。"""
+        if self.response_cache is None:
+            return await fetch()
+        return await self.response_cache.get_or_fetch("qq", endpoint, key, fetch)
 
     async def _get_album_details(self, album_identifier: str) -> dict:
         if not album_identifier:
             return None
-
         album_identifier = str(album_identifier).strip()
+        return await self._cached_response(
+            "album",
+            album_identifier,
+            lambda: self._fetch_album_details(album_identifier),
+        )
+
+    async def _fetch_album_details(self, album_identifier: str) -> dict:
         url = "https://c.y.qq.com/v8/fcg-bin/fcg_v8_album_info_cp.fcg"
         params = {"format": "json", "outCharset": "utf-8"}
 
@@ -207,9 +418,11 @@ class QQMusicAPI:
         image_data, cover_mime = None, None
         album_id = song_info.get("album_mid")
 
-        # 异步预热专辑详情缓存
-        if album_id and album_id not in self.album_cache:
-            self.album_cache[album_id] = await self._get_album_details(album_id)
+        # 异步预热专辑详情缓存 (同专辑的并发任务只会请求一次)
+        if album_id:
+            await self.album_cache.get_or_load(
+                album_id, lambda: self._get_album_details(album_id)
+            )
 
         # 异步下载封面
         if song_info.get("cover_url"):
@@ -248,7 +461,7 @@ class QQMusicAPI:
             composer = song_info.get("composer")
             arranger = song_info.get("arranger")
 
-            # 此函数在线程池中运行，album_cache的访问是线程安全的
+            # 此函数在线程池中运行，album_cache (TTLCache) 的访问是线程安全的
             album_details = self.album_cache.get(album_id)
 
             genre = song_info.get("genre")
@@ -365,6 +578,43 @@ class QQMusicAPI:
 
     async def _download_and_process_single_version(
         self, search_key, quality, download_url, extension, song_info, lyric, tlyric
+    ):
+        """
+        下载并入库单个音质版本。
+
+        同一 (search_key, 专辑, 音质) 已在下载中时 (重复播放、歌单中重复出现的歌曲)，
+        不再发起新的下载，直接等待进行中的任务并返回其结果。
+        """
+        album_name = song_info.get("album_name", "")
+        return await download_registry.do(
+            (search_key, album_name, quality),
+            lambda: download_metrics.track(
+                "qq",
+                search_key,
+                quality,
+                lambda tracker: self._download_single_version(
+                    search_key,
+                    quality,
+                    download_url,
+                    extension,
+                    song_info,
+                    lyric,
+                    tlyric,
+                    tracker,
+                ),
+            ),
+        )
+
+    async def _download_single_version(
+        self,
+        search_key,
+        quality,
+        download_url,
+        extension,
+        song_info,
+        lyric,
+        tlyric,
+        tracker,
     ):
         """异步下载，并将所有元数据写入数据库。"""
         album_name = song_info.get("album_name", "")
@@ -392,29 +642,30 @@ class QQMusicAPI:
                 print(
                     f"后台任务: 开始下载 '{base_name}' ({quality}) (第 {attempt + 1} 次尝试)"
                 )
-                async with self.client.stream(
-                    "GET",
-                    download_url,
-                    timeout=300,
-                    headers=self.headers,
-                    cookies=Config.QQ_USER_CONFIG,
-                ) as r:
-                    r.raise_for_status()
-                    with open(file_path, "wb") as f:
-                        async for chunk in r.aiter_bytes(chunk_size=8192):
-                            f.write(chunk)
+                # 先写入 .part，断线时按 Range 续传，下完才改名为正式文件
+                with tracker.stage("transfer"):
+                    await download_file(
+                        self.client,
+                        download_url,
+                        file_path,
+                        headers=self.headers,
+                        cookies=Config.QQ_USER_CONFIG,
+                        timeout=300,
+                        tracker=tracker,
+                    )
 
                 print(f"后台任务: 下载成功 - {file_path}")
 
                 # 嵌入元数据到文件，并获取封面数据
-                image_data, cover_mime = await self._embed_metadata(
-                    file_path, song_info, lyric, tlyric
-                )
+                with tracker.stage("embed_metadata"):
+                    image_data, cover_mime = await self._embed_metadata(
+                        file_path, song_info, lyric, tlyric
+                    )
                 # print(f"song_info: {song_info}")
 
                 # 从预热好的缓存中取回专辑附加信息，用于补全数据库
                 album_id = song_info.get("album_mid")
-                album_details = self.album_cache.get(album_id, {})
+                album_details = self.album_cache.get(album_id) or {}
 
                 # 解析发行日期
                 publish_time_str = album_details.get("aDate")
@@ -454,36 +705,41 @@ class QQMusicAPI:
                 print(f"db_song_info: {db_song_info}")
 
                 # 入库
-                await run_in_threadpool(
-                    self.local_api.add_song_to_db,
-                    song_info=db_song_info,  # 传入刚组装好的标准字典
-                    file_path=file_path,
-                    quality=quality,
-                    lyric=lyric,
-                    tlyric=tlyric,
-                    cover_data=image_data,
-                    cover_mime=cover_mime,
-                )
+                with tracker.stage("db_insert"):
+                    await run_in_threadpool(
+                        self.local_api.add_song_to_db,
+                        song_info=db_song_info,  # 传入刚组装好的标准字典
+                        file_path=file_path,
+                        quality=quality,
+                        lyric=lyric,
+                        tlyric=tlyric,
+                        cover_data=image_data,
+                        cover_mime=cover_mime,
+                    )
                 return True
             except httpx.RequestError as e:
                 print(
                     f"后台任务: 下载 '{search_key}' 失败 (第 {attempt + 1} 次尝试)，错误: {e}"
                 )
                 if attempt < max_retries - 1:
+                    tracker.retries += 1
                     await asyncio.sleep(5)
                 else:
                     self.logger.error(
                         f"歌曲下载失败 - MID: {song_info.get('mid')}, 名称: '{search_key}', 音质: {quality}, 错误: {e}"
                     )
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
+                    # 保留 .part 与进度文件，下次下载同一首歌时从断点继续
                     return False
         return False
 
     async def _background_download_task(
         self, song_info: dict, song_urls: dict, lyric: str, tlyric: str
     ):
-        """完全解耦的异步后台智能分层下载任务（严格模式 + 真正的兜底）。"""
+        """
+        完全解耦的异步后台智能分层下载任务（严格模式 + 真正的兜底）。
+        返回本次尝试的音质版本是否全部下载成功；仍有需要的音质却没有拿到任何可用链接时
+        返回 False，由下载任务队列重试。
+        """
         album_name = song_info.get("album_name", "")
         artist_string = song_info.get("artist", "未知歌手")
         song_name = song_info.get("name", "未知歌曲")
@@ -567,13 +823,68 @@ class QQMusicAPI:
                     )
 
         if tasks:
-            await asyncio.gather(*tasks)
-        else:
-            print(f"后台任务: '{search_key}' 命中严格模式，没有需要下载的音质版本。")
+            return all(await asyncio.gather(*tasks))
+        pending = Utils.pending_qualities(
+            existing_qualities, enable_master, enable_flac, enable_lossy
+        )
+        if pending:
+            print(f"后台任务: '{search_key}' 仍需要 {pending} 音质，但没有可用的链接。")
+            return False
+        print(f"后台任务: '{search_key}' 命中严格模式，没有需要下载的音质版本。")
+        return True
+
+    def _has_pending_quality(self, existing_qualities: list) -> bool:
+        """按当前下载开关判断该曲目是否还有需要下载的音质。"""
+        return Utils.has_pending_quality(
+            existing_qualities,
+            getattr(Config, "ENABLE_MASTER_DOWNLOAD", True),
+            getattr(Config, "ENABLE_FLAC_DOWNLOAD", False),
+            getattr(Config, "ENABLE_LOSSY_DOWNLOAD", False),
+        )
+
+    async def _prefetch_existing_qualities(self, song_list: list) -> dict:
+        """
+        歌单/专辑下载前一次性查询所有曲目在本地库中的已有音质。
+
+        兼容新旧两种列表格式 (name/singer/album 与 songname/singer/albumname)，
+        返回 {str(song_id): [quality, ...]}。
+        """
+        if not self.local_api:
+            return {}
+        keys_by_id = {}
+        for song in song_list:
+            song_id = song.get("id") or song.get("songid")
+            song_name = song.get("name") or song.get("songname")
+            if not song_id or not song_name:
+                continue
+            artist_string = "、".join(
+                [singer.get("name", "") for singer in song.get("singer", [])]
+            )
+            album = song.get("album")
+            album_name = (
+                album.get("name") if isinstance(album, dict) else song.get("albumname")
+            )
+            search_key = self.converter.convert(f"{artist_string} - {song_name}")
+            keys_by_id[str(song_id)] = (search_key, album_name or "")
+        if not keys_by_id:
+            return {}
+        qualities_by_key = await run_in_threadpool(
+            self.local_api.get_existing_qualities_batch, list(keys_by_id.values())
+        )
+        return {
+            song_id: qualities_by_key.get(key, [])
+            for song_id, key in keys_by_id.items()
+        }
 
     async def get_song_info(self, song_mid):
+        """获取歌曲详情 (持久化缓存)。"""
+        return await self._cached_response(
+            "song_detail", song_mid, lambda: self._fetch_song_info(song_mid)
+        )
+
+    async def _fetch_song_info(self, song_mid):
         payload = {
-            "comm": {"cv": 4747474, "ct": 24, "format": "json", "platform": "yqq.json"},
+            "comm": self._comm(),
             "req_1": {
                 "module": "music.pf_song_detail_svr",
                 "method": "get_song_detail",
@@ -615,18 +926,20 @@ class QQMusicAPI:
         }
 
     async def get_song_urls(self, song_mid):
-        uin = Config.QQ_USER_CONFIG.get("uin", "0")
-        guid = str(random.randint(1000000000, 9999999999))
-        tasks = [
-            self._fetch_single_url(song_mid, quality, guid, uin)
-            for quality in self.file_config.keys()
-        ]
-        results = await asyncio.gather(*tasks)
-        return {quality: url for quality, url in results if url}
+        """解析单首歌曲的全部音质链接 {quality: url}，请求失败时返回 None。"""
+        urls = await self.get_song_urls_batch([song_mid])
+        return urls.get(song_mid)
 
     async def get_lyrics(self, song_id):
+        """获取歌词与翻译，返回 (lyric, tlyric) (持久化缓存)。"""
+        result = await self._cached_response(
+            "lyric", song_id, lambda: self._fetch_lyrics(song_id)
+        )
+        return tuple(result) if result else ("", "")
+
+    async def _fetch_lyrics(self, song_id):
         payload = {
-            "comm": {"cv": 4747474, "ct": 24, "format": "json", "platform": "yqq.json"},
+            "comm": self._comm(),
             "req_1": {
                 "module": "music.musichallSong.PlayLyricInfo",
                 "method": "GetPlayLyricInfo",
@@ -635,22 +948,45 @@ class QQMusicAPI:
         }
         lyric_data = await self._post_request(payload)
         if not lyric_data or lyric_data.get("code") != 0:
-            return "", ""
+            return None
         lyric_info = lyric_data.get("req_1", {}).get("data", {})
         lyric = base64.b64decode(lyric_info.get("lyric", b"")).decode("utf-8", "ignore")
         tlyric = base64.b64decode(lyric_info.get("trans", b"")).decode(
             "utf-8", "ignore"
         )
-        return lyric, tlyric
+        return [lyric, tlyric]
 
-    async def get_song_details(self, song_mid: str = None, song_id: int = None):
+    async def get_song_details(
+        self,
+        song_mid: str = None,
+        song_id: int = None,
+        urls: dict = None,
+        wait_download: bool = False,
+        level: str = None,
+    ):
+        """
+        获取歌曲详情与各音质链接，并触发后台下载。
+
+        urls 可由歌单/专辑下载批量解析后传入 ({quality: url})，省去单独的 vkey 请求。
+        level 为调用方请求的音质，只记录在下载任务中 (实际下载哪些音质由下载开关决定)。
+        wait_download 为 True 时 (下载任务队列中执行) 等下载完成再返回，有音质版本
+        下载失败时返回带 "error" 的字典；否则交给下载任务队列 (未注入时为后台协程)。
+        """
         resolved_ids = await self._resolve_song_ids(song_mid=song_mid, song_id=song_id)
         if not resolved_ids or not resolved_ids.get("mid"):
             return {"error": "无法解析到有效的歌曲信息。"}
         final_mid, final_id = resolved_ids.get("mid"), resolved_ids.get("id")
 
         info_task = self.get_song_info(final_mid)
-        urls_task = self.get_song_urls(final_mid)
+        if urls is not None and final_mid == song_mid:
+            urls_task = asyncio.sleep(0, result=urls)
+        elif wait_download:
+            # 下载任务中解析链接的耗时计入下载指标 (交互式播放请求不计入)
+            urls_task = download_metrics.measure(
+                "url_fetch", self.get_song_urls(final_mid)
+            )
+        else:
+            urls_task = self.get_song_urls(final_mid)
         lyric_task = (
             self.get_lyrics(final_id) if final_id else asyncio.sleep(0, result=("", ""))
         )
@@ -660,15 +996,33 @@ class QQMusicAPI:
         )
         if not info:
             return {"error": "获取详细信息失败。"}
+        if urls is None and wait_download:
+            # 链接解析请求本身失败 (而不是没有版权)，计为下载失败，由任务队列重试
+            return {"error": f"解析歌曲 (MID: {final_mid}) 的播放链接失败。"}
+        urls = urls or {}
 
         if self.local_api and Config.DOWNLOADS_ENABLED:
-            asyncio.create_task(
-                self._background_download_task(info, urls, lyric, tlyric)
-            )
+            if wait_download:
+                if not await self._background_download_task(info, urls, lyric, tlyric):
+                    return {
+                        "error": f"歌曲 '{info.get('name')}' (MID: {final_mid}) 有音质版本下载失败。"
+                    }
+            elif self.job_queue is not None:
+                if urls:
+                    self.song_job_hints.set(
+                        (final_mid, level), (info, urls, lyric, tlyric)
+                    )
+                await self.job_queue.enqueue("qq", "song", final_mid, level)
+            else:
+                asyncio.create_task(
+                    self._background_download_task(info, urls, lyric, tlyric)
+                )
 
         return {**info, "urls": urls, "lyric": lyric, "tlyric": tlyric}
 
-    async def search_and_get_details(self, keyword: str, album: str = None):
+    async def search_and_get_details(
+        self, keyword: str, album: str = None, level: str = None
+    ):
         payload = {
             "comm": {"cv": 4747474, "ct": 24, "format": "json", "platform": "yqq.json"},
             "req_1": {
@@ -714,7 +1068,9 @@ class QQMusicAPI:
         if not best_match_song:
             return {"error": "未能找到精确匹配的歌曲"}
         return await self.get_song_details(
-            song_mid=best_match_song.get("mid"), song_id=best_match_song.get("id")
+            song_mid=best_match_song.get("mid"),
+            song_id=best_match_song.get("id"),
+            level=level,
         )
 
     async def get_playlist_info(self, playlist_id: str) -> dict:
@@ -744,7 +1100,30 @@ class QQMusicAPI:
         ]
         return {"playlist_name": playlist_name, "songs": songs}
 
-    async def download_playlist_by_id(self, playlist_id: str, level: str):
+    async def _iter_with_batched_urls(self, pending: list):
+        """
+        按 QQ_VKEY_BATCH_SIZE 分块为待下载曲目批量解析链接，逐首产出 (序号, ID, MID, urls)。
+
+        链接按块解析而不是整单一次解析，避免排在后面的歌曲拿到过期的 vkey；
+        缺少 MID 或所在块解析失败的曲目 urls 为 None，由 get_song_details 单独解析。
+        """
+        chunk_size = max(1, getattr(Config, "QQ_VKEY_BATCH_SIZE", 25))
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start : start + chunk_size]
+            with download_metrics.timed("url_fetch"):
+                urls_by_mid = await self.get_song_urls_batch(
+                    [song_mid for _, _, song_mid in chunk]
+                )
+            for i, song_id, song_mid in chunk:
+                yield i, song_id, song_mid, urls_by_mid.get(song_mid)
+
+    async def download_playlist_by_id(
+        self, playlist_id: str, level: str, progress=None
+    ):
+        """
+        下载歌单中本地缺少的歌曲 (下载任务队列的歌单任务)，逐首等待下载完成。
+        progress(已完成数, 总数) 用于上报进度，本地已有的歌曲计为已完成。
+        """
         url = "https://c.y.qq.com/v8/fcg-bin/fcg_v8_playlist_cp.fcg"
         params = {
             "id": playlist_id,
@@ -757,35 +1136,69 @@ class QQMusicAPI:
         response = await self._get_request(url, params=params)
         if not response or response.get("code", -1) != 0:
             print("错误: 获取歌单详情失败。")
-            return
+            return {"error": f"获取歌单 (ID: {playlist_id}) 详情失败。"}
         cdlist = response.get("data", {}).get("cdlist", [])
         if not cdlist:
             print("歌单中没有找到任何歌曲。")
-            return
+            return {"error": f"歌单 (ID: {playlist_id}) 中没有找到任何歌曲。"}
         playlist_data = cdlist[0]
         playlist_name = playlist_data.get("dissname", "未知歌单")
         song_ids_str = playlist_data.get("songids")
         if not song_ids_str:
             print("歌单中没有找到任何歌曲。")
-            return
+            return {"error": f"歌单 '{playlist_name}' 中没有找到任何歌曲。"}
         song_id_list = song_ids_str.split(",")
         total_songs = len(song_id_list)
         print(f"开始处理歌单 '{playlist_name}'，共 {total_songs} 首歌曲。")
+        # 一次性查出本地已有音质，已满足下载要求的曲目直接跳过，不再请求详情
+        song_list = playlist_data.get("songlist", [])
+        existing_map = await self._prefetch_existing_qualities(song_list)
+        mid_by_id = {
+            str(song.get("id") or song.get("songid")): song.get("mid")
+            or song.get("songmid")
+            for song in song_list
+        }
+        pending = []
         for i, song_id_str in enumerate(song_id_list):
-            try:
-                song_id = int(song_id_str)
+            song_id_str = song_id_str.strip()
+            existing_qualities = existing_map.get(song_id_str)
+            if existing_qualities is not None and not self._has_pending_quality(
+                existing_qualities
+            ):
                 print(
-                    f"  -> 正在将第 {i + 1}/{total_songs} 首歌曲 (ID: {song_id}) 加入队列..."
+                    f"  -> 第 {i + 1}/{total_songs} 首歌曲 (ID: {song_id_str}) 本地已有 {existing_qualities}，跳过。"
                 )
-                await self.get_song_details(song_id=song_id)
-                await asyncio.sleep(1)
+                continue
+            try:
+                pending.append((i, int(song_id_str), mid_by_id.get(song_id_str)))
             except (ValueError, TypeError):
                 continue
+
+        skipped = total_songs - len(pending)
+        if progress is not None:
+            progress(skipped, total_songs)
+        done = failed = 0
+        async for i, song_id, song_mid, urls in self._iter_with_batched_urls(pending):
+            print(f"  -> 正在下载第 {i + 1}/{total_songs} 首歌曲 (ID: {song_id})...")
+            result = await self.get_song_details(
+                song_mid=song_mid, song_id=song_id, urls=urls, wait_download=True
+            )
+            failed += "error" in result
+            done += 1
+            if progress is not None:
+                progress(skipped + done, total_songs)
         print(f"歌单 '{playlist_name}' 处理完毕。")
+        return Utils.download_summary(
+            f"歌单 '{playlist_name}'", total_songs, skipped, failed
+        )
 
-    async def download_album(self, album_identifier: str, level: str):
+    async def download_album(self, album_identifier: str, level: str, progress=None):
+        """
+        下载专辑中本地缺少的歌曲 (下载任务队列的专辑任务)，支持纯数字 ID 或字符串 MID。
+        progress(已完成数, 总数) 用于上报进度，本地已有的歌曲计为已完成。
+        """
         if not album_identifier:
-            return
+            return {"error": "缺少专辑 ID 或 MID。"}
 
         album_mid = str(album_identifier).strip()
         url = "https://c.y.qq.com/v8/fcg-bin/fcg_v8_album_info_cp.fcg"
@@ -801,7 +1214,7 @@ class QQMusicAPI:
         # print(f"专辑信息：{response}")
         if not response or response.get("code", -1) != 0:
             print("错误: 获取专辑详情失败。")
-            return
+            return {"error": f"获取专辑 ({album_identifier}) 详情失败。"}
 
         song_list = response.get("data", {}).get("list", [])
         album_name = response.get("data", {}).get("name", "未知专辑")
@@ -809,22 +1222,51 @@ class QQMusicAPI:
 
         if total_songs == 0:
             print("专辑中没有找到任何歌曲。")
-            return
+            return {"error": f"专辑 ({album_identifier}) 中没有找到任何歌曲。"}
 
         print(f"开始处理专辑 '{album_name}'，共 {total_songs} 首歌曲。")
+        existing_map = await self._prefetch_existing_qualities(song_list)
+        pending = []
         for i, song in enumerate(song_list):
-            await self.get_song_details(
-                song_mid=song.get("songmid"), song_id=song.get("songid")
+            existing_qualities = existing_map.get(str(song.get("songid")))
+            if existing_qualities is not None and not self._has_pending_quality(
+                existing_qualities
+            ):
+                print(
+                    f"  -> 第 {i + 1}/{total_songs} 首歌曲 '{song.get('songname')}' 本地已有 {existing_qualities}，跳过。"
+                )
+                continue
+            pending.append((i, song.get("songid"), song.get("songmid")))
+
+        skipped = total_songs - len(pending)
+        if progress is not None:
+            progress(skipped, total_songs)
+        done = failed = 0
+        async for _, song_id, song_mid, urls in self._iter_with_batched_urls(pending):
+            result = await self.get_song_details(
+                song_mid=song_mid, song_id=song_id, urls=urls, wait_download=True
             )
-            await asyncio.sleep(1)
+            failed += "error" in result
+            done += 1
+            if progress is not None:
+                progress(skipped + done, total_songs)
         print(f"专辑 '{album_name}' 处理完毕。")
+        return Utils.download_summary(
+            f"专辑 '{album_name}'", total_songs, skipped, failed
+        )
 
-    async def start_background_playlist_download(self, playlist_id: str, level: str):
-        """启动后台原生协程来执行异步歌单下载任务。"""
-        asyncio.create_task(self.download_playlist_by_id(playlist_id, level))
-        print(f"已为歌单 {playlist_id} 启动后台下载任务。")
-
-    async def start_background_album_download(self, album_identifier: str, level: str):
-        """启动后台原生协程来执行异步专辑下载任务。支持纯数字 ID 或字符串 MID。"""
-        asyncio.create_task(self.download_album(album_identifier, level))
-        print(f"已为专辑 {album_identifier} 启动后台下载任务。")
+    async def download_song(self, song_mid: str, level: str, progress=None) -> dict:
+        """
+        下载单曲 (下载任务队列的单曲任务)，等下载完成再返回。
+
+        优先复用播放请求刚解析好的详情、链接与歌词，没有时重新获取。
+        """
+        hint = self.song_job_hints.pop((str(song_mid), level))
+        if hint is None:
+            return await self.get_song_details(song_mid=song_mid, wait_download=True)
+        info, urls, lyric, tlyric = hint
+        if not await self._background_download_task(info, urls, lyric, tlyric):
+            return {
+                "error": f"歌曲 '{info.get('name')}' (MID: {song_mid}) 有音质版本下载失败。"
+            }
+        return {**info, "urls": urls, "lyric": lyric, "tlyric": tlyric}
@@ -0,0 +1,112 @@
+"""
+微基准：对比 "每次查询新建连接" 与 "按线程复用 WAL 连接" 的单次查询开销。
+
+用法:
+    python benchmarks/bench_db_connections.py --songs 20000 --queries 5000 --threads 4
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.local import LocalMusicAPI  # noqa: E402
+
+
+def populate(db_file: str, total: int):
+    """生成一个包含 total 首歌曲的合成曲库。"""
+    api = LocalMusicAPI(db_file)
+    conn = api.pool.get_connection()
+    conn.executemany(
+        "INSERT INTO songs (file_path, search_key, quality, album, artist, title) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (
+                f"/music/{i}.flac",
+                f"歌手{i % 500} - 歌曲{i}",
+                "flac",
+                f"专辑{i % 2000}",
+                f"歌手{i % 500}",
+                f"歌曲{i}",
+            )
+            for i in range(total)
+        ),
+    )
+    conn.commit()
+    return api
+
+
+def legacy_query(db_file: str, song_id: int):
+    """旧实现：每次调用都 open -> PRAGMA -> 查询 -> close。"""
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    conn.row_factory = sqlite3.Row
+    row = conn.execute(
+        "SELECT file_path FROM songs WHERE id = ?", (song_id,)
+    ).fetchone()
+    conn.close()
+    return row
+
+
+def pooled_query(api: LocalMusicAPI, song_id: int):
+    """新实现：复用当前线程的连接。"""
+    return api.get_song_path_by_id(song_id)
+
+
+def run(label: str, fn, queries: int, threads: int, total_songs: int):
+    per_thread = queries // threads
+
+    def worker(offset):
+        for i in range(per_thread):
+            fn((offset + i * 7) % total_songs + 1)
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    done = per_thread * threads
+    print(
+        f"{label:<28} {done:>7} 次查询  总耗时 {elapsed:7.3f}s  "
+        f"单次 {elapsed / done * 1e6:8.1f}µs  吞吐 {done / elapsed:9.0f} qps"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 连接复用微基准")
+    parser.add_argument("--songs", type=int, default=20000, help="合成曲库大小")
+    parser.add_argument("--queries", type=int, default=5000, help="查询总次数")
+    parser.add_argument("--threads", type=int, default=4, help="并发线程数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "bench.db")
+        api = populate(db_file, args.songs)
+        print(f"合成曲库: {args.songs} 首歌曲, 线程数: {args.threads}\n")
+
+        legacy = run(
+            "每次新建连接 (旧)",
+            lambda sid: legacy_query(db_file, sid),
+            args.queries,
+            args.threads,
+            args.songs,
+        )
+        pooled = run(
+            "线程复用 WAL 连接 (新)",
+            lambda sid: pooled_query(api, sid),
+            args.queries,
+            args.threads,
+            args.songs,
+        )
+        print(f"\n加速比: {legacy / pooled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
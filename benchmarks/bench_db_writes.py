@@ -0,0 +1,138 @@
+"""
+微基准：对比 "每首歌单独提交" 与 "单写线程组提交" 的批量入库吞吐。
+
+三种写法写入同样的合成歌曲 (songs + covers + lyrics):
+  - 逐条提交 (旧):   多个线程各自用复用的 WAL 连接写入并 commit，互相争抢写锁
+  - 写队列 (同步等待): 多个线程调用 add_song_to_db，由写线程合并提交
+  - 写队列 (批量提交): 单线程连续 submit_song，最后统一等待 (扫描器的用法)
+
+用法:
+    python benchmarks/bench_db_writes.py --songs 5000 --threads 8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.local import LocalMusicAPI  # noqa: E402
+
+FILE_STAT = {"file_size": 10_000_000, "mtime": 0.0, "inode": 0}
+
+
+def make_song(i: int):
+    song_info = {
+        "search_key": f"歌手{i % 500} - 歌曲{i}",
+        "album": f"专辑{i % 2000}",
+        "artist": f"歌手{i % 500}",
+        "title": f"歌曲{i}",
+        "duration_ms": 240000,
+    }
+    # 每张专辑共用一张 ~30KB 的封面
+    cover = (f"cover-{i % 2000}".encode() * 3000)[:30000]
+    return song_info, f"/music/{i}.flac", "flac", f"[00:00.00]歌词{i}", None, cover
+
+
+def legacy_worker(api: LocalMusicAPI, songs):
+    """旧写法：在调用线程中直接写入并逐条提交。"""
+    conn = api.pool.get_connection()
+    for song_info, file_path, quality, lyric, tlyric, cover in songs:
+        cursor = conn.cursor()
+        try:
+            api._insert_song(
+                cursor,
+                song_info,
+                file_path,
+                quality,
+                lyric,
+                tlyric,
+                cover,
+                "image/jpeg",
+                FILE_STAT,
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def queued_worker(api: LocalMusicAPI, songs):
+    """每次调用都同步等待结果 (下载任务的用法)。"""
+    for song_info, file_path, quality, lyric, tlyric, cover in songs:
+        api.add_song_to_db(
+            song_info, file_path, quality, lyric, tlyric, cover, "image/jpeg"
+        )
+
+
+def run_threads(worker, api, songs, threads: int) -> float:
+    chunks = [songs[t::threads] for t in range(threads)]
+    workers = [threading.Thread(target=worker, args=(api, chunk)) for chunk in chunks]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - start
+
+
+def run_bulk(api: LocalMusicAPI, songs) -> float:
+    start = time.perf_counter()
+    futures = [
+        api.submit_song(
+            song_info, file_path, quality, lyric, tlyric, cover, "image/jpeg", FILE_STAT
+        )
+        for song_info, file_path, quality, lyric, tlyric, cover in songs
+    ]
+    for future in futures:
+        future.result()
+    return time.perf_counter() - start
+
+
+def report(label: str, elapsed: float, total: int):
+    print(
+        f"{label:<24} {total:>7} 首  总耗时 {elapsed:7.3f}s  "
+        f"吞吐 {total / elapsed:9.0f} 首/秒"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 组提交写入吞吐微基准")
+    parser.add_argument("--songs", type=int, default=5000, help="写入的歌曲数量")
+    parser.add_argument("--threads", type=int, default=8, help="并发写入线程数")
+    args = parser.parse_args()
+
+    songs = [make_song(i) for i in range(args.songs)]
+    print(f"合成歌曲: {args.songs} 首, 并发线程: {args.threads}\n")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 屏蔽 add_song_to_db 的逐条日志，避免打印本身成为瓶颈
+        with contextlib.redirect_stdout(io.StringIO()):
+            api = LocalMusicAPI(os.path.join(tmp_dir, "legacy.db"))
+            results["legacy"] = run_threads(legacy_worker, api, songs, args.threads)
+
+            api = LocalMusicAPI(os.path.join(tmp_dir, "queued.db"))
+            results["queued"] = run_threads(queued_worker, api, songs, args.threads)
+            api.writer.close()
+
+            api = LocalMusicAPI(os.path.join(tmp_dir, "bulk.db"))
+            results["bulk"] = run_bulk(api, songs)
+            api.writer.close()
+
+    report("逐条提交 (旧)", results["legacy"], args.songs)
+    report("写队列 同步等待 (新)", results["queued"], args.songs)
+    report("写队列 批量提交 (新)", results["bulk"], args.songs)
+    print(
+        f"\n加速比: 同步等待 {results['legacy'] / results['queued']:.1f}x, "
+        f"批量提交 {results['legacy'] / results['bulk']:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
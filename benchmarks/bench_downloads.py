@@ -0,0 +1,211 @@
+"""
+微基准：对比 "旧的整文件流式下载" 与 "断点续传 / 分段并发下载" 在不稳定网络下的表现。
+
+本地起一个支持 Range 的 HTTP 服务模拟音源 CDN：每个连接限速 (--rate)，并按平均
+每传输 --drop-mb MB 断开一次连接的概率随机掐断。三种写法下载同一个文件:
+  - 旧写法:     8KB 块写入目标文件，出错后从零重新下载，最多 --legacy-retries 次
+  - 断点续传:   core.downloader，单连接，断线后用 Range 从已写位置继续
+  - 分段并发:   core.downloader，按 DOWNLOAD_SEGMENTS 拆成多段并发下载
+
+用法:
+    python benchmarks/bench_downloads.py --size-mb 120 --rate 40 --drop-mb 30
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from core.config import Config  # noqa: E402
+from core.downloader import download_file  # noqa: E402
+
+
+class FlakyServer:
+    """支持 Range 的本地文件服务，按概率掐断连接并限制单连接速率。"""
+
+    def __init__(self, data: bytes, rate_mb: float, drop_mb: float, seed: int):
+        self.data = data
+        self.rate = rate_mb * 1024 * 1024
+        self.drop_bytes = drop_mb * 1024 * 1024
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.requests = 0
+        self.drops = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/song.flac"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset_counters(self):
+        self.bytes_sent = self.requests = self.drops = 0
+
+    def handle(self, handler):
+        size = len(self.data)
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", handler.headers.get("Range", ""))
+        with self.lock:
+            self.requests += 1
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start >= size:
+                handler.send_response(416)
+                handler.send_header("Content-Range", f"bytes */{size}")
+                handler.send_header("Content-Length", "0")
+                handler.end_headers()
+                return
+            handler.send_response(206)
+            handler.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            handler.send_response(200)
+        handler.send_header("Accept-Ranges", "bytes")
+        handler.send_header("Content-Length", str(end - start + 1))
+        handler.end_headers()
+
+        piece = 65536
+        pos = start
+        try:
+            while pos <= end:
+                chunk = self.data[pos : min(pos + piece, end + 1)]
+                with self.lock:
+                    drop = self.rng.random() < len(chunk) / self.drop_bytes
+                if drop and end - start > piece:
+                    with self.lock:
+                        self.drops += 1
+                    handler.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                handler.wfile.write(chunk)
+                pos += len(chunk)
+                with self.lock:
+                    self.bytes_sent += len(chunk)
+                time.sleep(len(chunk) / self.rate)
+        except OSError:
+            pass
+
+
+async def legacy_download(client, url, file_path, retries):
+    """旧写法：与原 _download_and_process_single_version 相同，失败后从零重来。"""
+    for attempt in range(retries):
+        try:
+            async with client.stream("GET", url, timeout=300) as r:
+                r.raise_for_status()
+                with open(file_path, "wb") as f:
+                    async for chunk in r.aiter_bytes(chunk_size=8192):
+                        f.write(chunk)
+            return True
+        except httpx.RequestError:
+            if attempt == retries - 1:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                return False
+    return False
+
+
+async def resumable_download(client, url, file_path):
+    try:
+        await download_file(client, url, file_path, timeout=300)
+        return True
+    except httpx.RequestError:
+        return False
+
+
+def run_case(name, server, digest, coro_factory, file_path):
+    server.reset_counters()
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+    async def main():
+        async with httpx.AsyncClient() as client:
+            return await coro_factory(client)
+
+    start = time.perf_counter()
+    ok = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    valid = False
+    if ok and os.path.exists(file_path):
+        with open(file_path, "rb") as f:
+            valid = hashlib.sha256(f.read()).hexdigest() == digest
+    size_mb = len(server.data) / 1024 / 1024
+    print(
+        f"{name:<10} {'成功' if valid else '失败':<4} {elapsed:8.2f}s  "
+        f"{size_mb / elapsed if valid else 0:7.1f} MB/s  "
+        f"传输 {server.bytes_sent / 1024 / 1024:8.1f} MB  "
+        f"请求 {server.requests:4d}  断线 {server.drops:3d}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=120)
+    parser.add_argument("--rate", type=float, default=40, help="单连接限速 MB/s")
+    parser.add_argument(
+        "--drop-mb", type=float, default=30, help="平均每传输多少 MB 断线一次"
+    )
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--legacy-retries", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    Config.DOWNLOAD_RETRY_DELAY = 0.05
+    data = os.urandom(int(args.size_mb * 1024 * 1024))
+    digest = hashlib.sha256(data).hexdigest()
+    server = FlakyServer(data, args.rate, args.drop_mb, args.seed)
+    print(
+        f"文件 {args.size_mb:.0f} MB，单连接限速 {args.rate} MB/s，平均每 {args.drop_mb} MB 断线一次"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, "song.flac")
+        run_case(
+            "旧写法",
+            server,
+            digest,
+            lambda c: legacy_download(c, server.url, file_path, args.legacy_retries),
+            file_path,
+        )
+        Config.DOWNLOAD_SEGMENTS = 1
+        run_case(
+            "断点续传",
+            server,
+            digest,
+            lambda c: resumable_download(c, server.url, file_path),
+            file_path,
+        )
+        Config.DOWNLOAD_SEGMENTS = args.segments
+        run_case(
+            f"分段x{args.segments}",
+            server,
+            digest,
+            lambda c: resumable_download(c, server.url, file_path),
+            file_path,
+        )
+    server.httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
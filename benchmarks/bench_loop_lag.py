@@ -0,0 +1,200 @@
+"""
+微基准：多个 master 下载同时进行时，事件循环的延迟 (即同一进程中 API 的响应延迟)。
+
+本地起一个 HTTP 服务模拟音源 CDN (见 bench_downloads.FlakyServer，不注入断线)，并把
+文件写入替换为 "慢磁盘"：按 --disk-mbps 的速度写，每写 --stall-every-mb MB 再卡顿
+--stall-ms 毫秒 (模拟脏页回写)。同一事件循环中运行一个 TCP 回显服务代表 API，
+由独立线程每 10ms 请求一次并记录往返延迟；同时记录 asyncio.sleep 的超时量 (loop lag)。
+
+三种场景:
+  - 空闲:       没有下载
+  - 同步写盘:   旧写法，在事件循环中直接 f.write(8KB 块)
+  - 写后缓冲:   core.downloader，写盘交给写盘线程
+
+用法:
+    python benchmarks/bench_loop_lag.py --downloads 4 --size-mb 100
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+import core.downloader  # noqa: E402
+from bench_downloads import FlakyServer  # noqa: E402
+from core.config import Config  # noqa: E402
+
+
+class SlowDisk:
+    """按吞吐量限速、并周期性卡顿的文件写入包装。"""
+
+    def __init__(self, mbps: float, stall_ms: float, stall_every_mb: float):
+        self.rate = mbps * 1024 * 1024
+        self.stall = stall_ms / 1000
+        self.stall_every = stall_every_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.dirty = 0
+
+    def open(self, path, mode="r", *args, **kwargs):
+        f = open(path, mode, *args, **kwargs)
+        return SlowFile(f, self) if "b" in mode and mode != "rb" else f
+
+    def cost(self, size: int):
+        delay = size / self.rate
+        with self.lock:
+            self.dirty += size
+            if self.dirty >= self.stall_every:
+                self.dirty -= self.stall_every
+                delay += self.stall
+        time.sleep(delay)
+
+
+class SlowFile:
+    def __init__(self, f, disk: SlowDisk):
+        self._f = f
+        self._disk = disk
+
+    def write(self, data):
+        self._disk.cost(len(data))
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+async def legacy_download(client, url, file_path, disk):
+    """旧写法：在事件循环中同步写入 8KB 块。"""
+    async with client.stream("GET", url, timeout=300) as r:
+        r.raise_for_status()
+        with disk.open(file_path, "wb") as f:
+            async for chunk in r.aiter_bytes(chunk_size=8192):
+                f.write(chunk)
+
+
+async def new_download(client, url, file_path, disk):
+    await core.downloader.download_file(client, url, file_path, timeout=300)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def ping_thread(port, stop, latencies):
+    """模拟 API 客户端：每 10ms 发一次请求，记录往返延迟。"""
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        while not stop.is_set():
+            start = time.perf_counter()
+            sock.sendall(b"ping\n")
+            sock.recv(16)
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+
+
+async def run_scenario(name, server, disk, downloader, count, tmp):
+    async def echo(reader, writer):
+        while line := await reader.readline():
+            writer.write(line)
+            await writer.drain()
+        writer.close()
+
+    echo_server = await asyncio.start_server(echo, "127.0.0.1", 0)
+    port = echo_server.sockets[0].getsockname()[1]
+
+    lags = []
+    stop_ticker = asyncio.Event()
+
+    async def ticker():
+        while not stop_ticker.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append((time.perf_counter() - start - 0.005) * 1000)
+
+    latencies = []
+    stop = threading.Event()
+    pinger = threading.Thread(target=ping_thread, args=(port, stop, latencies))
+    pinger.start()
+    ticker_task = asyncio.ensure_future(ticker())
+
+    start = time.perf_counter()
+    if downloader is None:
+        await asyncio.sleep(2)
+    else:
+        async with httpx.AsyncClient() as client:
+            await asyncio.gather(
+                *(
+                    downloader(
+                        client, server.url, os.path.join(tmp, f"{name}-{i}.flac"), disk
+                    )
+                    for i in range(count)
+                )
+            )
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    pinger.join()
+    stop_ticker.set()
+    await ticker_task
+    echo_server.close()
+    await echo_server.wait_closed()
+
+    print(
+        f"{name:<8} 用时 {elapsed:6.2f}s  "
+        f"API 延迟 p50 {statistics.median(latencies):6.2f}ms  "
+        f"p99 {percentile(latencies, 99):7.2f}ms  max {max(latencies):7.2f}ms  "
+        f"| loop lag p99 {percentile(lags, 99):7.2f}ms  max {max(lags):7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--downloads", type=int, default=4)
+    parser.add_argument("--size-mb", type=float, default=100)
+    parser.add_argument("--rate", type=float, default=60, help="单连接限速 MB/s")
+    parser.add_argument("--disk-mbps", type=float, default=400)
+    parser.add_argument("--stall-ms", type=float, default=40)
+    parser.add_argument("--stall-every-mb", type=float, default=16)
+    args = parser.parse_args()
+
+    data = os.urandom(int(args.size_mb * 1024 * 1024))
+    server = FlakyServer(data, args.rate, drop_mb=1e9, seed=0)
+    disk = SlowDisk(args.disk_mbps, args.stall_ms, args.stall_every_mb)
+    core.downloader.open = disk.open
+    Config.DOWNLOAD_SEGMENTS = 1
+
+    print(
+        f"{args.downloads} 个 {args.size_mb:.0f} MB 下载并发，单连接 {args.rate} MB/s，"
+        f"磁盘 {args.disk_mbps} MB/s 且每 {args.stall_every_mb} MB 卡顿 {args.stall_ms}ms"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, downloader in (
+            ("空闲", None),
+            ("同步写盘", legacy_download),
+            ("写后缓冲", new_download),
+        ):
+            asyncio.run(
+                run_scenario(name, server, disk, downloader, args.downloads, tmp)
+            )
+    server.httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
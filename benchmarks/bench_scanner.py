@@ -0,0 +1,132 @@
+"""
+基准：在合成曲库上对比扫描器单进程与多进程解析元数据的全量入库耗时。
+
+合成曲库由带完整标签和内嵌封面的 FLAC / MP3 文件组成 (只有文件头和少量静音帧，
+体积很小，但 mutagen 的解析路径与真实文件一致)。
+
+用法:
+    python benchmarks/bench_scanner.py --files 4000 --jobs 1 4 8
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mutagen.flac import FLAC, Picture  # noqa: E402
+from mutagen.id3 import APIC, ID3, TALB, TIT2, TPE1, TRCK, USLT  # noqa: E402
+
+import scanner  # noqa: E402
+from core.config import Config  # noqa: E402
+
+# MPEG-1 Layer III, 320kbps, 44.1kHz, joint stereo 的帧头，每帧 1044 字节
+MP3_FRAME = b"\xff\xfb\xe0\x44" + b"\x00" * 1040
+
+
+def make_flac(path: str, tags: dict, cover: bytes, seconds: int = 240):
+    rate, channels, bits = 44100, 2, 16
+    packed = (rate << 44) | ((channels - 1) << 41) | ((bits - 1) << 36) | rate * seconds
+    streaminfo = (
+        struct.pack(">HH", 4096, 4096)
+        + b"\x00" * 6
+        + packed.to_bytes(8, "big")
+        + b"\x00" * 16
+    )
+    with open(path, "wb") as f:
+        f.write(b"fLaC\x80" + len(streaminfo).to_bytes(3, "big") + streaminfo)
+
+    audio = FLAC(path)
+    for key, value in tags.items():
+        audio[key] = value
+    picture = Picture()
+    picture.type = 3
+    picture.mime = "image/jpeg"
+    picture.data = cover
+    audio.add_picture(picture)
+    audio.save()
+
+
+def make_mp3(path: str, tags: dict, cover: bytes, frames: int = 40):
+    with open(path, "wb") as f:
+        f.write(MP3_FRAME * frames)
+
+    id3 = ID3()
+    id3.add(TPE1(encoding=3, text=tags["artist"]))
+    id3.add(TIT2(encoding=3, text=tags["title"]))
+    id3.add(TALB(encoding=3, text=tags["album"]))
+    id3.add(TRCK(encoding=3, text=tags["tracknumber"]))
+    id3.add(USLT(encoding=3, lang="chi", desc="", text=tags["lyrics"]))
+    id3.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=cover))
+    id3.save(path)
+
+
+def build_library(root: str, total: int, cover_kb: int):
+    """生成 total 个文件，FLAC 与 MP3 各占一半，每张专辑 10 首共用一张封面。"""
+    for i in range(total):
+        album_index = i // 10
+        folder = os.path.join(root, f"歌手{album_index % 50}", f"专辑{album_index}")
+        os.makedirs(folder, exist_ok=True)
+        tags = {
+            "artist": f"歌手{album_index % 50}",
+            "title": f"歌曲{i}",
+            "album": f"专辑{album_index}",
+            "tracknumber": str(i % 10 + 1),
+            "lyrics": f"[00:00.00]合成歌词 {i}\n" * 40,
+        }
+        cover = (f"cover-{album_index}".encode() * (cover_kb * 100))[: cover_kb * 1024]
+        name = f"{tags['artist']} - {tags['title']}"
+        if i % 2:
+            make_mp3(os.path.join(folder, name + ".mp3"), tags, cover)
+        else:
+            make_flac(os.path.join(folder, name + ".flac"), tags, cover)
+
+
+def run_scan(library_dir: str, db_file: str, jobs: int) -> float:
+    Config.DATABASE_FILE = db_file
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        scanner.scan_and_index_music(full=True, jobs=jobs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描器并行解析基准")
+    parser.add_argument("--files", type=int, default=4000, help="合成文件数量")
+    parser.add_argument("--cover-kb", type=int, default=200, help="内嵌封面大小 (KB)")
+    parser.add_argument(
+        "--jobs", type=int, nargs="+", default=[1, 4], help="要对比的进程数"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        library_dir = os.path.join(tmp_dir, "library")
+        start = time.perf_counter()
+        build_library(library_dir, args.files, args.cover_kb)
+        print(
+            f"已生成合成曲库: {args.files} 个文件 (FLAC/MP3 各半)，"
+            f"封面 {args.cover_kb}KB，耗时 {time.perf_counter() - start:.1f}s\n"
+        )
+
+        Config.MASTER_DIRECTORY = ""
+        Config.FLAC_DIRECTORY = library_dir
+        Config.LOSSY_DIRECTORY = ""
+        Config.INSTRUMENTAL_DIRECTORY = ""
+
+        baseline = None
+        for jobs in args.jobs:
+            elapsed = run_scan(library_dir, os.path.join(tmp_dir, f"j{jobs}.db"), jobs)
+            baseline = baseline or elapsed
+            print(
+                f"--jobs {jobs:<3} 总耗时 {elapsed:7.2f}s  "
+                f"吞吐 {args.files / elapsed:7.0f} 文件/秒  加速比 {baseline / elapsed:.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
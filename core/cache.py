@@ -0,0 +1,377 @@
+import asyncio
+import atexit
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from core.config import Config
+from core.database import SQLiteConnectionPool, SQLiteWriteQueue
+
+
+class SingleFlight:
+    """
+    按 key 合并并发的相同请求。
+
+    同一事件循环中 key 相同的调用共享一次执行：第一个调用者真正发起请求，其余调用者
+    等待同一个结果 (拿到的是深拷贝，互相修改不会串)。执行在独立的 Task 中进行，
+    发起者被取消也不会影响其他等待者。结果不做缓存，请求结束后下一次调用会重新执行。
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight = {}  # (loop, key) -> asyncio.Task
+        self.calls = 0
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        """执行 fn() (返回可等待对象)，若已有相同 key 的调用在进行中则等待其结果。"""
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        with self._lock:
+            self.calls += 1
+            task = self._inflight.get(flight_key)
+            leader = task is None or task.done()
+            if leader:
+                self.executed += 1
+                task = loop.create_task(self._run(flight_key, fn))
+                self._inflight[flight_key] = task
+            else:
+                self.coalesced += 1
+        result = await asyncio.shield(task)
+        return result if leader else copy.deepcopy(result)
+
+    async def _run(self, flight_key, fn):
+        try:
+            return await fn()
+        finally:
+            with self._lock:
+                if self._inflight.get(flight_key) is asyncio.current_task():
+                    del self._inflight[flight_key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "in_flight": len(self._inflight),
+                "calls": self.calls,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+            }
+
+
+class TTLCache:
+    """
+    带过期时间与容量上限的线程安全 LRU 缓存。
+
+    - 超过 maxsize 时淘汰最久未访问的条目，条目写入 ttl 秒后视为过期
+    - get / set 可在事件循环和线程池中同时调用
+    - get_or_load 会合并同一个 key 上并发的加载请求 (SingleFlight)：多首同专辑的歌曲
+      同时下载时，只有第一个调用者真正请求上游，其余调用者等待同一个结果
+    - 加载结果为 None (请求失败) 时不写入缓存，下次访问会重新请求
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600.0, name: str = "cache"):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight(name)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, key):
+        """在持有锁的前提下查找条目，返回 (是否命中, 值)。"""
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._lookup(key)[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    async def get_or_load(self, key, loader, ttl: float = None):
+        """
+        命中缓存直接返回，否则调用 loader() (返回可等待对象) 加载并写入缓存。
+
+        同一事件循环中对同一个 key 的并发调用通过 SingleFlight 共享一次加载。
+        """
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+        return await self._flight.do(key, lambda: self._load(key, loader, ttl))
+
+    async def _load(self, key, loader, ttl):
+        value = await loader()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self._flight.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class ResponseCache:
+    """
+    持久化的上游响应缓存 (SQLite)，按 (平台, 接口, ID) 存放几乎不变的元数据响应。
+
+    - 磁盘层: 独立的数据库文件 (RESPONSE_CACHE_FILE)，服务重启、脚本多次运行之间共享；
+      写入交给 SQLiteWriteQueue 异步组提交，不阻塞请求
+    - 内存层: TTLCache 存放序列化后的 JSON，每次命中都反序列化出新对象，调用方可以放心修改
+    - 每个接口可单独配置有效期 (RESPONSE_CACHE_TTLS)，超过 RESPONSE_CACHE_MAX_ENTRIES 条时
+      按最近访问时间淘汰
+    """
+
+    # 磁盘命中时，距上次记录的访问时间超过该秒数才回写 last_access，避免每次读都产生写入
+    TOUCH_INTERVAL = 3600
+    # 每写入多少条检查一次过期与容量
+    PRUNE_EVERY = 500
+
+    def __init__(
+        self,
+        db_file: str = None,
+        max_entries: int = None,
+        memory_entries: int = None,
+        ttls: dict = None,
+        default_ttl: float = None,
+    ):
+        self.db_file = db_file or getattr(
+            Config, "RESPONSE_CACHE_FILE", "response_cache.db"
+        )
+        self.max_entries = (
+            max_entries
+            if max_entries is not None
+            else getattr(Config, "RESPONSE_CACHE_MAX_ENTRIES", 200000)
+        )
+        self.ttls = dict(getattr(Config, "RESPONSE_CACHE_TTLS", {}))
+        self.ttls.update(ttls or {})
+        self.default_ttl = (
+            default_ttl
+            if default_ttl is not None
+            else getattr(Config, "RESPONSE_CACHE_DEFAULT_TTL", 7 * 86400)
+        )
+        self.memory = TTLCache(
+            maxsize=(
+                memory_entries
+                if memory_entries is not None
+                else getattr(Config, "RESPONSE_CACHE_MEMORY_ENTRIES", 2048)
+            ),
+            ttl=self.default_ttl,
+            name="response_memory",
+        )
+        self.pool = SQLiteConnectionPool(self.db_file)
+        self.writer = SQLiteWriteQueue(self.pool)
+        self._writes_since_prune = 0
+        self._counter_lock = threading.Lock()
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._create_table()
+
+    def _create_table(self):
+        conn = self.pool.get_connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                platform TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (platform, endpoint, cache_key)
+            ) WITHOUT ROWID
+            """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_response_cache_access ON response_cache (last_access)"
+        )
+        conn.commit()
+
+    def ttl_for(self, endpoint: str) -> float:
+        return self.ttls.get(endpoint, self.default_ttl)
+
+    def get(self, platform: str, endpoint: str, key):
+        """返回缓存的响应 (新对象)，未命中或已过期返回 None。"""
+        memory_key = (platform, endpoint, str(key))
+        text = self.memory.get(memory_key)
+        if text is None:
+            now = time.time()
+            row = (
+                self.pool.get_connection()
+                .execute(
+                    "SELECT value, expires_at, last_access FROM response_cache "
+                    "WHERE platform = ? AND endpoint = ? AND cache_key = ?",
+                    memory_key,
+                )
+                .fetchone()
+            )
+            if row is None or row["expires_at"] <= now:
+                with self._counter_lock:
+                    self.misses += 1
+                return None
+            text = row["value"]
+            with self._counter_lock:
+                self.disk_hits += 1
+            self.memory.set(memory_key, text, ttl=row["expires_at"] - now)
+            if now - row["last_access"] > self.TOUCH_INTERVAL:
+                self.writer.execute(
+                    "UPDATE response_cache SET last_access = ? "
+                    "WHERE platform = ? AND endpoint = ? AND cache_key = ?",
+                    (now, *memory_key),
+                )
+        return json.loads(text)
+
+    def set(self, platform: str, endpoint: str, key, value, ttl: float = None):
+        """写入缓存：内存层立即生效，磁盘层异步提交。"""
+        ttl = self.ttl_for(endpoint) if ttl is None else ttl
+        if not ttl or ttl <= 0:
+            return
+        memory_key = (platform, endpoint, str(key))
+        text = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        self.memory.set(memory_key, text, ttl=ttl)
+        self.writer.execute(
+            "INSERT OR REPLACE INTO response_cache "
+            "(platform, endpoint, cache_key, value, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (*memory_key, text, now + ttl, now),
+        )
+        with self._counter_lock:
+            self.stores += 1
+            self._writes_since_prune += 1
+            prune = self._writes_since_prune >= self.PRUNE_EVERY
+            if prune:
+                self._writes_since_prune = 0
+        if prune:
+            self.writer.submit(self._prune)
+
+    async def get_or_fetch(self, platform: str, endpoint: str, key, fetch):
+        """
+        命中缓存直接返回，否则 await fetch() 获取；fetch 返回 None 表示请求失败，不写入缓存。
+        """
+        cached = self.get(platform, endpoint, key)
+        if cached is not None:
+            return cached
+        value = await fetch()
+        if value is not None:
+            self.set(platform, endpoint, key, value)
+        return value
+
+    def _prune(self, cursor):
+        """在写线程中执行：删除过期条目，并按最近访问时间淘汰超出容量的部分。"""
+        cursor.execute(
+            "DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),)
+        )
+        count = cursor.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            cursor.execute(
+                "DELETE FROM response_cache WHERE (platform, endpoint, cache_key) IN "
+                "(SELECT platform, endpoint, cache_key FROM response_cache "
+                "ORDER BY last_access LIMIT ?)",
+                (overflow,),
+            )
+
+    def prune(self):
+        """立即执行一次过期清理与容量淘汰。"""
+        self.writer.submit(self._prune).result()
+
+    def close(self):
+        """提交尚未落盘的写入并停止写线程。"""
+        self.writer.close()
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        with self._counter_lock:
+            lookups = memory["hits"] + self.disk_hits + self.misses
+            hits = memory["hits"] + self.disk_hits
+            return {
+                "name": "response_cache",
+                "memory_size": memory["size"],
+                "memory_hits": memory["hits"],
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    返回进程内共享的 ResponseCache；RESPONSE_CACHE_ENABLED 为 False 时返回 None。
+
+    main.py、playlist_sync.py 与元数据增强脚本都通过它访问同一个缓存文件。
+    """
+    global _response_cache
+    if not getattr(Config, "RESPONSE_CACHE_ENABLED", True):
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+            # 写线程是守护线程，退出前把剩余写入提交掉
+            atexit.register(_response_cache.close)
+        return _response_cache
@@ -0,0 +1,205 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from core.config import Config
+
+
+class SQLiteConnectionPool:
+    """
+    按线程复用的 SQLite 连接池。
+
+    每个工作线程 (FastAPI 线程池、扫描器等) 首次访问时创建一个连接并一直复用，
+    避免每次查询都重复 open / PRAGMA / 解析 schema 的开销。
+    连接统一开启 WAL，使扫描器写入时不会阻塞 API 的读取。
+    """
+
+    def __init__(
+        self,
+        db_file: str,
+        cache_size_kb: int = None,
+        mmap_size: int = None,
+        busy_timeout: float = None,
+    ):
+        self.db_file = db_file
+        self.cache_size_kb = (
+            cache_size_kb
+            if cache_size_kb is not None
+            else getattr(Config, "SQLITE_CACHE_SIZE_KB", 65536)
+        )
+        self.mmap_size = (
+            mmap_size
+            if mmap_size is not None
+            else getattr(Config, "SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+        )
+        self.busy_timeout = (
+            busy_timeout
+            if busy_timeout is not None
+            else getattr(Config, "SQLITE_BUSY_TIMEOUT", 30.0)
+        )
+        # 线程退出时 threading.local 中的连接会随之被回收并关闭
+        self._local = threading.local()
+
+    def _open(self) -> sqlite3.Connection:
+        """创建一个新连接并应用性能相关的 PRAGMA。"""
+        conn = sqlite3.connect(self.db_file, timeout=self.busy_timeout)
+        conn.row_factory = sqlite3.Row  # 既可按列名访问，也兼容按下标/元组解包
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA foreign_keys = ON;")  # 确保外键约束被激活
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        # 负数表示以 KB 为单位
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)};")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)};")
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """获取当前线程专属的数据库连接 (不要手动 close)。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """关闭当前线程的连接 (用于脚本退出前显式释放)。"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class SQLiteWriteQueue:
+    """
+    单写线程 + 组提交 (group commit) 的 SQLite 写入队列。
+
+    SQLite 同一时刻只允许一个写事务，多个线程各自 "写入 -> 提交" 时会互相争抢写锁，
+    而且每首歌都要单独落盘一次。这里把所有写操作交给一个专职线程串行执行：
+    它从队列中取出一批操作 (数量达到 batch_size 或等待超过 batch_window 秒为止)，
+    在同一个事务里依次执行，最后只提交一次。
+
+    每个操作是一个 fn(cursor, *args, **kwargs) 函数，在写线程中被调用，
+    不能自己 commit/rollback。submit 返回 concurrent.futures.Future，
+    事务提交成功后才会写入结果；单个操作抛出的异常只回滚它自己 (SAVEPOINT)，
+    不影响同批次的其他操作。
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        pool: SQLiteConnectionPool,
+        batch_size: int = None,
+        batch_window: float = None,
+    ):
+        self.pool = pool
+        self.batch_size = (
+            batch_size
+            if batch_size is not None
+            else getattr(Config, "SQLITE_WRITE_BATCH_SIZE", 200)
+        )
+        self.batch_window = (
+            batch_window
+            if batch_window is not None
+            else getattr(Config, "SQLITE_WRITE_BATCH_WINDOW", 0.0)
+        )
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        """首次提交写操作时才启动写线程。"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="sqlite-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """提交一个写操作，返回在其所在批次提交后完成的 Future。"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def execute(self, sql: str, params=()) -> Future:
+        """提交单条 SQL 语句，Future 的结果为受影响的行数。"""
+        return self.submit(lambda cursor: cursor.execute(sql, params).rowcount)
+
+    def flush(self, timeout: float = None):
+        """等待此前提交的所有写操作完成提交。"""
+        self.submit(lambda cursor: None).result(timeout)
+
+    def close(self, timeout: float = None):
+        """处理完队列中剩余的操作后停止写线程。"""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = self.pool.get_connection()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    # 先取走已在排队的操作，再在时间窗口内等待后续操作
+                    remaining = deadline - time.monotonic()
+                    item = (
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit_batch(conn, batch)
+        self.pool.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list):
+        """在一个事务中执行一批写操作，提交后再统一通知调用方。"""
+        outcomes = []
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for fn, args, kwargs, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute("SAVEPOINT write_op")
+                try:
+                    result = fn(cursor, *args, **kwargs)
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_op")
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+                cursor.execute("RELEASE write_op")
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"数据库写线程: 批量提交失败 ({len(batch)} 个操作): {e}")
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
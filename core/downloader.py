@@ -0,0 +1,377 @@
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from core.cache import SingleFlight
+from core.config import Config
+
+# 下载写盘线程：文件的打开/预分配/写入/关闭都在这里执行，磁盘慢时不会卡住事件循环
+download_write_executor = ThreadPoolExecutor(
+    max_workers=getattr(Config, "DOWNLOAD_WRITE_THREADS", 4),
+    thread_name_prefix="download-writer",
+)
+
+# 进程内正在下载的音频版本，按 (search_key, 专辑, 音质) 去重 (网易云与 QQ 共用)：
+# 同一版本已在下载时，后来的调用者直接等待进行中的任务，不会并发写同一个文件
+download_registry = SingleFlight("downloads")
+
+
+class WriteBehindFile:
+    """
+    写后缓冲的异步文件写入器。
+
+    write() 只把数据块放进有界队列，由一个后台协程按顺序交给写盘线程写入；
+    队列中积压超过 DOWNLOAD_WRITE_QUEUE 块时 write() 才会等待 (背压)，内存占用有上限。
+    position 为已真正写入文件的位置，退出上下文时会先写完队列中剩余的数据。
+    """
+
+    def __init__(self, path: str, offset: int, buffer_size: int, max_pending: int):
+        self.path = path
+        self.position = offset
+        self.buffer_size = buffer_size
+        self._queue = asyncio.Queue(maxsize=max(1, max_pending))
+        self._file = None
+        self._writer = None
+        self._error = None
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(download_write_executor, fn, *args)
+
+    def _open(self):
+        f = open(self.path, "r+b", buffering=self.buffer_size)
+        f.seek(self.position)
+        return f
+
+    async def __aenter__(self):
+        self._file = await self._run(self._open)
+        self._writer = asyncio.ensure_future(self._drain())
+        return self
+
+    async def _drain(self):
+        while True:
+            chunk = await self._queue.get()
+            if chunk is None:
+                return
+            if self._error is not None:
+                continue  # 写盘已出错，丢弃剩余数据块，只为让 write() 不再阻塞
+            try:
+                await self._run(self._file.write, chunk)
+                self.position += len(chunk)
+            except OSError as e:
+                self._error = e
+
+    async def write(self, chunk: bytes):
+        if self._error is not None:
+            raise self._error
+        await self._queue.put(chunk)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self._queue.put(None)
+            await self._writer
+        finally:
+            if not self._writer.done():
+                self._writer.cancel()
+            await self._run(self._file.close)
+        if self._error is not None and exc_type is None:
+            raise self._error
+
+
+class DownloadRestart(Exception):
+    """服务端文件或 Range 支持发生变化，已有进度作废，需要从头重新下载。"""
+
+
+class ResumableDownload:
+    """
+    支持断点续传与分段并发的单文件下载。
+
+    数据先写入 "<目标文件>.part"，全部完成后才重命名为目标文件；各段的写入进度记录在
+    "<目标文件>.part.json" 中。网络中断时用 HTTP Range 从断点继续，本次重试用完后保留
+    .part 与进度文件，下次下载同一文件 (链接可以不同) 时接着下载。
+
+    已知文件大小时预先分配磁盘空间；服务端支持 Range 且文件不小于
+    DOWNLOAD_SEGMENT_MIN_SIZE 时拆成 DOWNLOAD_SEGMENTS 段，用多个连接并发下载。
+    写盘通过 WriteBehindFile 交给写盘线程，不阻塞事件循环。
+    传入 tracker (core.metrics.DownloadTracker) 时上报收到的字节数、文件大小与重连次数。
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        file_path: str,
+        headers: dict = None,
+        cookies: dict = None,
+        timeout: float = 300,
+        tracker=None,
+    ):
+        self.client = client
+        self.url = url
+        self.file_path = file_path
+        self.part_path = file_path + ".part"
+        self.state_path = self.part_path + ".json"
+        self.headers = dict(headers or {})
+        self.cookies = cookies
+        self.timeout = timeout
+        self.tracker = tracker
+
+        self.chunk_size = getattr(Config, "DOWNLOAD_CHUNK_SIZE", 262144)
+        self.buffer_size = getattr(Config, "DOWNLOAD_BUFFER_SIZE", 1048576)
+        self.write_queue = getattr(Config, "DOWNLOAD_WRITE_QUEUE", 16)
+        self.max_segments = max(1, getattr(Config, "DOWNLOAD_SEGMENTS", 4))
+        self.segment_min_size = getattr(Config, "DOWNLOAD_SEGMENT_MIN_SIZE", 33554432)
+        self.retries = getattr(Config, "DOWNLOAD_RESUME_RETRIES", 5)
+        self.retry_delay = getattr(Config, "DOWNLOAD_RETRY_DELAY", 1.0)
+
+        # {"size": 总大小或 None, "ranged": 是否支持 Range, "segments": [[已写位置, 结束位置], ...]}
+        self.state = None
+        self.resumed_bytes = 0
+        self.reconnects = 0
+
+    async def run(self) -> int:
+        """下载到 file_path，返回文件大小。网络错误重试用完后抛出 httpx.RequestError。"""
+        for _ in range(2):
+            self.state = self._load_state()
+            if self.state is None:
+                self.state = await self._plan()
+            else:
+                self.resumed_bytes = self._written_bytes()
+                print(
+                    f"下载: 从断点继续 {os.path.basename(self.file_path)} (已有 {self.resumed_bytes} 字节)"
+                )
+            if self.tracker is not None:
+                self.tracker.total_bytes = self.state["size"]
+                self.tracker.resumed_bytes = self.resumed_bytes
+            try:
+                await self._fetch_segments()
+                break
+            except DownloadRestart as e:
+                print(f"下载: {e}，从头重新下载 {os.path.basename(self.file_path)}")
+                self._discard()
+        else:
+            raise httpx.RequestError("下载进度反复失效", request=None)
+
+        size = self.state["size"]
+        if size is None:
+            size = self._written_bytes()
+        elif any(pos != end for pos, end in self.state["segments"]):
+            # .part 已按 size 预分配，只能按各段实际写到的位置判断是否完整
+            self._discard()
+            raise httpx.RequestError("下载文件大小与服务端不一致", request=None)
+        os.replace(self.part_path, self.file_path)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return size
+
+    def _written_bytes(self) -> int:
+        """各段已写入的字节数之和。"""
+        total = 0
+        for index, (pos, _end) in enumerate(self.state["segments"]):
+            total += pos - self._segment_start(index)
+        return total
+
+    def _segment_start(self, index: int) -> int:
+        segments = self.state["segments"]
+        size = self.state["size"]
+        if size is None or len(segments) == 1:
+            return 0
+        return size * index // len(segments)
+
+    def _load_state(self):
+        """读取上次中断时的进度；.part 和进度文件缺一不可，否则丢弃重新开始。"""
+        if not os.path.exists(self.part_path) or not os.path.exists(self.state_path):
+            self._discard()
+            return None
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if not state.get("segments"):
+                raise ValueError("没有分段信息")
+            return state
+        except (OSError, ValueError) as e:
+            print(f"下载: 进度文件无效 ({e})，重新开始。")
+            self._discard()
+            return None
+
+    def _save_state(self):
+        try:
+            with open(self.state_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+        except OSError as e:
+            print(f"下载: 保存进度失败 - {e}")
+
+    def _discard(self):
+        for path in (self.part_path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _content_range_total(response: httpx.Response):
+        """从 Content-Range (bytes a-b/total) 中取出文件总大小。"""
+        match = re.match(
+            r"bytes\s+(?:\d+-\d+|\*)/(\d+)", response.headers.get("content-range", "")
+        )
+        return int(match.group(1)) if match else None
+
+    async def _plan(self) -> dict:
+        """用 Range: bytes=0-0 探测文件大小与 Range 支持，分段并预分配 .part。"""
+        headers = dict(self.headers, Range="bytes=0-0")
+        async with self.client.stream(
+            "GET", self.url, headers=headers, cookies=self.cookies, timeout=self.timeout
+        ) as r:
+            r.raise_for_status()
+            ranged = r.status_code == 206
+            if ranged:
+                size = self._content_range_total(r)
+            else:
+                length = r.headers.get("content-length")
+                size = int(length) if length and length.isdigit() else None
+
+        segment_count = 1
+        if ranged and size is not None and size >= self.segment_min_size:
+            segment_count = self.max_segments
+        if size is None:
+            segments = [[0, None]]
+        else:
+            bounds = [size * i // segment_count for i in range(segment_count + 1)]
+            segments = [[bounds[i], bounds[i + 1]] for i in range(segment_count)]
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(download_write_executor, self._preallocate, size)
+        state = {"size": size, "ranged": ranged, "segments": segments}
+        self.state = state
+        self._save_state()
+        return state
+
+    def _preallocate(self, size):
+        """创建 .part 文件，已知大小时预先分配磁盘空间 (在写盘线程中执行)。"""
+        with open(self.part_path, "wb") as f:
+            if size:
+                try:
+                    os.posix_fallocate(f.fileno(), 0, size)
+                except (AttributeError, OSError):
+                    f.truncate(size)
+
+    async def _fetch_segments(self):
+        segments = [
+            seg for seg in self.state["segments"] if not self._segment_done(seg)
+        ]
+        if len(segments) == 1:
+            await self._fetch_segment(segments[0])
+            return
+        tasks = [asyncio.ensure_future(self._fetch_segment(seg)) for seg in segments]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self._save_state()
+
+    @staticmethod
+    def _segment_done(segment) -> bool:
+        pos, end = segment
+        return end is not None and pos >= end
+
+    async def _fetch_segment(self, segment: list):
+        """下载一段 [pos, end)，连接中断时从已写位置续传，连续失败超过重试次数才放弃。"""
+        failures = 0
+        while not self._segment_done(segment):
+            start_pos = segment[0]
+            headers = dict(self.headers)
+            if self.state["ranged"]:
+                end = segment[1]
+                headers["Range"] = f"bytes={segment[0]}-" + (
+                    str(end - 1) if end is not None else ""
+                )
+            elif segment[0]:
+                # 服务端不支持 Range，只能整段重新下载
+                segment[0] = 0
+            try:
+                finished = await self._stream_into(segment, headers)
+                if finished:
+                    break
+            except httpx.TransportError as e:
+                if segment[0] > start_pos:
+                    failures = 0
+                failures += 1
+                self.reconnects += 1
+                if self.tracker is not None:
+                    self.tracker.reconnects += 1
+                self._save_state()
+                if failures > self.retries:
+                    raise
+                print(
+                    f"下载: {os.path.basename(self.file_path)} 在 {segment[0]} 字节处中断 ({e!r})，"
+                    f"{self.retry_delay * failures:.1f}s 后续传 (第 {failures} 次)"
+                )
+                await asyncio.sleep(self.retry_delay * failures)
+
+    async def _stream_into(self, segment: list, headers: dict) -> bool:
+        """发起一次请求并把响应写入 .part 的对应位置，返回该段是否已写完。"""
+        async with self.client.stream(
+            "GET", self.url, headers=headers, cookies=self.cookies, timeout=self.timeout
+        ) as r:
+            if r.status_code == 416 and segment[1] is None:
+                # 未知大小的文件已经下完，服务端拒绝超出末尾的 Range
+                segment[1] = segment[0]
+                return True
+            r.raise_for_status()
+            if "Range" in headers:
+                if r.status_code != 206:
+                    raise DownloadRestart("服务端不再支持 Range")
+                total = self._content_range_total(r)
+                if self.state["size"] is not None and total != self.state["size"]:
+                    raise DownloadRestart("服务端文件大小已变化")
+
+            writer = WriteBehindFile(
+                self.part_path, segment[0], self.buffer_size, self.write_queue
+            )
+            try:
+                async with writer:
+                    queued = segment[0]
+                    async for chunk in r.aiter_bytes(chunk_size=self.chunk_size):
+                        if segment[1] is not None:
+                            chunk = chunk[: segment[1] - queued]
+                        await writer.write(chunk)
+                        queued += len(chunk)
+                        if self.tracker is not None:
+                            self.tracker.received(len(chunk))
+            finally:
+                # 只记录真正落盘的位置，断线时从这里续传
+                segment[0] = writer.position
+
+        if segment[1] is None:
+            segment[1] = segment[0]
+            return True
+        if segment[0] < segment[1]:
+            raise httpx.RemoteProtocolError("响应提前结束", request=r.request)
+        return True
+
+
+async def download_file(
+    client: httpx.AsyncClient,
+    url: str,
+    file_path: str,
+    headers: dict = None,
+    cookies: dict = None,
+    timeout: float = 300,
+    tracker=None,
+) -> int:
+    """断点续传地下载 url 到 file_path，返回文件大小 (见 ResumableDownload)。"""
+    return await ResumableDownload(
+        client,
+        url,
+        file_path,
+        headers=headers,
+        cookies=cookies,
+        timeout=timeout,
+        tracker=tracker,
+    ).run()
@@ -0,0 +1,328 @@
+import asyncio
+import time
+import traceback
+
+from core.config import Config
+from core.database import SQLiteConnectionPool, SQLiteWriteQueue
+from core.metrics import current_job_id
+
+
+class DownloadJobQueue:
+    """
+    持久化、带优先级的后台下载任务队列 (SQLite)。
+
+    - 任务存放在独立的数据库文件 (JOB_QUEUE_FILE) 中，服务重启时中断的任务重新排队
+    - 状态: queued -> running -> done / failed；出错后按指数退避重新排队，
+      最多执行 JOB_MAX_ATTEMPTS 次
+    - 优先级数值越小越先执行：单曲 (用户正在播放) 为 PRIORITY_INTERACTIVE，
+      歌单/专辑为 PRIORITY_BULK
+    - 每个平台一组 worker (JOB_WORKERS)，多于一个时第一个 worker 只执行单曲任务，
+      批量任务再多也不会把单曲堵在后面
+    - 相同 (平台, 类型, 目标, 音质) 的任务尚未完成时重复提交，返回已有任务
+
+    处理函数通过 register(platform, kind, handler) 注册，签名为
+    handler(target, level, progress)，progress(done, total) 用于上报进度；
+    返回带 "error" 键的字典或抛出异常都视为失败。
+    """
+
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_BULK = 100
+
+    def __init__(self, db_file: str = None, workers: dict = None):
+        self.db_file = db_file or getattr(Config, "JOB_QUEUE_FILE", "download_jobs.db")
+        self.workers = dict(
+            workers or getattr(Config, "JOB_WORKERS", {"netease": 2, "qq": 2})
+        )
+        self.max_attempts = max(1, getattr(Config, "JOB_MAX_ATTEMPTS", 3))
+        self.retry_delay = getattr(Config, "JOB_RETRY_DELAY", 30.0)
+        self.poll_interval = getattr(Config, "JOB_POLL_INTERVAL", 5.0)
+        self.retention = getattr(Config, "JOB_RETENTION_DAYS", 7) * 86400
+        self.pool = SQLiteConnectionPool(self.db_file)
+        self.writer = SQLiteWriteQueue(self.pool)
+        self._handlers = {}
+        self._wakeups = {}  # platform -> [asyncio.Event]，每个 worker 一个
+        self._tasks = []
+        self._create_table()
+
+    def _create_table(self):
+        conn = self.pool.get_connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS download_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                platform TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                target TEXT NOT NULL,
+                level TEXT,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_run_at REAL NOT NULL,
+                progress_done INTEGER NOT NULL DEFAULT 0,
+                progress_total INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_download_jobs_queue "
+            "ON download_jobs (platform, status, priority, id)"
+        )
+        conn.commit()
+
+    def register(self, platform: str, kind: str, handler):
+        """注册某个平台某类任务的处理函数。"""
+        self._handlers[(platform, kind)] = handler
+
+    # ------------------------------------------------------------------
+    # 提交与查询
+    # ------------------------------------------------------------------
+    async def enqueue(
+        self, platform: str, kind: str, target, level: str = None, priority=None
+    ) -> dict:
+        """提交任务并返回任务信息；相同任务未完成时返回已有任务 (必要时提升其优先级)。"""
+        if priority is None:
+            priority = (
+                self.PRIORITY_INTERACTIVE if kind == "song" else self.PRIORITY_BULK
+            )
+        job = await asyncio.wrap_future(
+            self.writer.submit(
+                self._insert_job, platform, kind, str(target), level, priority
+            )
+        )
+        self._wake(platform)
+        return job
+
+    def _insert_job(self, cursor, platform, kind, target, level, priority):
+        """写入 (或复用) 任务并在同一写线程中读回任务信息，避免在事件循环中查库。"""
+        row = cursor.execute(
+            "SELECT id, priority FROM download_jobs WHERE platform = ? AND kind = ? "
+            "AND target = ? AND level IS ? AND status IN ('queued', 'running')",
+            (platform, kind, target, level),
+        ).fetchone()
+        if row is not None:
+            if priority < row[1]:
+                cursor.execute(
+                    "UPDATE download_jobs SET priority = ? WHERE id = ?",
+                    (priority, row[0]),
+                )
+            job_id = row[0]
+        else:
+            now = time.time()
+            cursor.execute(
+                "INSERT INTO download_jobs (platform, kind, target, level, priority, "
+                "status, next_run_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (platform, kind, target, level, priority, now, now),
+            )
+            job_id = cursor.lastrowid
+        row = cursor.execute(
+            "SELECT * FROM download_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row)
+
+    def get(self, job_id: int) -> dict:
+        row = (
+            self.pool.get_connection()
+            .execute("SELECT * FROM download_jobs WHERE id = ?", (job_id,))
+            .fetchone()
+        )
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(
+        self, status: str = None, platform: str = None, limit: int = 50
+    ) -> list:
+        """按优先级/提交顺序列出任务，未完成的排在前面。"""
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if platform:
+            clauses.append("platform = ?")
+            params.append(platform)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = (
+            self.pool.get_connection()
+            .execute(
+                f"SELECT * FROM download_jobs {where} "
+                "ORDER BY status NOT IN ('queued', 'running'), priority, id DESC "
+                "LIMIT ?",
+                (*params, limit),
+            )
+            .fetchall()
+        )
+        return [self._row_to_job(row) for row in rows]
+
+    def depth(self) -> dict:
+        """各平台各状态的任务数，以及各平台的 worker 数。"""
+        rows = (
+            self.pool.get_connection()
+            .execute(
+                "SELECT platform, status, COUNT(*) FROM download_jobs "
+                "GROUP BY platform, status"
+            )
+            .fetchall()
+        )
+        depth = {
+            platform: {"workers": count, "queued": 0, "running": 0}
+            for platform, count in self.workers.items()
+        }
+        for platform, status, count in rows:
+            depth.setdefault(platform, {"workers": 0, "queued": 0, "running": 0})
+            depth[platform][status] = count
+        return depth
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job = dict(row)
+        total = job["progress_total"]
+        job["progress"] = round(job["progress_done"] / total, 4) if total else None
+        return job
+
+    # ------------------------------------------------------------------
+    # worker
+    # ------------------------------------------------------------------
+    def start(self):
+        """在当前事件循环中启动各平台的 worker；上次中断时仍在运行的任务重新排队。"""
+        now = time.time()
+        self.writer.execute(
+            "UPDATE download_jobs SET status = 'queued', next_run_at = ? "
+            "WHERE status = 'running'",
+            (now,),
+        ).result()
+        self.writer.execute(
+            "DELETE FROM download_jobs WHERE status IN ('done', 'failed') "
+            "AND finished_at < ?",
+            (now - self.retention,),
+        )
+        for platform, count in self.workers.items():
+            self._wakeups[platform] = []
+            for index in range(max(0, count)):
+                wakeup = asyncio.Event()
+                self._wakeups[platform].append(wakeup)
+                # 多个 worker 时第一个只接单曲任务，保证单曲不会排在批量任务后面
+                interactive_only = index == 0 and count > 1
+                self._tasks.append(
+                    asyncio.ensure_future(
+                        self._worker(platform, wakeup, interactive_only)
+                    )
+                )
+        print(f"下载任务队列已启动，各平台 worker 数: {self.workers}")
+
+    async def stop(self):
+        """停止 worker；执行中的任务回到 queued，下次启动时继续。"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def close(self):
+        self.writer.close()
+
+    def _wake(self, platform: str):
+        for wakeup in self._wakeups.get(platform, []):
+            wakeup.set()
+
+    async def _worker(self, platform: str, wakeup: asyncio.Event, interactive_only):
+        while True:
+            wakeup.clear()
+            try:
+                job = await asyncio.wrap_future(
+                    self.writer.submit(self._claim, platform, interactive_only)
+                )
+                if job is not None:
+                    await self._run_job(job)
+                    continue
+            except Exception:
+                # 队列数据库出错 (如 database is locked) 时不能让 worker 退出，稍后再试
+                traceback.print_exc()
+                await asyncio.sleep(self.poll_interval)
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim(self, cursor, platform: str, interactive_only: bool):
+        """取出该平台最优先的一个到期任务并标记为 running (在写线程中执行，天然互斥)。"""
+        max_priority = (
+            self.PRIORITY_INTERACTIVE if interactive_only else self.PRIORITY_BULK
+        )
+        now = time.time()
+        row = cursor.execute(
+            "SELECT * FROM download_jobs WHERE platform = ? AND status = 'queued' "
+            "AND next_run_at <= ? AND priority <= ? ORDER BY priority, id LIMIT 1",
+            (platform, now, max_priority),
+        ).fetchone()
+        if row is None:
+            return None
+        cursor.execute(
+            "UPDATE download_jobs SET status = 'running', attempts = attempts + 1, "
+            "started_at = ?, message = NULL WHERE id = ?",
+            (now, row["id"]),
+        )
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    async def _run_job(self, job: dict):
+        job_id = job["id"]
+        handler = self._handlers.get((job["platform"], job["kind"]))
+
+        def progress(done: int, total: int):
+            self.writer.execute(
+                "UPDATE download_jobs SET progress_done = ?, progress_total = ? "
+                "WHERE id = ?",
+                (done, total, job_id),
+            )
+
+        print(
+            f"[下载任务 #{job_id}] 开始 {job['platform']}/{job['kind']} {job['target']} "
+            f"(第 {job['attempts']} 次)"
+        )
+        # 处理函数中发起的下载都计入该任务的指标 (见 core.metrics)
+        token = current_job_id.set(job_id)
+        try:
+            if handler is None:
+                raise RuntimeError(
+                    f"没有 {job['platform']}/{job['kind']} 任务的处理函数"
+                )
+            result = await handler(job["target"], job["level"], progress)
+            error = result.get("error") if isinstance(result, dict) else None
+        except asyncio.CancelledError:
+            self.writer.execute(
+                "UPDATE download_jobs SET status = 'queued' WHERE id = ?", (job_id,)
+            )
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            current_job_id.reset(token)
+        await asyncio.wrap_future(self.writer.submit(self._finish, job, error))
+
+    def _finish(self, cursor, job: dict, error: str):
+        now = time.time()
+        if error is None:
+            cursor.execute(
+                "UPDATE download_jobs SET status = 'done', finished_at = ?, "
+                "progress_done = MAX(progress_done, progress_total) WHERE id = ?",
+                (now, job["id"]),
+            )
+            print(f"[下载任务 #{job['id']}] 完成")
+        elif job["attempts"] < self.max_attempts:
+            delay = self.retry_delay * 2 ** (job["attempts"] - 1)
+            cursor.execute(
+                "UPDATE download_jobs SET status = 'queued', next_run_at = ?, "
+                "message = ? WHERE id = ?",
+                (now + delay, error, job["id"]),
+            )
+            print(f"[下载任务 #{job['id']}] 失败: {error}，{delay:.0f}s 后重试")
+        else:
+            cursor.execute(
+                "UPDATE download_jobs SET status = 'failed', finished_at = ?, "
+                "message = ? WHERE id = ?",
+                (now, error, job["id"]),
+            )
+            print(f"[下载任务 #{job['id']}] 已失败 {job['attempts']} 次，放弃: {error}")
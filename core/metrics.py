@@ -0,0 +1,277 @@
+import contextlib
+import contextvars
+import itertools
+import time
+from collections import OrderedDict, deque
+
+# 当前协程所属的下载任务 ID (由下载任务队列在执行任务时设置，子任务自动继承)
+current_job_id = contextvars.ContextVar("current_job_id", default=None)
+
+
+class StageStats:
+    """某个阶段耗时 (或某个数值) 的累计统计，分位数按最近 window 个样本计算。"""
+
+    def __init__(self, window: int = 512):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def _percentile(self, pct: float) -> float:
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def snapshot(self, digits: int = 3) -> dict:
+        if not self.count:
+            return {"count": 0}
+        values = {
+            "avg": self.total / self.count,
+            "p50": self._percentile(50),
+            "p95": self._percentile(95),
+            "max": self.max,
+        }
+        return {
+            "count": self.count,
+            **{
+                key: round(value, digits) if digits else round(value)
+                for key, value in values.items()
+            },
+        }
+
+
+class DownloadTracker:
+    """
+    单个音频文件下载的实时指标。
+
+    由 DownloadMetrics.start() 创建，stage() 记录各阶段 (transfer / embed / db_insert)
+    的耗时，received() 由下载器在收到数据时调用，finish() 结束并计入汇总。
+    """
+
+    def __init__(self, metrics, download_id, platform, search_key, quality):
+        self.metrics = metrics
+        self.id = download_id
+        self.platform = platform
+        self.search_key = search_key
+        self.quality = quality
+        self.job_id = current_job_id.get()
+        self.started_at = time.time()
+        self.current_stage = "starting"
+        self.stages = {}
+        self.bytes = 0
+        self.total_bytes = None
+        self.resumed_bytes = 0
+        self.ttfb = None
+        self.retries = 0
+        self.reconnects = 0
+        self._started = time.perf_counter()
+        self._transfer_started = None
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        self.current_stage = name
+        start = time.perf_counter()
+        if name == "transfer" and self._transfer_started is None:
+            self._transfer_started = start
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (
+                time.perf_counter() - start
+            )
+
+    def received(self, size: int):
+        if self.ttfb is None and self._transfer_started is not None:
+            self.ttfb = time.perf_counter() - self._transfer_started
+        self.bytes += size
+
+    def bytes_per_sec(self) -> float:
+        if self._transfer_started is None:
+            return 0.0
+        if "transfer" in self.stages and self.current_stage != "transfer":
+            elapsed = self.stages["transfer"]
+        else:
+            elapsed = time.perf_counter() - self._transfer_started
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    def finish(self, ok: bool):
+        self.metrics._finish(self, ok)
+
+    def snapshot(self) -> dict:
+        return {
+            "id": self.id,
+            "platform": self.platform,
+            "search_key": self.search_key,
+            "quality": self.quality,
+            "job_id": self.job_id,
+            "stage": self.current_stage,
+            "bytes": self.bytes,
+            "total_bytes": self.total_bytes,
+            "resumed_bytes": self.resumed_bytes,
+            "bytes_per_sec": round(self.bytes_per_sec()),
+            "ttfb": round(self.ttfb, 3) if self.ttfb is not None else None,
+            "retries": self.retries,
+            "reconnects": self.reconnects,
+            "stages": {name: round(value, 3) for name, value in self.stages.items()},
+            "elapsed": round(time.perf_counter() - self._started, 3),
+        }
+
+
+class DownloadMetrics:
+    """
+    后台下载的吞吐与耗时指标 (进程内)。
+
+    - live: 正在进行的下载及其所处阶段、已下载字节数、实时速度
+    - aggregate: 各阶段 (url_fetch / transfer / embed / db_insert) 耗时、首字节时间、
+      单个下载速度的分布，以及成功/失败/重试次数和总字节数
+    - jobs: 按下载任务队列的任务汇总的字节数、平均速度与各阶段耗时 (最近 MAX_JOBS 个任务)
+
+    url_fetch 只在后台下载/下载任务的链接解析处记录 (timed / measure)，
+    交互式播放请求解析链接不计入。
+    """
+
+    MAX_JOBS = 200
+    RECENT = 50
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.live = {}
+        self.stages = {}
+        self.ttfb = StageStats()
+        self.throughput = StageStats()
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.reconnects = 0
+        self.total_bytes = 0
+        self.jobs = OrderedDict()
+        self.recent = deque(maxlen=self.RECENT)
+
+    def start(self, platform: str, search_key: str, quality: str) -> DownloadTracker:
+        tracker = DownloadTracker(self, next(self._ids), platform, search_key, quality)
+        self.live[tracker.id] = tracker
+        return tracker
+
+    def record_stage(self, stage: str, seconds: float, job_id: int = None):
+        """记录一次阶段耗时，job_id 不为空时同时计入该任务的汇总。"""
+        self.stages.setdefault(stage, StageStats()).add(seconds)
+        if job_id is not None:
+            stages = self._job(job_id)["stages"]
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timed(self, stage: str):
+        """记录代码块的耗时，计入当前协程所属的下载任务 (见 current_job_id)。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start, current_job_id.get())
+
+    async def measure(self, stage: str, awaitable):
+        """await 并以 timed(stage) 记录耗时，便于放进 asyncio.gather。"""
+        with self.timed(stage):
+            return await awaitable
+
+    async def track(self, platform: str, search_key: str, quality: str, download):
+        """为一次下载创建 tracker 并执行 download(tracker)，返回 True 视为成功。"""
+        tracker = self.start(platform, search_key, quality)
+        result = None
+        try:
+            result = await download(tracker)
+            return result
+        finally:
+            tracker.finish(result is True)
+
+    def _finish(self, tracker: DownloadTracker, ok: bool):
+        if self.live.pop(tracker.id, None) is None:
+            return
+        for stage, seconds in tracker.stages.items():
+            self.record_stage(stage, seconds, tracker.job_id)
+        if tracker.ttfb is not None:
+            self.ttfb.add(tracker.ttfb)
+        speed = tracker.bytes_per_sec()
+        if ok and tracker.bytes:
+            self.throughput.add(speed)
+        self.completed += ok
+        self.failed += not ok
+        self.retries += tracker.retries
+        self.reconnects += tracker.reconnects
+        self.total_bytes += tracker.bytes
+
+        if tracker.job_id is not None:
+            job = self._job(tracker.job_id)
+            job["downloads"] += 1
+            job["failed"] += not ok
+            job["bytes"] += tracker.bytes
+            job["retries"] += tracker.retries
+
+        summary = tracker.snapshot()
+        summary["ok"] = ok
+        self.recent.append(summary)
+
+    def _job(self, job_id: int) -> dict:
+        """取出 (不存在时创建) 任务的汇总，并移到最近使用的位置。"""
+        job = self.jobs.pop(job_id, None) or {
+            "downloads": 0,
+            "failed": 0,
+            "bytes": 0,
+            "retries": 0,
+            "stages": {},
+        }
+        self.jobs[job_id] = job
+        while len(self.jobs) > self.MAX_JOBS:
+            self.jobs.popitem(last=False)
+        return job
+
+    @staticmethod
+    def _job_summary(job: dict) -> dict:
+        seconds = job["stages"].get("transfer", 0.0)
+        return {
+            **job,
+            "stages": {
+                stage: round(value, 3) for stage, value in job["stages"].items()
+            },
+            "bytes_per_sec": round(job["bytes"] / seconds) if seconds > 0 else None,
+        }
+
+    def job_summary(self, job_id: int) -> dict:
+        job = self.jobs.get(job_id)
+        live = [t.snapshot() for t in self.live.values() if t.job_id == job_id]
+        if job is None and not live:
+            return None
+        summary = self._job_summary(job) if job else {}
+        summary["live"] = live
+        return summary
+
+    def snapshot(self) -> dict:
+        live = [tracker.snapshot() for tracker in self.live.values()]
+        return {
+            "live": live,
+            "aggregate": {
+                "active": len(live),
+                "active_bytes_per_sec": sum(item["bytes_per_sec"] for item in live),
+                "completed": self.completed,
+                "failed": self.failed,
+                "retries": self.retries,
+                "reconnects": self.reconnects,
+                "total_bytes": self.total_bytes,
+                "stages": {
+                    stage: stats.snapshot() for stage, stats in self.stages.items()
+                },
+                "ttfb": self.ttfb.snapshot(),
+                "bytes_per_sec": self.throughput.snapshot(digits=0),
+            },
+            "jobs": {
+                job_id: self._job_summary(job) for job_id, job in self.jobs.items()
+            },
+            "recent": list(self.recent),
+        }
+
+
+download_metrics = DownloadMetrics()
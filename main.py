@@ -1,19 +1,19 @@
 import asyncio
 import base64
 import hashlib
+import json
 import logging
 import os
 import pathlib
 import re
-import sqlite3
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 from urllib.parse import quote
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import (
-    BackgroundTasks,
     Depends,
     FastAPI,
     HTTPException,
@@ -22,7 +22,7 @@ from fastapi import (
     status,
 )
 from fastapi.concurrency import run_in_threadpool
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from mutagen.flac import FLAC, Picture
 from pydantic import BaseModel
 
@@ -36,9 +36,21 @@ from api.qq import QQMusicAPI
 # 从我们创建的模块中导入所有API类
 from core.config import Config
 
+# 进程内正在下载的音频版本 (去重重复的后台下载)
+from core.downloader import download_registry
+
+# 持久化的后台下载任务队列
+from core.jobs import DownloadJobQueue
+
+# 后台下载的吞吐与耗时指标
+from core.metrics import download_metrics
+
 # qq音乐刷新cookies
 from core.qq_refresh.refresher import QQCookieRefresher
 
+# 本地音乐目录监听
+from scanner import LibraryWatcher, get_scan_directories
+
 # --------------------------------------------------------------------------
 # 初始化应用和所有API客户端
 # --------------------------------------------------------------------------
@@ -63,6 +75,8 @@ logging.getLogger("uvicorn.access").addFilter(EndpointFilter())
 
 # 实例化所有API客户端
 local_api = LocalMusicAPI(Config.DATABASE_FILE)
+# 监听音乐目录，其他工具放进来的文件也能自动入库 (需开启 LIBRARY_WATCH_ENABLED)
+library_watcher = LibraryWatcher(local_api, get_scan_directories())
 netease_api = NeteaseMusicAPI(
     Config.NETEASE_USERS,
     local_api,
@@ -76,6 +90,17 @@ qq_api = QQMusicAPI(
 kuwo_api = KuwoMusicAPI()
 mvsep_api = MVSepAPI(getattr(Config, "MVSEP_API_KEY", ""))
 
+# 歌单/专辑/单曲的后台下载统一进入持久化任务队列，按优先级由各平台的 worker 执行
+job_queue = DownloadJobQueue()
+job_queue.register("netease", "song", netease_api.download_song)
+job_queue.register("netease", "playlist", netease_api.download_playlist_by_id)
+job_queue.register("netease", "album", netease_api.download_album_by_id)
+job_queue.register("qq", "song", qq_api.download_song)
+job_queue.register("qq", "playlist", qq_api.download_playlist_by_id)
+job_queue.register("qq", "album", qq_api.download_album)
+netease_api.job_queue = job_queue
+qq_api.job_queue = job_queue
+
 
 # --------------------------------------------------------------------------
 # API密钥验证 (FastAPI 依赖注入)
@@ -373,9 +398,20 @@ async def handle_playlist_sync(sync_request: PlaylistSyncRequest):
         raise HTTPException(status_code=500, detail=f"同步时发生内部服务器错误: {e}")
 
 
+def _job_accepted_response(job: dict, message: str) -> JSONResponse:
+    """歌单/专辑下载任务入队后的 202 响应，附带任务 ID 供 /api/jobs/{id} 查询进度。"""
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "code": 202,
+            "message": "任务已接受",
+            "data": {"message": message, "job_id": job["id"], "status": job["status"]},
+        },
+    )
+
+
 @app.get("/api/netease", dependencies=[Depends(verify_api_key)])
 async def handle_netease_request(
-    background_tasks: BackgroundTasks,
     id: Optional[str] = None,
     q: Optional[str] = None,
     album: Optional[str] = None,
@@ -384,29 +420,11 @@ async def handle_netease_request(
     level: str = "hires",
 ):
     if playlist_id:
-        background_tasks.add_task(
-            netease_api.start_background_playlist_download, playlist_id, level
-        )
-        return JSONResponse(
-            status_code=status.HTTP_202_ACCEPTED,
-            content={
-                "code": 202,
-                "message": "任务已接受",
-                "data": {"message": f"歌单 {playlist_id} 已加入后台下载队列。"},
-            },
-        )
+        job = await job_queue.enqueue("netease", "playlist", playlist_id, level)
+        return _job_accepted_response(job, f"歌单 {playlist_id} 已加入后台下载队列。")
     elif album_id:
-        background_tasks.add_task(
-            netease_api.start_background_album_download, album_id, level
-        )
-        return JSONResponse(
-            status_code=status.HTTP_202_ACCEPTED,
-            content={
-                "code": 202,
-                "message": "任务已接受",
-                "data": {"message": f"专辑 {album_id} 已加入后台下载队列。"},
-            },
-        )
+        job = await job_queue.enqueue("netease", "album", album_id, level)
+        return _job_accepted_response(job, f"专辑 {album_id} 已加入后台下载队列。")
 
     if id:
         data = await netease_api.get_song_details(id, level)
@@ -426,7 +444,6 @@ async def handle_netease_request(
 
 @app.get("/api/qq", dependencies=[Depends(verify_api_key)])
 async def handle_qq_request(
-    background_tasks: BackgroundTasks,
     mid: Optional[str] = None,
     id: Optional[int] = None,
     q: Optional[str] = None,
@@ -437,36 +454,18 @@ async def handle_qq_request(
     level: str = "master",
 ):
     if playlist_id:
-        background_tasks.add_task(
-            qq_api.start_background_playlist_download, playlist_id, level
-        )
-        return JSONResponse(
-            status_code=status.HTTP_202_ACCEPTED,
-            content={
-                "code": 202,
-                "message": "任务已接受",
-                "data": {"message": f"歌单 {playlist_id} 已加入后台下载队列。"},
-            },
-        )
+        job = await job_queue.enqueue("qq", "playlist", playlist_id, level)
+        return _job_accepted_response(job, f"歌单 {playlist_id} 已加入后台下载队列。")
     elif album_id or album_mid:
         # 合并处理：优先取 album_id 并转为字符串，没有则取 album_mid
         target_album = str(album_id) if album_id else album_mid
-        background_tasks.add_task(
-            qq_api.start_background_album_download, target_album, level
-        )
-        return JSONResponse(
-            status_code=status.HTTP_202_ACCEPTED,
-            content={
-                "code": 202,
-                "message": "任务已接受",
-                "data": {"message": f"专辑 {target_album} 已加入后台下载队列。"},
-            },
-        )
+        job = await job_queue.enqueue("qq", "album", target_album, level)
+        return _job_accepted_response(job, f"专辑 {target_album} 已加入后台下载队列。")
 
     if id or mid:
-        data = await qq_api.get_song_details(song_mid=mid, song_id=id)
+        data = await qq_api.get_song_details(song_mid=mid, song_id=id, level=level)
     elif q:
-        data = await qq_api.search_and_get_details(q, album=album)
+        data = await qq_api.search_and_get_details(q, album=album, level=level)
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -670,6 +669,9 @@ async def get_local_play_info(song_id: int, request: Request):
 
         base_url = f"https://{base_host}"
         cover_url = f"{base_url}/api/local/cover/{song_id}"
+        if song_details.get("cover_hash"):
+            # 带封面哈希的 URL 内容不会变化，可以长期缓存 (换封面后 URL 随之改变)
+            cover_url += f"?v={song_details['cover_hash']}"
 
         # 4. 组合成最终的播放信息
         song_details["url"] = stream_url
@@ -684,17 +686,95 @@ async def get_local_play_info(song_id: int, request: Request):
         raise HTTPException(status_code=500, detail=f"获取播放信息时发生内部错误: {e}")
 
 
+# 本地曲库列表：NDJSON 流式列表每次从数据库读取的行数，以及 JSON 分页允许的最大 limit
+LIST_STREAM_PAGE_SIZE = getattr(Config, "LIST_STREAM_PAGE_SIZE", 500)
+LIST_MAX_PAGE_SIZE = getattr(Config, "LIST_MAX_PAGE_SIZE", 5000)
+
+# 封面缓存策略：允许的缩略图边长、带 ?v=<封面哈希> 的 URL 的缓存时长、缩略图生成线程数
+COVER_THUMBNAIL_SIZES = tuple(getattr(Config, "COVER_THUMBNAIL_SIZES", (64, 300, 800)))
+COVER_CACHE_MAX_AGE = getattr(Config, "COVER_CACHE_MAX_AGE", 30 * 24 * 3600)
+thumbnail_executor = ThreadPoolExecutor(
+    max_workers=getattr(Config, "THUMBNAIL_WORKERS", 2),
+    thread_name_prefix="cover-thumbnail",
+)
+# 正在生成中的缩略图 {(hash, size): Future}，同一张缩略图并发请求只生成一次
+_thumbnail_inflight: Dict[tuple, asyncio.Future] = {}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """按 RFC 9110 的弱比较判断 If-None-Match 是否命中当前 ETag。"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+async def _get_cover_thumbnail(cover_hash: str, size: int) -> Optional[dict]:
+    """在缩略图线程池中懒生成缩略图，并合并同一缩略图的并发请求。"""
+    key = (cover_hash, size)
+    future = _thumbnail_inflight.get(key)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            thumbnail_executor, local_api.get_cover_thumbnail, cover_hash, size
+        )
+        _thumbnail_inflight[key] = future
+        future.add_done_callback(lambda _: _thumbnail_inflight.pop(key, None))
+    # shield: 某个客户端断开不会取消其他请求共享的生成任务
+    return await asyncio.shield(future)
+
+
 @app.get("/api/local/cover/{song_id}")
-async def get_local_cover_art(song_id: int):
+async def get_local_cover_art(
+    song_id: int,
+    request: Request,
+    size: Optional[int] = None,
+    v: Optional[str] = None,
+):
     """
     从数据库中获取并返回歌曲的封面图片。
+    - 使用封面内容哈希作为强 ETag，命中 If-None-Match 时直接返回 304，不读取图片数据
+    - size: 可选的缩略图边长 (见 COVER_THUMBNAIL_SIZES)，首次请求时生成并缓存
+    - v: 封面哈希。与当前封面一致时按 COVER_CACHE_MAX_AGE 长期缓存 (immutable)；
+      只按歌曲 ID 访问时封面可能随重新扫描而变化，使用 no-cache，每次经 ETag 校验
     """
-    cover_info = await run_in_threadpool(local_api.get_cover_art_by_id, song_id=song_id)
+    if size is not None and size not in COVER_THUMBNAIL_SIZES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的缩略图尺寸，可选值: {', '.join(map(str, COVER_THUMBNAIL_SIZES))}",
+        )
+
+    cover_hash = await run_in_threadpool(
+        local_api.get_cover_hash_by_id, song_id=song_id
+    )
+    if not cover_hash:
+        raise HTTPException(status_code=404, detail="未找到此歌曲的封面。")
+
+    etag = f'"{cover_hash}-{size}"' if size else f'"{cover_hash}"'
+    cache_headers = {
+        "ETag": etag,
+        "Cache-Control": (
+            f"public, max-age={COVER_CACHE_MAX_AGE}, immutable"
+            if v == cover_hash
+            else "no-cache"
+        ),
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+    if size:
+        cover_info = await _get_cover_thumbnail(cover_hash, size)
+    else:
+        cover_info = await run_in_threadpool(local_api.get_cover_by_hash, cover_hash)
     if not cover_info or not cover_info["image_data"]:
         raise HTTPException(status_code=404, detail="未找到此歌曲的封面。")
 
     return Response(
-        content=cover_info["image_data"], media_type=cover_info["mime_type"]
+        content=cover_info["image_data"],
+        media_type=cover_info["mime_type"],
+        headers=cache_headers,
     )
 
 
@@ -745,24 +825,69 @@ async def handle_local_download(song_id: int):
 
 
 @app.get("/api/local/list", dependencies=[Depends(verify_api_key)])
-async def list_local_songs():
-    songs_list = await run_in_threadpool(get_all_songs_from_db)
-    return {"code": 200, "data": songs_list}
+async def list_local_songs(
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    q: Optional[str] = None,
+    quality: Optional[str] = None,
+    is_instrumental: Optional[bool] = None,
+    with_instrumental_status: bool = False,
+    format: str = "json",
+):
+    """
+    按 id 倒序列出本地曲库。
+    - after_id / limit: keyset 分页，下一页请传入上一页返回的 next_after_id
+    - q / quality / is_instrumental: 服务端过滤 (q 匹配 search_key 和专辑)
+    - with_instrumental_status: 为每首歌附带 has_instrumental (是否已有伴奏)
+    - format=ndjson: 逐行流式返回 (每行一首歌)，服务端按页读取，不会一次性加载整个曲库
+    """
+    filters = dict(
+        query=q,
+        quality=quality,
+        is_instrumental=is_instrumental,
+        with_instrumental_status=with_instrumental_status,
+    )
 
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_local_songs(after_id, limit, filters),
+            media_type="application/x-ndjson",
+        )
 
-def get_all_songs_from_db():
-    """一个同步的辅助函数，用于被线程池调用。"""
-    conn = sqlite3.connect(Config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, search_key, album, quality, file_path FROM songs ORDER BY id DESC"
+    if limit is not None:
+        limit = max(1, min(limit, LIST_MAX_PAGE_SIZE))
+    songs_list = await run_in_threadpool(
+        local_api.list_songs, after_id=after_id, limit=limit, **filters
+    )
+    next_after_id = (
+        songs_list[-1]["id"] if limit is not None and len(songs_list) == limit else None
     )
-    songs_tuples = cursor.fetchall()
-    conn.close()
-    return [
-        dict(id=s[0], search_key=s[1], album=s[2], quality=s[3], file_path=s[4])
-        for s in songs_tuples
-    ]
+    return {"code": 200, "data": songs_list, "next_after_id": next_after_id}
+
+
+async def _stream_local_songs(after_id: Optional[int], limit: Optional[int], filters):
+    """
+    以 keyset 分页逐页读取曲库并逐行输出 NDJSON。
+    每页都在线程池中单独查询 (每个线程使用自己的连接)，内存占用只与页大小有关。
+    """
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_size = (
+            LIST_STREAM_PAGE_SIZE
+            if remaining is None
+            else min(remaining, LIST_STREAM_PAGE_SIZE)
+        )
+        page = await run_in_threadpool(
+            local_api.list_songs, after_id=after_id, limit=page_size, **filters
+        )
+        if not page:
+            break
+        yield "".join(json.dumps(song, ensure_ascii=False) + "\n" for song in page)
+        after_id = page[-1]["id"]
+        if remaining is not None:
+            remaining -= len(page)
+        if len(page) < page_size:
+            break
 
 
 @app.post("/api/local/delete", dependencies=[Depends(verify_api_key)])
@@ -789,9 +914,9 @@ async def delete_local_songs(request: Request):
 
 def delete_songs_from_db(ids_to_delete: List[int]):
     """一个同步的辅助函数，用于被线程池调用以执行删除。"""
-    conn = sqlite3.connect(Config.DATABASE_FILE)
+    conn = local_api.pool.get_connection()
     cursor = conn.cursor()
-    deleted_count, errors = 0, []
+    deleted_ids, errors = [], []
     try:
         placeholders = ",".join("?" for _ in ids_to_delete)
         cursor.execute(
@@ -803,16 +928,15 @@ def delete_songs_from_db(ids_to_delete: List[int]):
             try:
                 if os.path.exists(file_path):
                     os.remove(file_path)
-                cursor.execute("DELETE FROM songs WHERE id = ?", (song_id,))
-                deleted_count += 1
+                deleted_ids.append(song_id)
             except Exception as e:
                 errors.append(f"删除歌曲 '{search_key}' (ID: {song_id}) 时出错: {e}")
-        conn.commit()
+        # 文件删除成功的记录统一交给写线程在一个事务中删除
+        if deleted_ids:
+            local_api.submit_song_deletion(deleted_ids).result()
     except Exception as e:
-        conn.rollback()
         return {"message": f"数据库操作时发生严重错误: {e}", "errors": [str(e)]}
-    finally:
-        conn.close()
+    deleted_count = len(deleted_ids)
 
     message = f"成功删除了 {deleted_count} 首歌曲。"
     if errors:
@@ -1109,6 +1233,64 @@ async def get_instrumental_queue_status():
     return {"code": 200, "data": instrumental_task_status}
 
 
+@app.get("/api/jobs/queue", dependencies=[Depends(verify_api_key)])
+async def get_job_queue_depth():
+    """各平台下载任务队列的深度 (按状态统计) 与 worker 数"""
+    return {"code": 200, "data": await run_in_threadpool(job_queue.depth)}
+
+
+@app.get("/api/jobs", dependencies=[Depends(verify_api_key)])
+async def list_download_jobs(
+    status: Optional[str] = None, platform: Optional[str] = None, limit: int = 50
+):
+    """列出下载任务及其进度，未完成的任务排在前面"""
+    jobs = await run_in_threadpool(
+        job_queue.list_jobs, status=status, platform=platform, limit=min(limit, 500)
+    )
+    return {"code": 200, "data": jobs}
+
+
+@app.get("/api/jobs/{job_id}", dependencies=[Depends(verify_api_key)])
+async def get_download_job(job_id: int):
+    """查询单个下载任务的状态、重试次数与进度"""
+    job = await run_in_threadpool(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"下载任务 {job_id} 不存在。")
+    job["metrics"] = download_metrics.job_summary(job_id)
+    return {"code": 200, "data": job}
+
+
+@app.get("/api/downloads/metrics", dependencies=[Depends(verify_api_key)])
+async def get_download_metrics():
+    """
+    后台下载指标：进行中的下载 (阶段/字节数/实时速度)、各阶段耗时分布
+    (url_fetch / transfer / embed_metadata / db_insert)、首字节时间、重试次数，
+    以及按下载任务汇总的平均速度
+    """
+    return {"code": 200, "data": download_metrics.snapshot()}
+
+
+@app.get("/api/cache/stats", dependencies=[Depends(verify_api_key)])
+async def get_cache_stats():
+    """查看各内存缓存的容量与命中情况，以及上游请求的合并次数"""
+    return {
+        "code": 200,
+        "data": [
+            netease_api.album_cache.stats(),
+            qq_api.album_cache.stats(),
+            netease_api.unavailable_quality_cache.stats(),
+            netease_api.request_flight.stats(),
+            qq_api.request_flight.stats(),
+            download_registry.stats(),
+        ]
+        + (
+            [netease_api.response_cache.stats()]
+            if netease_api.response_cache is not None
+            else []
+        ),
+    }
+
+
 # --------------------------------------------------------------------------
 # 定时任务
 # --------------------------------------------------------------------------
@@ -1130,6 +1312,26 @@ async def startup_event():
     asyncio.create_task(mvsep_queue_worker())
     print("FastAPI 应用启动，MVSep 伴奏流水线已激活。")
 
+    # 启动下载任务 worker，上次退出时未完成的任务会继续执行
+    job_queue.start()
+
+    if getattr(Config, "LIBRARY_WATCH_ENABLED", False):
+        # 递归注册 inotify 监听需要遍历目录树，放到线程池里执行
+        await run_in_threadpool(library_watcher.start)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await run_in_threadpool(library_watcher.stop)
+    # 执行中的下载任务回到排队状态，下次启动时继续
+    await job_queue.stop()
+    await run_in_threadpool(job_queue.close)
+    # 等写线程把队列中剩余的入库操作提交完再退出
+    await run_in_threadpool(local_api.writer.close)
+    if netease_api.response_cache is not None:
+        await run_in_threadpool(netease_api.response_cache.close)
+    print("数据库写线程已停止。")
+
 
 # --------------------------------------------------------------------------
 # 启动说明
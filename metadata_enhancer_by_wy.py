@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import datetime
 import os
 import sys
@@ -116,17 +117,13 @@ def write_metadata(file_path, data_to_write):
 def enhance_metadata(target_directory, dry_run=False, start_time=None):
     """【带时间过滤器】按需从网易云百科接口补全缺失的元数据。"""
     print("正在初始化网易云API...")
-    try:
-        netease_api = NeteaseMusicAPI(
-            Config.NETEASE_COOKIE_STR,
-            None,
-            Config.MASTER_DIRECTORY,
-            Config.FLAC_DIRECTORY,
-        )
-    except TypeError:
-        netease_api = NeteaseMusicAPI(
-            Config.NETEASE_COOKIE_STR, None, Config.MASTER_DIRECTORY
-        )
+    netease_api = NeteaseMusicAPI(
+        Config.NETEASE_USERS,
+        None,
+        Config.MASTER_DIRECTORY,
+        Config.FLAC_DIRECTORY,
+        getattr(Config, "LOSSY_DIRECTORY", None),
+    )
 
     music_path = Path(target_directory)
     if not music_path.is_dir():
@@ -139,6 +136,8 @@ def enhance_metadata(target_directory, dry_run=False, start_time=None):
 
     total_files, processed_files, updated_files = 0, 0, 0
     details_cache = {}
+    # 网易云客户端的接口都是协程，整个扫描过程复用同一个事件循环 (连接池绑定在循环上)
+    loop = asyncio.new_event_loop()
 
     def find_best_match(local_artist, local_title, results):
         local_artist_norm, local_title_norm = local_artist.lower(), local_title.lower()
@@ -205,7 +204,9 @@ def enhance_metadata(target_directory, dry_run=False, start_time=None):
         netease_details = details_cache.get(search_keyword)
         if netease_details is None:
             print(f"  - 正在搜索: '{search_keyword}'")
-            search_results = netease_api.search_song(search_keyword, limit=5)
+            search_results = loop.run_until_complete(
+                netease_api.search_song(search_keyword, limit=5)
+            )
             if not search_results:
                 print("  - 未在网易云找到任何结果，跳过。")
                 details_cache[search_keyword] = {}
@@ -221,7 +222,10 @@ def enhance_metadata(target_directory, dry_run=False, start_time=None):
 
             song_id = best_match.get("id")
             print(f"  - 找到精确匹配 (ID: {song_id})，正在调用百科接口...")
-            wiki_details = netease_api._get_song_wiki_details(str(song_id))
+            # 百科结果会写入共享的持久化响应缓存，重复运行时不再请求网易云
+            wiki_details = loop.run_until_complete(
+                netease_api._get_song_wiki_details(str(song_id))
+            )
             netease_details = wiki_details
             details_cache[search_keyword] = netease_details
             time.sleep(1.5)
@@ -261,6 +265,9 @@ def enhance_metadata(target_directory, dry_run=False, start_time=None):
         else:
             print("  - 无需补充新的元数据。")
 
+    loop.run_until_complete(netease_api.client.aclose())
+    loop.close()
+
     print(
         f"\n扫描完成！共找到 {total_files} 个音乐文件，处理了 {processed_files} 个符合时间条件的文件，更新了 {updated_files} 个文件。"
     )
@@ -31,10 +31,10 @@ async def get_online_playlist(platform, playlist_id):
     api = None
     if platform == "netease":
         # 实例化API客户端
-        api = NeteaseMusicAPI(Config.NETEASE_COOKIE_STR, None, None, None)
+        api = NeteaseMusicAPI(Config.NETEASE_USERS, None, None, None, None)
         data = await api.get_playlist_info(playlist_id)
     elif platform == "qq":
-        api = QQMusicAPI(None, None, None)
+        api = QQMusicAPI(None, None, None, None)
         data = await api.get_playlist_info(playlist_id)
     else:
         return None, None
@@ -1,7 +1,12 @@
+import argparse
+import multiprocessing
 import os
 import pathlib
 import re
-import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 from mutagen.flac import FLAC, Picture
 from mutagen.id3 import APIC, ID3, TALB, TCON, TDRC, TIT2, TPE1, TYER, USLT
@@ -10,6 +15,7 @@ from mutagen.mp4 import MP4
 from mutagen.wave import WAVE
 from opencc import OpenCC
 
+from api.local import LocalMusicAPI
 from core.config import Config
 
 
@@ -245,84 +251,24 @@ def embed_cloned_metadata_to_file(file_path, cloned_meta):
 
 
 def create_database():
-    """创建包含所有元数据表和字段的数据库 (全新建表版本)。"""
-    conn = sqlite3.connect(Config.DATABASE_FILE)
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA foreign_keys = ON;")
-
-    # --- songs 表 (主表) ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS songs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_path TEXT NOT NULL UNIQUE,
-            search_key TEXT,
-            quality TEXT,
-            duration_ms INTEGER DEFAULT 0,
-            album TEXT,
-            artist TEXT,
-            albumartist TEXT,
-            composer TEXT,
-            lyricist TEXT,
-            arranger TEXT,
-            producer TEXT,
-            mix TEXT,
-            mastering TEXT,
-            bpm TEXT,
-            genre TEXT,
-            tracknumber TEXT,
-            totaltracks TEXT,
-            discnumber TEXT,
-            totaldiscs TEXT,
-            date TEXT,
-            year TEXT,
-            title TEXT,
-            is_instrumental INTEGER DEFAULT 0
-        )
-    """)
-
-    # --- cover_art 表 ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS cover_art (
-            song_id INTEGER PRIMARY KEY,
-            mime_type TEXT NOT NULL,
-            image_data BLOB NOT NULL,
-            FOREIGN KEY (song_id) REFERENCES songs (id) ON DELETE CASCADE
-        )
-    """)
-
-    # --- lyrics 表 ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS lyrics (
-            song_id INTEGER PRIMARY KEY,
-            lyrics TEXT,
-            tlyrics TEXT,
-            FOREIGN KEY (song_id) REFERENCES songs (id) ON DELETE CASCADE
-        )
-    """)
-
-    # --- playlist_mappings 表 ---
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS playlist_mappings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            platform TEXT NOT NULL,
-            online_playlist_id TEXT NOT NULL,
-            navidrome_playlist_id TEXT NOT NULL,
-            playlist_name TEXT,
-            last_sync_time DATETIME,
-            UNIQUE(platform, online_playlist_id)
-        )
-    """)
-
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_search_key ON songs (search_key)")
+    """创建 (或迁移) 包含所有元数据表、索引和全文索引的数据库。
 
-    conn.commit()
-    conn.close()
+    表结构统一由 LocalMusicAPI 维护，保证扫描器与服务端使用完全一致的 schema。
+    """
+    LocalMusicAPI(Config.DATABASE_FILE)
     print(f"数据库 '{Config.DATABASE_FILE}' 初始化成功。")
 
 
-def scan_and_index_music():
-    """扫描音乐文件夹，提取所有元数据并存入数据库。支持伴奏克隆。"""
+MUSIC_EXTENSIONS = {".mp3", ".flac", ".wav", ".m4a"}
+INSTRUMENTAL_PATTERN = re.compile(r"^(.+? - .+?)(?: .+?)? \(Instrumental\)")
+# 每个进程池任务一次解析的文件数
+EXTRACT_CHUNK_SIZE = 8
 
+_converter = None
+
+
+def get_scan_directories() -> list:
+    """按配置返回需要扫描的音乐目录 (去重，保持顺序)。"""
     dirs_to_scan = []
     if hasattr(Config, "MASTER_DIRECTORY") and Config.MASTER_DIRECTORY:
         dirs_to_scan.append(Config.MASTER_DIRECTORY)
@@ -335,225 +281,685 @@ def scan_and_index_music():
     if hasattr(Config, "INSTRUMENTAL_DIRECTORY") and Config.INSTRUMENTAL_DIRECTORY:
         if Config.INSTRUMENTAL_DIRECTORY not in dirs_to_scan:
             dirs_to_scan.append(Config.INSTRUMENTAL_DIRECTORY)
+    return dirs_to_scan
+
+
+def iter_music_files(scan_dir: str):
+    """
+    递归遍历目录，产出 (文件路径, os.stat_result)。
+
+    与原先的 Path.rglob 行为保持一致：不进入指向目录的符号链接，
+    指向文件的符号链接记录其真实路径。scan_dir 需为已解析的绝对路径。
+    """
+    stack = [scan_dir]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError as e:
+            print(f"警告：无法读取目录 '{current}': {e}")
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in MUSIC_EXTENSIONS:
+                    continue
+                if not entry.is_file():
+                    continue
+                file_path = (
+                    os.path.realpath(entry.path) if entry.is_symlink() else entry.path
+                )
+                yield file_path, entry.stat()
+            except OSError:
+                continue
+
+
+def load_library_state(cursor) -> dict:
+    """一次性读出库中所有文件的 {file_path: (id, file_size, mtime)}。"""
+    cursor.execute("SELECT id, file_path, file_size, mtime FROM songs")
+    return {row[1]: (row[0], row[2], row[3]) for row in cursor.fetchall()}
+
+
+def detect_quality(file: pathlib.Path) -> str:
+    """根据文件名标记、扩展名和码率判定音质。"""
+    file_suffix = file.suffix.lower()
+    if file.stem.endswith(" [M]"):
+        return "master"
+    if file_suffix == ".flac":
+        return "flac"
+    if file_suffix == ".mp3":
+        try:
+            bitrate = MP3(file).info.bitrate / 1000
+            return "320" if bitrate > 256 else "128"
+        except:
+            return "128"
+    return "other"
+
+
+def extract_file_metadata(file_path: str) -> dict | None:
+    """
+    解析单个文件的入库元数据 (可在子进程中执行，不访问数据库)。
+
+    返回 {"metadata", "quality", "instrumental_key"}，无法处理时返回 None。
+    instrumental_key 是从伴奏文件名中提取的原曲 search_key，
+    原曲匹配需要查库，由主进程在同批原曲入库后完成。
+    """
+    file = pathlib.Path(file_path)
+    converter = _get_converter()
+
+    # 检查是否符合严格的伴奏命名规范: "歌手 - 歌名 专辑名 (Instrumental).ext"
+    is_instrumental = 0
+    instrumental_key = None
+    if "(Instrumental)" in file.stem:
+        is_instrumental = 1
+        # 正则提取: 捕获前方的 "歌手 - 歌名" 作为 search_key
+        match = INSTRUMENTAL_PATTERN.match(file.stem)
+        if match:
+            instrumental_key = converter.convert(match.group(1))
+
+    metadata = get_comprehensive_metadata(file)
+    if metadata:
+        metadata["is_instrumental"] = is_instrumental
+        if is_instrumental and not metadata.get("title"):
+            metadata["title"] = file.stem
+
+        if not metadata.get("search_key"):
+            original_stem = file.stem
+            search_key_raw = (
+                original_stem.removesuffix(" [M]")
+                if original_stem.endswith(" [M]")
+                else original_stem
+            )
+            metadata["search_key"] = converter.convert(search_key_raw)
+            if not metadata.get("artist") or not metadata.get("title"):
+                try:
+                    parts = search_key_raw.split(" - ", 1)
+                    if len(parts) == 2:
+                        metadata["artist"] = parts[0].strip()
+                        metadata["title"] = parts[1].strip()
+                except:
+                    pass
+    elif not instrumental_key:
+        # 伴奏即使读不出标签，也可以整体克隆原曲的元数据
+        return None
+
+    return {
+        "metadata": metadata,
+        "quality": detect_quality(file),
+        "instrumental_key": instrumental_key,
+    }
+
+
+def extract_metadata_batch(file_paths: list) -> list:
+    """进程池任务: 一次解析多个文件，减少进程间往返次数。"""
+    return [extract_file_metadata(file_path) for file_path in file_paths]
+
+
+def _get_converter():
+    """每个进程懒加载一个 OpenCC 转换器 (转换器对象无法跨进程共享)。"""
+    global _converter
+    if _converter is None:
+        _converter = OpenCC("t2s")
+    return _converter
+
+
+def iter_extracted_metadata(file_paths: list, jobs: int):
+    """
+    并行解析文件元数据，按 file_paths 的顺序产出 (file_path, 解析结果)。
+
+    jobs > 1 时使用进程池 (mutagen 解析与封面拷贝是 CPU 密集的)，
+    同时在途的任务数有上限，避免封面数据在内存中堆积。
+    """
+    if jobs <= 1 or len(file_paths) <= EXTRACT_CHUNK_SIZE:
+        for file_path in file_paths:
+            yield file_path, extract_file_metadata(file_path)
+        return
+
+    chunks = [
+        file_paths[i : i + EXTRACT_CHUNK_SIZE]
+        for i in range(0, len(file_paths), EXTRACT_CHUNK_SIZE)
+    ]
+    # 使用 spawn: 主进程中已有写线程和数据库连接，fork 会把它们的状态一起复制过去
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append((chunk, executor.submit(extract_metadata_batch, chunk)))
+            if len(in_flight) >= jobs * 2:
+                yield from _drain_chunk(*in_flight.popleft())
+        while in_flight:
+            yield from _drain_chunk(*in_flight.popleft())
+
+
+def _drain_chunk(chunk: list, future):
+    try:
+        results = future.result()
+    except Exception as e:
+        print(f"解析进程出错，跳过 {len(chunk)} 个文件: {e}")
+        results = [None] * len(chunk)
+    yield from zip(chunk, results)
+
+
+def clone_instrumental_metadata(
+    local_api: LocalMusicAPI, file_path: str, search_key: str, duration_ms: int
+) -> dict | None:
+    """在库中查找伴奏对应的原曲，克隆其元数据/封面/歌词并写入伴奏文件；找不到时返回 None。"""
+    cursor = local_api.pool.get_connection().cursor()
+    cursor.execute(
+        "SELECT * FROM songs WHERE search_key = ? AND is_instrumental = 0 LIMIT 1",
+        (search_key,),
+    )
+    orig_row = cursor.fetchone()
+    if not orig_row:
+        return None
+
+    columns = [desc[0] for desc in cursor.description]
+    orig_data = dict(zip(columns, orig_row))
+
+    # 构建克隆字典 (时长使用伴奏自己的实际音频时长)
+    metadata = orig_data.copy()
+    metadata["duration_ms"] = duration_ms
+    metadata["title"] = f"{orig_data.get('title', '未知')} (Instrumental)"
+    metadata["is_instrumental"] = 1
+    metadata["cover_data"] = None
+    metadata["cover_mime"] = None
+    metadata["lyrics"] = None
+
+    # 获取并装填原曲封面
+    cursor.execute(
+        "SELECT image_data, mime_type FROM covers WHERE hash = ?",
+        (orig_data.get("cover_hash"),),
+    )
+    cover_row = cursor.fetchone()
+    if cover_row:
+        metadata["cover_data"] = cover_row[0]
+        metadata["cover_mime"] = cover_row[1]
+
+    # 获取并装填原曲歌词
+    cursor.execute(
+        "SELECT lyrics FROM lyrics WHERE song_id = ?",
+        (orig_data["id"],),
+    )
+    lyrics_row = cursor.fetchone()
+    if lyrics_row:
+        metadata["lyrics"] = lyrics_row[0]
+
+    print("  - [成功] 已匹配原曲，正在向伴奏物理写入元数据...")
+    embed_cloned_metadata_to_file(file_path, metadata)
+    return metadata
+
+
+def index_files(local_api: LocalMusicAPI, targets: list, jobs: int = 1) -> tuple:
+    """
+    解析并写入一批文件，返回 (新增数, 更新数)。
+
+    targets 为 [(file_path, song_id)]，song_id 为 None 表示新文件，否则原地更新该记录。
+    流水线: 进程池并行解析元数据 -> 写线程批量入库；
+    伴奏文件推迟到同批的原曲全部入库之后再匹配。
+    """
+    song_ids = dict(targets)
+    pending_writes = []
+    deferred_instrumentals = []
+
+    def submit(file_path, metadata, quality):
+        # 伴奏克隆会改写文件标签，入库前重新读取文件大小和修改时间
+        write_args = (
+            metadata,
+            file_path,
+            quality,
+            metadata.get("lyrics"),
+            None,
+            metadata.get("cover_data"),
+            metadata.get("cover_mime") or "image/jpeg",
+            local_api.stat_file(file_path),
+        )
+        song_id = song_ids.get(file_path)
+        if song_id is not None:
+            future = local_api.submit_song_update(song_id, *write_args)
+        else:
+            future = local_api.submit_song(*write_args)
+        pending_writes.append(
+            (
+                future,
+                song_id is not None,
+                metadata.get("search_key"),
+                metadata.get("is_instrumental", 0),
+            )
+        )
+
+    for file_path, result in iter_extracted_metadata(
+        [file_path for file_path, _ in targets], jobs
+    ):
+        if result is None:
+            print(f"  - 无法读取元数据，跳过: {os.path.basename(file_path)}")
+        elif result["instrumental_key"]:
+            deferred_instrumentals.append((file_path, result))
+        else:
+            submit(file_path, result["metadata"], result["quality"])
+
+    if deferred_instrumentals:
+        # 等本批原曲全部提交后再匹配伴奏
+        local_api.writer.flush()
+        for file_path, result in deferred_instrumentals:
+            search_key = result["instrumental_key"]
+            parsed = result["metadata"]
+            print(
+                f"\n伴奏文件 {os.path.basename(file_path)}，正在寻找原曲匹配: {search_key}"
+            )
+            metadata = clone_instrumental_metadata(
+                local_api,
+                file_path,
+                search_key,
+                parsed.get("duration_ms", 0) if parsed else 0,
+            )
+            if metadata is None:
+                print(
+                    f"  - [警告] 未在数据库找到原曲 '{search_key}'，作为独立文件解析。"
+                )
+                metadata = parsed
+            if metadata is None:
+                print("  - 无法读取元数据，跳过。")
+                continue
+            submit(file_path, metadata, result["quality"])
+
+    # 等待所有写操作提交完成，汇总结果
+    count_new, count_updated = 0, 0
+    for future, is_update, search_key, is_instrumental in pending_writes:
+        try:
+            written = future.result()
+        except Exception as e:
+            print(f"  - [失败] 写入 '{search_key}' 时发生严重错误: {e}")
+            continue
+        if not written:
+            print(f"  - [跳过] '{search_key}' 的记录状态已变化，未写入。")
+        elif is_update:
+            count_updated += 1
+            print(
+                f"  - [更新] 已重新索引 '{search_key}' (伴奏: {bool(is_instrumental)})。"
+            )
+        else:
+            count_new += 1
+            print(
+                f"  - [成功] 已将 '{search_key}' (伴奏: {bool(is_instrumental)}) 完整存入数据库。"
+            )
+    return count_new, count_updated
+
+
+def scan_and_index_music(full: bool = False, prune: bool = None, jobs: int = None):
+    """
+    增量扫描音乐文件夹：只解析新增或发生变化的文件，并清理已被删除文件的记录。支持伴奏克隆。
 
+    full=True 时忽略文件大小/修改时间，强制重新解析所有文件。
+    prune 控制是否删除文件已不存在的记录，默认读取 Config.SCANNER_PRUNE_MISSING。
+    jobs 为解析元数据的进程数，默认读取 Config.SCANNER_JOBS (未配置时为 CPU 核数)。
+    """
+    dirs_to_scan = get_scan_directories()
     if not dirs_to_scan:
         print("错误：未在 core/config.py 中配置任何音乐扫描目录。")
         return
 
-    converter = OpenCC("t2s")
-    conn = sqlite3.connect(Config.DATABASE_FILE)
-    cursor = conn.cursor()
-    total_new_songs = 0
+    if prune is None:
+        prune = getattr(Config, "SCANNER_PRUNE_MISSING", True)
+    if jobs is None:
+        jobs = getattr(Config, "SCANNER_JOBS", None) or os.cpu_count() or 1
+
+    # 读取走当前线程的连接，写入全部提交给写线程批量提交
+    local_api = LocalMusicAPI(Config.DATABASE_FILE)
+    cursor = local_api.pool.get_connection().cursor()
 
+    # 已入库文件的大小/修改时间一次性载入内存，未变化的文件无需再查库或解析
+    library = load_library_state(cursor)
+    print(f"数据库中已有 {len(library)} 条歌曲记录。")
+
+    seen_paths = set()
+    scanned_roots = []
+    targets = []
+    total_unchanged = 0
+
+    # 1. 遍历目录，找出需要解析的新文件和已变化的文件
     for scan_dir in dirs_to_scan:
         if not os.path.exists(scan_dir):
             print(f"警告：目录 '{scan_dir}' 不存在，跳过扫描。")
             continue
 
+        root = str(pathlib.Path(scan_dir).resolve())
+        scanned_roots.append(root)
         print(f"开始扫描目录: {scan_dir}")
-        count_in_dir = 0
-        music_path = pathlib.Path(scan_dir)
-
-        for file in music_path.rglob("*"):
-            file_suffix = file.suffix.lower()
-            if file.is_file() and file_suffix in [".mp3", ".flac", ".wav", ".m4a"]:
-                file_path = str(file.resolve())
 
-                cursor.execute("SELECT id FROM songs WHERE file_path = ?", (file_path,))
-                if cursor.fetchone() is not None:
+        for file_path, file_stat in iter_music_files(root):
+            if file_path in seen_paths:
+                continue
+            seen_paths.add(file_path)
+
+            known = library.get(file_path)
+            if known is not None:
+                song_id, db_size, db_mtime = known
+                if db_size is None and not full:
+                    # 回填旧版数据库中缺失的文件大小/修改时间/inode
+                    local_api.writer.execute(
+                        "UPDATE songs SET file_size = ?, mtime = ?, inode = ? WHERE id = ?",
+                        (
+                            file_stat.st_size,
+                            file_stat.st_mtime,
+                            file_stat.st_ino,
+                            song_id,
+                        ),
+                    )
+                    total_unchanged += 1
                     continue
+                if (
+                    not full
+                    and db_size == file_stat.st_size
+                    and db_mtime == file_stat.st_mtime
+                ):
+                    total_unchanged += 1
+                    continue
+                print(f"  - 待重新索引 (已变化): {os.path.basename(file_path)}")
+                targets.append((file_path, song_id))
+            else:
+                print(f"  - 待索引 (新文件): {os.path.basename(file_path)}")
+                targets.append((file_path, None))
+
+    # 2. 并行解析并批量写入
+    total_new, total_updated = 0, 0
+    if targets:
+        print(f"\n共 {len(targets)} 个文件需要解析，使用 {jobs} 个进程...")
+        total_new, total_updated = index_files(local_api, targets, jobs)
+
+    # 3. 已扫描目录下、本次没有遍历到且确实不存在的文件，视为已被删除
+    missing = [
+        (song_id, file_path)
+        for file_path, (song_id, _, _) in library.items()
+        if file_path not in seen_paths
+        and any(file_path.startswith(root + os.sep) for root in scanned_roots)
+        and not os.path.exists(file_path)
+    ]
+    total_removed = 0
+    if missing:
+        for _, file_path in missing:
+            print(f"  - [丢失] {file_path}")
+        if prune:
+            total_removed = local_api.submit_song_deletion(
+                [song_id for song_id, _ in missing]
+            ).result()
+            print(f"已从数据库中移除 {total_removed} 条文件已不存在的记录。")
+        else:
+            print(f"共 {len(missing)} 条记录的文件已不存在 (未开启清理，保留记录)。")
 
-                print(f"\n正在索引新文件: {file.name}")
+    local_api.writer.close()
+    print(
+        f"\n所有目录扫描完成！新增 {total_new} 首，更新 {total_updated} 首，"
+        f"移除 {total_removed} 首，未变化 {total_unchanged} 首。"
+    )
 
-                # --- 伴奏识别与克隆核心逻辑 ---
-                is_instrumental = 0
-                metadata = None
 
-                # 检查是否符合严格的伴奏命名规范: "歌手 - 歌名 专辑名 (Instrumental).ext"
-                if "(Instrumental)" in file.stem:
-                    is_instrumental = 1
-                    # 正则提取: 捕获前方的 "歌手 - 歌名" 作为 search_key
-                    match = re.match(
-                        r"^(.+? - .+?)(?: .+?)? \(Instrumental\)", file.stem
-                    )
+def sync_paths(local_api: LocalMusicAPI, paths, jobs: int = 1) -> tuple:
+    """
+    只同步指定路径 (文件或目录) 与数据库的差异，返回 (新增数, 更新数, 移除数)。
 
-                    if match:
-                        raw_search_key = match.group(1)
-                        search_key = converter.convert(raw_search_key)
-
-                        print(f"  - 识别为伴奏文件，正在寻找原曲匹配: {search_key}")
-                        # 去数据库寻找原曲
-                        cursor.execute(
-                            "SELECT * FROM songs WHERE search_key = ? AND is_instrumental = 0 LIMIT 1",
-                            (search_key,),
-                        )
-                        orig_row = cursor.fetchone()
-
-                        if orig_row:
-                            columns = [desc[0] for desc in cursor.description]
-                            orig_data = dict(zip(columns, orig_row))
-
-                            # 获取真实的时长 (伴奏自己的实际音频时长)
-                            basic_meta = get_comprehensive_metadata(file)
-                            actual_duration = (
-                                basic_meta.get("duration_ms", 0) if basic_meta else 0
-                            )
-
-                            # 构建克隆字典
-                            metadata = orig_data.copy()
-                            metadata["duration_ms"] = actual_duration
-                            metadata["title"] = (
-                                f"{orig_data.get('title', '未知')} (Instrumental)"
-                            )
-                            metadata["is_instrumental"] = 1
-                            metadata["cover_data"] = None
-                            metadata["cover_mime"] = None
-                            metadata["lyrics"] = None
-
-                            # 获取并装填原曲封面
-                            cursor.execute(
-                                "SELECT image_data, mime_type FROM cover_art WHERE song_id = ?",
-                                (orig_data["id"],),
-                            )
-                            cover_row = cursor.fetchone()
-                            if cover_row:
-                                metadata["cover_data"] = cover_row[0]
-                                metadata["cover_mime"] = cover_row[1]
-
-                            # 获取并装填原曲歌词
-                            cursor.execute(
-                                "SELECT lyrics FROM lyrics WHERE song_id = ?",
-                                (orig_data["id"],),
-                            )
-                            lyrics_row = cursor.fetchone()
-                            if lyrics_row:
-                                metadata["lyrics"] = lyrics_row[0]
-
-                            print("  - [成功] 已匹配原曲，正在向伴奏物理写入元数据...")
-                            embed_cloned_metadata_to_file(file_path, metadata)
-                        else:
-                            print(
-                                f"  - [警告] 未在数据库找到原曲 '{search_key}'，作为独立文件解析。"
-                            )
-
-                # 如果不是伴奏，或者伴奏没匹配到原曲，回退到常规解析
-                if not metadata:
-                    metadata = get_comprehensive_metadata(file)
-                    if metadata:
-                        metadata["is_instrumental"] = is_instrumental
-                        if is_instrumental and not metadata.get("title"):
-                            metadata["title"] = file.stem
-
-                if not metadata:
-                    print("  - 无法读取元数据，跳过。")
-                    continue
+    存在的音乐文件按大小/修改时间判断是否需要 (重新) 索引；
+    已不存在的路径 (包括整个被删除或移走的目录) 对应的记录会被移除。
+    """
+    cursor = local_api.pool.get_connection().cursor()
+    present = {}
+    gone = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for file_path, file_stat in iter_music_files(path):
+                present[file_path] = file_stat
+        elif os.path.isfile(path):
+            if os.path.splitext(path)[1].lower() in MUSIC_EXTENSIONS:
+                present[path] = os.stat(path)
+        else:
+            gone.add(path)
 
-                if not metadata.get("search_key"):
-                    original_stem = file.stem
-                    search_key_raw = (
-                        original_stem.removesuffix(" [M]")
-                        if original_stem.endswith(" [M]")
-                        else original_stem
-                    )
-                    metadata["search_key"] = converter.convert(search_key_raw)
-                    if not metadata.get("artist") or not metadata.get("title"):
-                        try:
-                            parts = search_key_raw.split(" - ", 1)
-                            if len(parts) == 2:
-                                metadata["artist"] = parts[0].strip()
-                                metadata["title"] = parts[1].strip()
-                        except:
-                            pass
-
-                # 音质判定 (新增对伴奏的音质标记)
-                if file.stem.endswith(" [M]"):
-                    quality = "master"
-                elif file_suffix == ".flac":
-                    quality = "flac"
-                elif file_suffix == ".mp3":
-                    try:
-                        bitrate = MP3(file).info.bitrate / 1000
-                        quality = "320" if bitrate > 256 else "128"
-                    except:
-                        quality = "128"
-                else:
-                    quality = "other"
+    targets = []
+    for file_path, file_stat in present.items():
+        cursor.execute(
+            "SELECT id, file_size, mtime FROM songs WHERE file_path = ?", (file_path,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            targets.append((file_path, None))
+        elif row[1] != file_stat.st_size or row[2] != file_stat.st_mtime:
+            targets.append((file_path, row[0]))
+
+    # 删除事件既可能是单个文件，也可能是整个目录
+    stale_ids = []
+    for path in gone:
+        prefix = path + os.sep
+        cursor.execute(
+            "SELECT id, file_path FROM songs WHERE file_path = ? OR substr(file_path, 1, ?) = ?",
+            (path, len(prefix), prefix),
+        )
+        stale_ids.extend(
+            song_id
+            for song_id, file_path in cursor.fetchall()
+            if not os.path.exists(file_path)
+        )
 
-                try:
-                    cursor.execute(
-                        """
-                        INSERT INTO songs (
-                            file_path, search_key, quality, duration_ms, album, artist,
-                            albumartist, composer, lyricist, arranger, producer, mix, mastering,
-                            bpm, genre, tracknumber, totaltracks, discnumber, totaldiscs, date, year,
-                            title, is_instrumental
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        (
-                            file_path,
-                            metadata.get("search_key"),
-                            quality,
-                            metadata.get("duration_ms", 0),
-                            metadata.get("album"),
-                            metadata.get("artist"),
-                            metadata.get("albumartist"),
-                            metadata.get("composer"),
-                            metadata.get("lyricist"),
-                            metadata.get("arranger"),
-                            metadata.get("producer"),
-                            metadata.get("mix"),
-                            metadata.get("mastering"),
-                            metadata.get("bpm"),
-                            metadata.get("genre"),
-                            metadata.get("tracknumber"),
-                            metadata.get("totaltracks"),
-                            metadata.get("discnumber"),
-                            metadata.get("totaldiscs"),
-                            metadata.get("date"),
-                            metadata.get("year"),
-                            metadata.get("title"),
-                            metadata.get("is_instrumental", 0),
-                        ),
-                    )
+    count_new, count_updated = (
+        index_files(local_api, targets, jobs) if targets else (0, 0)
+    )
+    count_removed = 0
+    if stale_ids:
+        count_removed = local_api.submit_song_deletion(stale_ids).result()
+        print(f"  - [移除] {count_removed} 条文件已不存在的记录。")
+    return count_new, count_updated, count_removed
 
-                    song_id = cursor.lastrowid
-
-                    if metadata.get("cover_data"):
-                        cursor.execute(
-                            "INSERT OR IGNORE INTO cover_art (song_id, mime_type, image_data) VALUES (?, ?, ?)",
-                            (
-                                song_id,
-                                metadata.get("cover_mime", "image/jpeg"),
-                                metadata["cover_data"],
-                            ),
-                        )
-
-                    if metadata.get("lyrics"):
-                        cursor.execute(
-                            "INSERT OR IGNORE INTO lyrics (song_id, lyrics) VALUES (?, ?)",
-                            (song_id, metadata["lyrics"]),
-                        )
-
-                    conn.commit()
-                    count_in_dir += 1
-                    total_new_songs += 1
-                    print(
-                        f"  - [成功] 已将 '{metadata.get('search_key')}' (伴奏: {bool(is_instrumental)}) 完整存入数据库。"
-                    )
 
-                except sqlite3.IntegrityError:
-                    print("  - [跳过] 文件路径已存在于数据库中。")
-                    conn.rollback()
-                except Exception as e:
-                    print(f"  - [失败] 写入数据库时发生严重错误: {e}")
-                    conn.rollback()
+class LibraryWatcher:
+    """
+    监听音乐目录的变化，增量地索引、重新索引或移除受影响的文件。
 
-        print(f"目录 '{scan_dir}' 扫描完成，新增 {count_in_dir} 首歌曲。")
+    优先使用 watchdog (Linux 上即 inotify)，未安装时退化为定时轮询目录快照。
+    同一路径的事件会被合并：最后一次事件之后静默 debounce 秒，
+    并且文件大小/修改时间在这段时间内不再变化 (写入已完成)，才会进行处理。
+    """
 
-    conn.close()
-    print(f"\n所有目录扫描完成！本次共新增了 {total_new_songs} 首歌曲。")
+    def __init__(
+        self,
+        local_api: LocalMusicAPI,
+        directories: list,
+        debounce: float = None,
+        poll_interval: float = None,
+        jobs: int = 1,
+    ):
+        self.local_api = local_api
+        self.directories = [
+            str(pathlib.Path(d).resolve()) for d in directories if os.path.isdir(d)
+        ]
+        self.debounce = (
+            debounce
+            if debounce is not None
+            else getattr(Config, "WATCH_DEBOUNCE_SECONDS", 5.0)
+        )
+        self.poll_interval = (
+            poll_interval
+            if poll_interval is not None
+            else getattr(Config, "WATCH_POLL_INTERVAL", 30.0)
+        )
+        self.jobs = jobs
+        # path -> (最后一次事件/变化的时间, 当时观察到的 (size, mtime))
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._observer = None
+
+    # --- 事件来源 ---
+    def notify(self, path: str):
+        """记录一个发生变化的路径 (文件或目录)，处理会被推迟到变化平息之后。"""
+        with self._lock:
+            self._pending[path] = (time.monotonic(), self._observe(path))
+
+    @staticmethod
+    def _observe(path: str):
+        try:
+            st = os.stat(path)
+            return (st.st_size, st.st_mtime)
+        except OSError:
+            return None
 
+    def _start_watchdog(self) -> bool:
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return False
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed_no_write"):
+                    return
+                watcher.notify(event.src_path)
+                dest_path = getattr(event, "dest_path", None)
+                if dest_path:
+                    watcher.notify(dest_path)
+
+        observer = Observer()
+        try:
+            for directory in self.directories:
+                observer.schedule(Handler(), directory, recursive=True)
+            observer.daemon = True
+            observer.start()
+        except OSError as e:
+            # 例如超出 fs.inotify.max_user_watches 限制
+            print(f"[目录监听] 无法启用 inotify ({e})，改用轮询。")
+            return False
+        self._observer = observer
+        return True
+
+    def _poll_loop(self):
+        """无 inotify 时的后备方案: 定时对比目录快照。"""
+        snapshot = self._snapshot()
+        while not self._stop_event.wait(self.poll_interval):
+            current = self._snapshot()
+            for path in current.keys() | snapshot.keys():
+                if current.get(path) != snapshot.get(path):
+                    self.notify(path)
+            snapshot = current
+
+    def _snapshot(self) -> dict:
+        return {
+            file_path: (st.st_size, st.st_mtime)
+            for directory in self.directories
+            for file_path, st in iter_music_files(directory)
+        }
+
+    # --- 处理 ---
+    def _take_ready(self) -> list:
+        """取出已经静默足够久、且大小/修改时间不再变化的路径。"""
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, (last_change, observed) in list(self._pending.items()):
+                if now - last_change < self.debounce:
+                    continue
+                current = self._observe(path)
+                if current != observed:
+                    # 仍在写入，重新计时
+                    self._pending[path] = (now, current)
+                    continue
+                ready.append(path)
+                del self._pending[path]
+        return ready
+
+    def _process_loop(self):
+        while not self._stop_event.wait(min(1.0, self.debounce / 2 or 1.0)):
+            ready = self._take_ready()
+            if not ready:
+                continue
+            try:
+                count_new, count_updated, count_removed = sync_paths(
+                    self.local_api, ready, self.jobs
+                )
+                if count_new or count_updated or count_removed:
+                    print(
+                        f"[目录监听] 新增 {count_new} 首，更新 {count_updated} 首，移除 {count_removed} 首。"
+                    )
+            except Exception as e:
+                print(f"[目录监听] 同步 {len(ready)} 个路径时出错: {e}")
+
+    def start(self):
+        if not self.directories:
+            print("[目录监听] 没有可监听的音乐目录。")
+            return
+        mode = "inotify/watchdog"
+        if not self._start_watchdog():
+            mode = f"轮询 (每 {self.poll_interval:g} 秒)"
+            poller = threading.Thread(
+                target=self._poll_loop, name="library-poller", daemon=True
+            )
+            poller.start()
+            self._threads.append(poller)
+        worker = threading.Thread(
+            target=self._process_loop, name="library-watcher", daemon=True
+        )
+        worker.start()
+        self._threads.append(worker)
+        print(f"[目录监听] 已开始监听 {len(self.directories)} 个目录 ({mode})。")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="扫描音乐目录并增量更新本地曲库数据库")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="忽略文件大小/修改时间，强制重新解析所有文件",
+    )
+    parser.add_argument(
+        "--no-prune",
+        action="store_true",
+        help="保留文件已不存在的歌曲记录 (仅列出，不删除)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="扫描完成后持续监听目录变化 (Ctrl+C 退出)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=None,
+        help="解析元数据的进程数 (默认: Config.SCANNER_JOBS 或 CPU 核数，1 表示不使用进程池)",
+    )
+    args = parser.parse_args()
 
-if __name__ == "__main__":
     create_database()
-    scan_and_index_music()
+    scan_and_index_music(
+        full=args.full, prune=False if args.no_prune else None, jobs=args.jobs
+    )
+
+    if args.watch:
+        local_api = LocalMusicAPI(Config.DATABASE_FILE)
+        watcher = LibraryWatcher(local_api, get_scan_directories())
+        watcher.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("\n正在停止目录监听...")
+        finally:
+            watcher.stop()
+            local_api.writer.close()
+
+
+if __name__ == "__main__":
+    main()
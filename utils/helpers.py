@@ -25,3 +25,51 @@ class Utils:
                 key, value = item.strip().split("=", 1)
                 cookie_dict[key.strip()] = value.strip()
         return cookie_dict
+
+    @staticmethod
+    def pending_qualities(
+        existing_qualities, enable_master: bool, enable_flac: bool, enable_lossy: bool
+    ) -> list:
+        """
+        按严格模式的下载规则，列出本地已有的音质之外还可能需要下载的版本
+        ("master" / "flac" / "lossy"，有损版本只在本地没有任何版本时才需要)。
+
+        与各平台 _background_download_task 的判断保持一致：返回空列表时，
+        无论线上能拿到哪些链接，后台任务都不会下载任何文件。
+        """
+        existing = set(existing_qualities or [])
+        pending = []
+        if enable_master and "master" not in existing:
+            pending.append("master")
+        if enable_flac and "flac" not in existing:
+            pending.append("flac")
+        if enable_lossy and not existing & {"master", "flac", "320", "128"}:
+            pending.append("lossy")
+        return pending
+
+    @staticmethod
+    def has_pending_quality(
+        existing_qualities, enable_master: bool, enable_flac: bool, enable_lossy: bool
+    ) -> bool:
+        """判断本地已有的音质之外是否还可能需要下载新的版本 (见 pending_qualities)。"""
+        return bool(
+            Utils.pending_qualities(
+                existing_qualities, enable_master, enable_flac, enable_lossy
+            )
+        )
+
+    @staticmethod
+    def download_summary(label: str, total: int, skipped: int, failed: int) -> dict:
+        """
+        歌单/专辑下载任务的结果。
+
+        有歌曲下载失败时返回带 "error" 的字典，下载任务队列据此按退避重试
+        (重试时本地已下载完成的歌曲会被跳过)。
+        """
+        completed = total - skipped - failed
+        counts = (
+            f"共 {total} 首：完成 {completed}，本地已有跳过 {skipped}，失败 {failed}。"
+        )
+        if failed:
+            return {"error": f"{label} 有歌曲下载失败，{counts}"}
+        return {"message": f"{label} 下载完成，{counts}"}